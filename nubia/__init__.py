@@ -9,28 +9,33 @@
 
 from .internal import context
 from .internal import exceptions
+from .internal.datasource import CachedCompletionDataSource
 from .internal.deprecation import deprecated
 from .internal.io import eventbus
-from .internal.ui import statusbar
+from .internal.ui import pager, statusbar
 from .internal.nubia import Nubia
 from .internal.options import Options
 from .internal.plugin_interface import PluginInterface, CompletionDataSource
+from .internal.resources import ResourceLimit
 from .internal.typing import argument
 from .internal.typing import command
 
 name = "nubia"
 
 __all__ = [
+    "CachedCompletionDataSource",
     "CompletionDataSource",
     "Nubia",
     "Options",
     "PluginInterface",
+    "ResourceLimit",
     "argument",
     "command",
     "context",
     "deprecated",
     "eventbus",
     "exceptions",
+    "pager",
     "statusbar",
 ]
 
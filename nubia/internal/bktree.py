@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+from typing import Callable, Iterable, List, Optional, Tuple
+
+# names further than this from the typed word are not suggested
+MAX_DISTANCE = 2
+# maximum number of names listed in a "Did you mean" message
+SUGGESTIONS_LIMIT = 5
+
+
+def distance(this: str, that: str) -> int:
+    """
+    The Damerau-Levenshtein distance between two strings: the number of
+    insertions, deletions, substitutions and transpositions of adjacent
+    characters turning one into the other. Unlike its optimal string
+    alignment variant, it satisfies the triangle inequality the BK-tree
+    relies on.
+    """
+    if this == that:
+        return 0
+    if not this or not that:
+        return len(this) + len(that)
+    # Lowrance-Wagner: the matrix has an extra first row and column holding
+    # an upper bound, so that rows[i + 1][j + 1] is the distance between
+    # this[:i] and that[:j]
+    bound = len(this) + len(that)
+    rows = [[bound] * (len(that) + 2)]
+    rows += [[bound] + list(range(len(that) + 1))]
+    rows += [[bound, i] + [0] * len(that) for i in range(1, len(this) + 1)]
+    # character -> last row of `this` it was seen on
+    last_row = {}
+    for i, this_char in enumerate(this, 1):
+        # last column of `that` matching this_char on this row
+        last_match = 0
+        for j, that_char in enumerate(that, 1):
+            match_row = last_row.get(that_char, 0)
+            match_column = last_match
+            cost = 1
+            if this_char == that_char:
+                cost = 0
+                last_match = j
+            rows[i + 1][j + 1] = min(
+                rows[i][j] + cost,
+                rows[i + 1][j] + 1,
+                rows[i][j + 1] + 1,
+                # transposition, with the characters in between deleted or
+                # inserted
+                rows[match_row][match_column]
+                + (i - match_row - 1)
+                + 1
+                + (j - match_column - 1),
+            )
+        last_row[this_char] = i
+    return rows[-1][-1]
+
+
+class BKTree:
+    """
+    A Burkhard-Keller tree of words, finds all the words within a given edit
+    distance of a word without comparing it to every word in the tree. Like
+    `PrefixIndex`, every word can carry a `meta` object.
+    """
+
+    def __init__(self, words: Iterable[Tuple[str, object]] = ()):
+        # every node is a (word, {distance: child node}) pair
+        self._root = None
+        self._meta = {}
+        self.update(words)
+
+    def __len__(self):
+        return len(self._meta)
+
+    def __contains__(self, word):
+        return word in self._meta
+
+    def add(self, word: str, meta=None):
+        if word not in self._meta:
+            self._insert(word)
+        self._meta[word] = meta
+
+    def update(self, words: Iterable[Tuple[str, object]]):
+        for word, meta in words:
+            self.add(word, meta)
+
+    def _insert(self, word):
+        if self._root is None:
+            self._root = (word, {})
+            return
+        node_word, children = self._root
+        while True:
+            d = distance(word, node_word)
+            child = children.get(d)
+            if child is None:
+                children[d] = (word, {})
+                return
+            node_word, children = child
+
+    def meta(self, word):
+        return self._meta.get(word)
+
+    def search(
+        self, word: str, max_distance: int = MAX_DISTANCE
+    ) -> List[Tuple[int, str]]:
+        """Returns the (distance, word) pairs within `max_distance` of `word`"""
+        if self._root is None:
+            return []
+        output = []
+        candidates = [self._root]
+        while candidates:
+            node_word, children = candidates.pop()
+            d = distance(word, node_word)
+            if d <= max_distance:
+                output.append((d, node_word))
+            # by the triangle inequality, only these subtrees can hold matches
+            for child_distance, child in children.items():
+                if d - max_distance <= child_distance <= d + max_distance:
+                    candidates.append(child)
+        output.sort()
+        return output
+
+
+def suggest(
+    trees: Iterable[BKTree],
+    word: str,
+    usage: Optional[Callable[[str], int]] = None,
+    max_distance: int = MAX_DISTANCE,
+    limit: int = SUGGESTIONS_LIMIT,
+) -> List[str]:
+    """
+    Returns the words of `trees` close to `word`, the closest first and, at
+    the same distance, the most used first (according to `usage`). Words
+    carrying a meta string are suggested as that string instead (e.g. an
+    alias suggests the name it stands for).
+    """
+    best = {}
+    for tree in trees:
+        for d, match in tree.search(word, max_distance):
+            name = tree.meta(match) or match
+            if d < best.get(name, max_distance + 1):
+                best[name] = d
+    ranked = sorted(
+        best, key=lambda name: (best[name], -(usage(name) if usage else 0), name)
+    )
+    return ranked[:limit]
+
+
+def did_you_mean(suggestions: List[str]) -> str:
+    """Formats suggestions to be appended to an error message"""
+    if not suggestions:
+        return ""
+    elif len(suggestions) == 1:
+        return f" Did you mean {suggestions[0]}?"
+    else:
+        return f" Did you mean {', '.join(suggestions[:-1])} or {suggestions[-1]}?"
@@ -8,9 +8,12 @@
 #
 
 import asyncio
+import contextlib
 import copy
+import functools
 import inspect
 import sys
+import time
 import traceback
 import typing
 from collections import OrderedDict
@@ -19,9 +22,15 @@ from typing import Iterable
 
 from nubia.internal import parser
 from nubia.internal.completion import AutoCommandCompletion
+from nubia.internal.constants import DEFAULT_FANOUT_ATONCE
+from nubia.internal.datasource import is_data_source
 from nubia.internal.exceptions import CommandParseError
+from nubia.internal.fanout import run_fanout
 from nubia.internal.helpers import function_to_str
+from nubia.internal.io.eventbus import Message, ParseError
+from nubia.internal.metrics import MetricsCollector
 from nubia.internal.typing import FunctionInspection, inspect_object
+from nubia.internal.watchdog import NO_WATCH
 from nubia.internal.typing.argparse import (
     get_arguments_for_command,
     get_arguments_for_inspection,
@@ -29,12 +38,17 @@ from nubia.internal.typing.argparse import (
 )
 from nubia.internal.typing.builder import apply_typing
 from nubia.internal.typing.inspect import is_list_type
-from prompt_toolkit.completion import CompleteEvent, Completion, WordCompleter
+from nubia.internal.bktree import BKTree, did_you_mean, suggest
+from nubia.internal.prefix_index import PrefixCompleter, PrefixIndex
+from prompt_toolkit.completion import CompleteEvent, Completion
 from prompt_toolkit.document import Document
-from termcolor import cprint
+from nubia.internal.io import output
 
 from . import context
 
+# Used by commands that are not attached to a registry
+_DISABLED_METRICS = MetricsCollector(enabled=False)
+
 
 class Command:
     """A Command is the abstraction over one or more commands that will executed
@@ -117,6 +131,25 @@ class Command:
         """
         pass
 
+    def get_resources(self, cmd, args=None):
+        """
+        Returns a dict that maps the name of every shared resource this command
+        uses to the number of units it holds while running. `args` are the
+        arguments of the command, a string in interactive mode and the parsed
+        namespace in CLI mode, if known.
+        """
+        return {}
+
+    def get_source_file(self) -> typing.Optional[str]:
+        """
+        Returns the path of the file defining this command, used to detect
+        when the completion model needs to be regenerated
+        """
+        try:
+            return inspect.getsourcefile(type(self))
+        except TypeError:
+            return None
+
     @property
     def super_command(self) -> bool:
         """
@@ -134,6 +167,7 @@ class Command:
 class AutoCommand(Command):
     def __init__(self, fn):
         self._built_in = False
+        self._command_registry = None
         self._fn = fn
 
         if not callable(fn):
@@ -158,18 +192,77 @@ class AutoCommand(Command):
                 "function or class {} needs to be annotated with "
                 "@command".format(function_to_str(fn))
             )
+        self._validate_fanout(self.metadata)
+        for _, inspection in self.metadata.subcommands:
+            self._validate_fanout(inspection)
+        # dynamic choices and completers, prefetched when completing
+        self._data_sources = [
+            source
+            for inspection in [self.metadata]
+            + [sub for _, sub in self.metadata.subcommands]
+            for arg in inspection.arguments.values()
+            for source in (arg.choices, arg.completer)
+            if hasattr(source, "prefetch")
+        ]
+        # indexes of the argument names, per sub-command (None for the
+        # arguments of the command itself)
+        self._argument_indexes = {
+            None: PrefixIndex(
+                (arg.name, arg) for arg in self.metadata.arguments.values()
+            )
+        }
+        # argument names and aliases (pointing to their names), per
+        # sub-command, used to suggest close names for unknown arguments
+        self._argument_trees = {None: self._arguments_tree(self.metadata)}
+        self._subcommands_tree = BKTree()
         # If this is a super command, we need a completer for sub-commands
         if self.super_command:
-            self._commands_completer = WordCompleter(
-                [], ignore_case=True, sentence=True
-            )
+            subcommands = PrefixIndex()
             for _, inspection in self.metadata.subcommands:
                 _sub_name = inspection.command.name
-                self._commands_completer.words.append(_sub_name)
-                self._commands_completer.meta_dict[_sub_name] = dedent(
-                    inspection.command.help
-                ).strip()
+                subcommands.add(_sub_name, dedent(inspection.command.help).strip())
                 self._subcommand_names.append(_sub_name)
+                self._argument_indexes[_sub_name] = PrefixIndex(
+                    (arg.name, arg) for arg in inspection.arguments.values()
+                )
+                self._argument_trees[_sub_name] = self._arguments_tree(inspection)
+                self._subcommands_tree.add(_sub_name)
+            self._commands_completer = PrefixCompleter(subcommands)
+
+    @staticmethod
+    def _arguments_tree(inspection):
+        tree = BKTree()
+        for arg in inspection.arguments.values():
+            tree.add(arg.name)
+            for alias in arg.extra_names:
+                alias = alias.lstrip("-")
+                if alias not in tree:
+                    tree.add(alias, arg.name)
+        return tree
+
+    def _suggest_arguments(self, names, subcommand=None):
+        trees = [self._argument_trees[None]]
+        if subcommand is not None and subcommand in self._argument_trees:
+            trees.append(self._argument_trees[subcommand])
+        suggestions = []
+        for name in sorted(names):
+            for suggestion in suggest(trees, name):
+                if suggestion not in suggestions:
+                    suggestions.append(suggestion)
+        return did_you_mean(suggestions)
+
+    def _validate_fanout(self, inspection):
+        fanout = inspection.command.fanout
+        if not fanout:
+            return
+        fanout_args = [
+            arg for arg in inspection.arguments.values() if arg.arg == fanout
+        ]
+        if not fanout_args or not is_list_type(fanout_args[0].type):
+            raise ValueError(
+                "Fan-out argument {} of command {} must be a list "
+                "argument".format(fanout, inspection.command.name)
+            )
 
     @property
     def metadata(self) -> FunctionInspection:
@@ -193,10 +286,25 @@ class AutoCommand(Command):
         remaining = {k: v for k, v in key_values.items() if k.replace('-', '_') not in kwargs.keys()}
         return self._fn(**kwargs), remaining
 
+    def _metrics(self):
+        if self._command_registry is None:
+            return _DISABLED_METRICS
+        return self._command_registry.metrics
+
+    def _watch(self, kwargs, raw):
+        watchdog = self._command_registry and self._command_registry.watchdog
+        if not watchdog:
+            return NO_WATCH
+        return watchdog.watch(self.metadata.command.name, kwargs, raw)
+
     def run_interactive(self, cmd, args, raw):
+        metrics = self._metrics()
+        metrics_key = self.metadata.command.name
         try:
             args_metadata = self.metadata.arguments
-            parsed = parser.parse(args, expect_subcommand=self.super_command)
+            with metrics.timer(metrics_key, "parse"):
+                parsed = parser.parse(args, expect_subcommand=self.super_command)
+            bind_start = time.perf_counter()
 
             # prepare args dict
             parsed_dict = parsed.asDict()
@@ -208,18 +316,19 @@ class AutoCommand(Command):
             if self.super_command:
                 subcommand = parsed_dict.get("__subcommand__")
                 if not subcommand:
-                    cprint(
+                    output.error(
                         "A sub-command must be supplied, valid values: "
                         "{}".format(", ".join(self._get_subcommands())),
-                        "red",
                     )
                     return 2
                 sub_inspection = self.subcommand_metadata(subcommand)
                 if not sub_inspection:
-                    cprint(
-                        "Invalid sub-command '{}', valid values: "
-                        "{}".format(subcommand, ", ".join(self._get_subcommands())),
-                        "red",
+                    output.error(
+                        "Invalid sub-command '{}',{} valid values: {}".format(
+                            subcommand,
+                            did_you_mean(suggest([self._subcommands_tree], subcommand)),
+                            ", ".join(self._get_subcommands()),
+                        ),
                     )
                     return 2
                 instance, remaining_args = self._create_subcommand_obj(args_dict)
@@ -229,11 +338,13 @@ class AutoCommand(Command):
                 args_metadata = sub_inspection.arguments
                 attrname = self._find_subcommand_attr(subcommand)
                 command_name = subcommand
+                command_metadata = sub_inspection.command
                 assert attrname is not None
                 fn = getattr(instance, attrname)
             else:
                 # not a super-command, use use the function instead
                 fn = self._fn
+                command_metadata = self.metadata.command
             positionals = parsed_dict["positionals"] if parsed.positionals != "" else []
             # We only allow positionals for arguments that have positional=True
             # ِ We filter out the OrderedDict this way to ensure we don't lose the
@@ -259,7 +370,7 @@ class AutoCommand(Command):
                         len(positionals),
                         ", ".join(str(x) for x in positionals),
                     )
-                cprint(err, "red")
+                output.error(err)
                 return 2
             # constuct key_value dict from positional arguments.
             args_from_positionals = {
@@ -276,26 +387,27 @@ class AutoCommand(Command):
                 set(key_values.keys())
             )
             if duplicate_keys:
-                cprint(
+                output.error(
                     "Arguments '{}' have been passed already, cannot have"
                     " duplicate keys".format(list(duplicate_keys)),
-                    "red",
                 )
                 return 2
 
-            # check for verbosity override in kwargs
-            ctx = context.get_context()
-            old_verbose = ctx.args.verbose
-            if "verbose" in args_dict:
-                ctx.set_verbose(args_dict["verbose"])
-                del args_dict["verbose"]
-                del key_values["verbose"]
+            # check for verbosity override in kwargs, it only applies to this
+            # command (see context.override_verbose)
+            verbose = args_dict.pop("verbose", None)
+            key_values.pop("verbose", None)
 
             # do we have keys that we know nothing about?
             extra_keys = set(args_dict.keys()) - set(args_metadata)
             if extra_keys:
-                cprint(
-                    "Unknown argument(s) {} were" " passed".format(list(extra_keys)),
+                output.error(
+                    "Unknown argument(s) {} were passed.{}".format(
+                        list(extra_keys),
+                        self._suggest_arguments(
+                            extra_keys, command_name if self.super_command else None
+                        ),
+                    ),
                     "magenta",
                 )
                 return 2
@@ -309,13 +421,15 @@ class AutoCommand(Command):
                     if not args_metadata[key].default_value_set:
                         required_missing.append(key)
                 if required_missing:
-                    cprint(
+                    output.error(
                         "Missing required argument(s) {} for command"
                         " {}".format(required_missing, command_name),
                         "yellow",
                     )
                     return 3
 
+            metrics.record(metrics_key, "bind", time.perf_counter() - bind_start)
+            convert_start = time.perf_counter()
             # convert expected types for arguments
             for key, value in args_dict.items():
                 target_type = args_metadata[key].type
@@ -325,7 +439,7 @@ class AutoCommand(Command):
                     new_value = apply_typing(value, target_type)
                 except ValueError:
                     fn_name = function_to_str(target_type, False, False)
-                    cprint(
+                    output.error(
                         'Cannot convert value "{}" to {} on argument {}'.format(
                             value, fn_name, key
                         ),
@@ -338,55 +452,73 @@ class AutoCommand(Command):
             # Validate that arguments with `choices` are supplied with the
             # acceptable values.
             for arg, value in args_dict.items():
-                choices = args_metadata[arg].choices
-                if choices:
-                    # Validate the choices in the case of values and list of
-                    # values.
-                    if is_list_type(args_metadata[arg].type):
-                        bad_inputs = [v for v in value if v not in choices]
-                        if bad_inputs:
-                            cprint(
-                                f"Argument '{arg}' got an unexpected "
-                                f"value(s) '{bad_inputs}'. Expected one "
-                                f"or more of {choices}.",
-                                "red",
-                            )
-                            return 4
-                    elif value not in choices:
-                        cprint(
-                            f"Argument '{arg}' got an unexpected value "
-                            f"'{value}'. Expected one of "
-                            f"{choices}.",
-                            "red",
-                        )
-                        return 4
+                error = self._check_choices(arg, args_metadata[arg], value)
+                if error:
+                    output.error(error)
+                    return 4
 
+            metrics.record(
+                metrics_key, "convert", time.perf_counter() - convert_start
+            )
             # arguments appear to be fine, time to run the function
             try:
                 # convert argument names back to match the function signature
                 args_dict = {args_metadata[k].arg: v for k, v in args_dict.items()}
-                if inspect.iscoroutinefunction(fn):
-                    loop = asyncio.get_event_loop()
-                    ret = loop.run_until_complete(fn(**args_dict))
-                else:
-                    ret = fn(**args_dict)
-                ctx.set_verbose(old_verbose)
+                with metrics.timer(metrics_key, "execute"), self._watch(
+                    args_dict, raw
+                ), context.override_verbose(verbose):
+                    ret = self._execute(fn, args_dict, command_metadata)
             except Exception as e:
-                cprint("Error running command: {}".format(str(e)), "red")
-                cprint("-" * 60, "yellow")
+                output.error("Error running command: {}".format(str(e)))
+                output.error("-" * 60, "yellow")
                 traceback.print_exc(file=sys.stderr)
-                cprint("-" * 60, "yellow")
+                output.error("-" * 60, "yellow")
                 return 1
 
             return ret
 
         except CommandParseError as e:
-            cprint("Error parsing command", "red")
-            cprint(cmd + " " + args, "white", attrs=["bold"])
-            cprint((" " * (e.col + len(cmd))) + "^", "white", attrs=["bold"])
-            cprint(str(e), "yellow")
+            if self._command_registry:
+                self._command_registry.event_bus.publish(ParseError(cmd, raw, str(e)))
+            output.error("Error parsing command")
+            output.cprint(cmd + " " + args, "white", attrs=["bold"])
+            output.cprint((" " * (e.col + len(cmd))) + "^", "white", attrs=["bold"])
+            output.error(str(e), "yellow")
             return 1
 
+    def _check_choices(self, arg, arg_metadata, value):
+        """Returns an error message if `value` is not an accepted choice"""
+        choices = arg_metadata.choices
+        if not choices:
+            return None
+        # Validate the choices in the case of values and list of values.
+        if is_list_type(arg_metadata.type):
+            bad_inputs = [v for v in value if v not in choices]
+            if bad_inputs:
+                return (
+                    f"Argument '{arg}' got an unexpected "
+                    f"value(s) '{bad_inputs}'. Expected one "
+                    f"or more of {choices}."
+                )
+        elif value not in choices:
+            return (
+                f"Argument '{arg}' got an unexpected value "
+                f"'{value}'. Expected one of "
+                f"{choices}."
+            )
+        return None
+
+    def _check_data_source_choices(self, inspection, kwargs):
+        # static choices are validated by argparse in CLI mode
+        for arg_metadata in inspection.arguments.values():
+            if arg_metadata.arg in kwargs and is_data_source(arg_metadata.choices):
+                error = self._check_choices(
+                    arg_metadata.name, arg_metadata, kwargs[arg_metadata.arg]
+                )
+                if error:
+                    return error
+        return None
+
     def _positional_arguments(self, args_metadata, filter_out):
         positionals = OrderedDict()
         for k, v in args_metadata.items():
@@ -422,6 +554,9 @@ class AutoCommand(Command):
         }
 
     def run_cli(self, args):
+        metrics = self._metrics()
+        metrics_key = self.metadata.command.name
+        bind_start = time.perf_counter()
         # if this is a super-command, we need to dispatch the call to the
         # correct function
         kwargs = self._kwargs_for_fn(self._fn, args)
@@ -436,21 +571,89 @@ class AutoCommand(Command):
                 assert attrname is not None
                 fn = getattr(instance, attrname)
                 kwargs = self._kwargs_for_fn(fn, args)
+                inspection = dict(self.metadata.subcommands)[attrname]
             else:
                 fn = self._fn
-            if inspect.iscoroutinefunction(fn):
-                # execute in an event loop
-                loop = asyncio.get_event_loop()
-                return loop.run_until_complete(fn(**kwargs))
-            else:
-                return fn(**kwargs)
+                inspection = self.metadata
+            command_metadata = inspection.command
+            error = self._check_data_source_choices(inspection, kwargs)
+            if error:
+                output.error(error)
+                return 4
+            metrics.record(metrics_key, "bind", time.perf_counter() - bind_start)
+            with metrics.timer(metrics_key, "execute"), self._watch(
+                kwargs, " ".join(sys.argv)
+            ):
+                return self._execute(fn, kwargs, command_metadata)
         except Exception as e:
-            cprint("Error running command: {}".format(str(e)), "red")
-            cprint("-" * 60, "yellow")
+            output.error("Error running command: {}".format(str(e)))
+            output.error("-" * 60, "yellow")
             traceback.print_exc(file=sys.stderr)
-            cprint("-" * 60, "yellow")
+            output.error("-" * 60, "yellow")
             return 1
 
+    def _execute(self, fn, kwargs, command_metadata):
+        """
+        Calls the command function (or coroutine) with the already converted
+        keyword arguments, fanning out over the targets if the command asks
+        for it.
+        """
+        if command_metadata.fanout:
+            # the dispatcher does not acquire the resources of fan-out
+            # commands, they are held by every target
+            resources = self._merged_resources(command_metadata)
+            if kwargs.get(command_metadata.fanout):
+                return self._execute_fanout(fn, kwargs, command_metadata, resources)
+            with self._acquire(resources):
+                return self._call(fn, kwargs)
+        return self._call(fn, kwargs)
+
+    def _call(self, fn, kwargs):
+        if inspect.iscoroutinefunction(fn):
+            # execute in an event loop
+            loop = asyncio.get_event_loop()
+            return loop.run_until_complete(fn(**kwargs))
+        return fn(**kwargs)
+
+    def _acquire(self, resources):
+        if self._command_registry is None or not resources:
+            return contextlib.nullcontext()
+        return self._command_registry.resources.acquire(resources)
+
+    def _execute_fanout(self, fn, kwargs, command_metadata, resources):
+        args = context.get_context().args
+        atonce = getattr(args, "atonce", None) or DEFAULT_FANOUT_ATONCE
+        # Stragglers are cut off once the command timeout expires
+        deadline = getattr(args, "command_timeout", None)
+
+        def on_progress(completed, total):
+            if self._command_registry:
+                self._command_registry.dispatch_message(
+                    Message.FANOUT_PROGRESS, command_metadata.name, completed, total
+                )
+
+        result = run_fanout(
+            fn,
+            kwargs,
+            command_metadata.fanout,
+            atonce=atonce,
+            deadline=deadline,
+            on_progress=on_progress,
+            acquire=functools.partial(self._acquire, resources) if resources else None,
+        )
+        for target, error in result.errors.items():
+            output.cprint("{}: {}".format(target, error), "red")
+        for target in result.timed_out:
+            output.cprint("{}: timed out after {}s".format(target, deadline), "yellow")
+        output.cprint(result.summary(), "green" if result.return_code == 0 else "red")
+        return result.return_code
+
+    def get_source_file(self):
+        try:
+            return inspect.getsourcefile(self._fn)
+        except TypeError:
+            return None
+
     @property
     def super_command(self):
         return self._is_super_command
@@ -459,6 +662,18 @@ class AutoCommand(Command):
         assert self.super_command
         return subcommand.lower() in self._subcommand_names
 
+    def arguments_with_prefix(self, prefix, subcommand=None):
+        """
+        Returns the arguments of the command (and of `subcommand`) whose name
+        starts with `prefix`
+        """
+        indexes = [self._argument_indexes[None]]
+        if subcommand is not None and subcommand in self._argument_indexes:
+            indexes.append(self._argument_indexes[subcommand])
+        return [
+            index.meta(name) for index in indexes for name in index.with_prefix(prefix)
+        ]
+
     def add_arguments(self, parser):
         register_command(parser, self.metadata)
 
@@ -469,6 +684,10 @@ class AutoCommand(Command):
     def get_completions(
         self, _: str, document: Document, complete_event: CompleteEvent
     ) -> Iterable[Completion]:
+        # the command name is typed, start fetching the values that its
+        # arguments will need
+        for source in self._data_sources:
+            source.prefetch()
         if self._is_super_command:
             exploded = document.text.lstrip().split(" ", 1)
             # Are we at the first word? we expect a sub-command here
@@ -483,3 +702,35 @@ class AutoCommand(Command):
     def get_help(self, cmd, *args):
         help = self.metadata.command.help
         return dedent(help).strip() if help else None
+
+    def get_resources(self, cmd, args=None):
+        subcommand = self._subcommand_from_args(args)
+        if (subcommand or self.metadata.command).fanout:
+            # acquired for every target instead, see _execute
+            return {}
+        return self._merged_resources(subcommand)
+
+    def _subcommand_from_args(self, args):
+        """The metadata of the sub-command `args` runs, None if there is none"""
+        if not self.super_command or args is None:
+            return None
+        if isinstance(args, str):
+            # in interactive mode, the sub-command is the first word
+            words = args.split(None, 1)
+            name = words[0].lower() if words else None
+        else:
+            name = getattr(args, "_subcmd", None)
+        attrname = name and self._find_subcommand_attr(name)
+        if attrname is None:
+            return None
+        return dict(self.metadata.subcommands)[attrname].command
+
+    def _merged_resources(self, command_metadata=None):
+        """
+        The resources of the command, and those of the sub-command it runs
+        which take precedence
+        """
+        resources = dict(self.metadata.command.resources)
+        if command_metadata is not None:
+            resources.update(command_metadata.resources)
+        return resources
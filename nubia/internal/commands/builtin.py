@@ -10,7 +10,11 @@
 from nubia.internal import context
 from nubia.internal.cmdbase import Command
 from nubia.internal.interactive import IOLoop
+from nubia.internal.io.connect import connection, dependency_names
 from nubia.internal.io.eventbus import Message
+from nubia.internal.metrics import PERCENTILES, PHASE_TOTAL
+from prettytable import PrettyTable
+from nubia.internal.io import output
 
 
 class Connect(Command):
@@ -80,7 +84,200 @@ class Verbose(Command):
         if args:
             ctx.set_verbose(args)
         else:
-            print("Current verbosity: {}".format(ctx.args.verbose))
+            output.print("Current verbosity: {}".format(ctx.args.verbose))
+
+    def get_command_names(self):
+        return [self.CMD]
+
+    def get_help(self, cmd, *args):
+        return self.HELP
+
+
+class DumpLog(Command):
+    """
+    Writes the logs buffered in memory to the log file
+    """
+
+    HELP = (
+        "Writes the logs kept in memory since the last dump to the log file "
+        "and prints its path"
+    )
+    CMD = ":dump-log"
+
+    def __init__(self):
+        super(DumpLog, self).__init__()
+        self._built_in = True
+
+    def run_interactive(self, cmd, args, raw):
+        log_buffer = self._command_registry.log_buffer
+        if log_buffer is None:
+            output.cprint(
+                "Logs are not kept in memory, enable it with "
+                'Options(log_mode="buffer")',
+                "yellow",
+            )
+            return 1
+        try:
+            path = log_buffer.dump()
+        except OSError as e:
+            output.error("Failed to write the logs: {}".format(e))
+            return 1
+        if path is None:
+            output.print("No logs to write")
+        else:
+            output.print("Logs written to {}".format(path))
+        return 0
+
+    def get_command_names(self):
+        return [self.CMD]
+
+    def get_help(self, cmd, *args):
+        return self.HELP
+
+
+class Stats(Command):
+    """
+    Prints the latency metrics collected for the commands
+    """
+
+    HELP = (
+        "Prints latency statistics of the commands, accepts json or "
+        "prometheus to change the output format, or reset to clear them"
+    )
+    CMD = ":stats"
+
+    def __init__(self):
+        super(Stats, self).__init__()
+        self._built_in = True
+
+    def run_interactive(self, cmd, args, raw):
+        metrics = self._command_registry.metrics
+        if not metrics.enabled:
+            output.cprint(
+                "Metrics are disabled, enable them with Options(metrics=True)",
+                "yellow",
+            )
+            return 1
+        mode = (args or "").strip().lower()
+        if mode == "reset":
+            metrics.reset()
+        elif mode == "json":
+            output.print(metrics.to_json())
+        elif mode == "prometheus":
+            output.print(metrics.to_prometheus())
+        elif mode:
+            output.error("Unknown option '{}'".format(mode))
+            return 1
+        else:
+            self._print_table(metrics.to_dict())
+        return 0
+
+    def _print_table(self, data):
+        percentiles = ["p{}".format(p) for p in PERCENTILES]
+        table = PrettyTable(
+            ["Command", "Phase", "Count", "Errors"]
+            + ["{} (ms)".format(p) for p in percentiles + ["max"]]
+        )
+        table.align = "r"
+        table.align["Command"] = table.align["Phase"] = "l"
+        for cmd_name in sorted(data):
+            cmd_metrics = data[cmd_name]
+            for phase, histogram in cmd_metrics["phases"].items():
+                errors = cmd_metrics["errors"] if phase == PHASE_TOTAL else ""
+                table.add_row(
+                    [cmd_name, phase, histogram["count"], errors]
+                    + [
+                        "{:.3f}".format(histogram[p] * 1000)
+                        for p in percentiles + ["max"]
+                    ]
+                )
+        output.print(table)
+
+    def get_command_names(self):
+        return [self.CMD]
+
+    def get_help(self, cmd, *args):
+        return self.HELP
+
+
+class Perf(Command):
+    """
+    Prints the latency of the interactive shell's UI hooks and of the
+    listeners' initialization
+    """
+
+    HELP = (
+        "Prints the latency of the completion, lexing, status bar and prompt "
+        "rendering per command being typed (`:perf ui`), `:perf ui reset` "
+        "clears them. `:perf startup` prints how long the listeners took to "
+        "connect"
+    )
+    CMD = ":perf"
+
+    def __init__(self):
+        super(Perf, self).__init__()
+        self._built_in = True
+
+    def run_interactive(self, cmd, args, raw):
+        words = (args or "").lower().split()
+        if words == ["startup"]:
+            self._print_startup()
+            return 0
+        if not words or words[0] != "ui" or len(words) > 2:
+            output.error("Usage: {} ui [reset] | startup".format(self.CMD))
+            return 1
+        monitor = self._command_registry.ui_monitor
+        if monitor is None:
+            output.cprint(
+                "UI latency metrics are disabled, enable them with "
+                "Options(ui_latency_metrics=True)",
+                "yellow",
+            )
+            return 1
+        if len(words) == 2:
+            if words[1] != "reset":
+                output.error("Unknown option '{}'".format(words[1]))
+                return 1
+            monitor.reset()
+            return 0
+        self._print_table(monitor.to_dict(), monitor.budget)
+        return 0
+
+    def _print_table(self, data, budget):
+        percentiles = ["p{}".format(p) for p in PERCENTILES]
+        table = PrettyTable(
+            ["Hook", "Command", "Count", "Over {:g}ms".format(budget * 1000)]
+            + ["{} (ms)".format(p) for p in percentiles + ["max"]]
+        )
+        table.align = "r"
+        table.align["Hook"] = table.align["Command"] = "l"
+        for hook, commands in data.items():
+            for command_name, stats in commands.items():
+                table.add_row(
+                    [hook, command_name or "-", stats["count"], stats["over_budget"]]
+                    + [
+                        "{:.3f}".format(stats[p] * 1000)
+                        for p in percentiles + ["max"]
+                    ]
+                )
+        output.print(table)
+
+    def _print_startup(self):
+        table = PrettyTable(["Listener", "Depends on", "Status", "Connect (ms)"])
+        table.align = "l"
+        table.align["Connect (ms)"] = "r"
+        for listener in self._command_registry.listeners:
+            state = connection(listener)
+            duration = state.duration
+            table.add_row(
+                [
+                    listener.listener_name,
+                    ", ".join(dependency_names(listener)) or "-",
+                    state.status,
+                    "-" if duration is None else "{:.3f}".format(duration * 1000),
+                ]
+            )
+        output.print(table)
 
     def get_command_names(self):
         return [self.CMD]
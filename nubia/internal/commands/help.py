@@ -10,12 +10,25 @@
 from nubia.internal import context
 from nubia.internal.cmdbase import Command
 from nubia.internal.exceptions import UnknownCommand, CommandError
-from prettytable import PrettyTable
-from termcolor import cprint, colored
+from nubia.internal.io import output
+from nubia.internal.ui.pager import page
+from termcolor import colored
+
+
+def _rows(entries):
+    """Renders the name and the summary of every entry, one per line"""
+    width = max((len(entry.name) for entry in entries), default=0)
+    for entry in entries:
+        name = colored(entry.name.ljust(width), "magenta")
+        yield "  {}  {}".format(name, entry.summary)
 
 
 class HelpCommand(Command):
-    HELP = "Prints help about all the commands"
+    HELP = (
+        "Prints help about all the commands, `help <command>` about one of "
+        "them, `help <prefix>*` about those starting with prefix and "
+        "`help --search <terms>` about those matching the terms"
+    )
     cmds = {"help": HELP, "?": HELP}
 
     def __init__(self):
@@ -32,43 +45,57 @@ class HelpCommand(Command):
         )
 
     def run_interactive(self, _0, args, _2):
-        if args:
-            args = args.split()
-            try:
-                cmd_instance = self.registry.find_command(args[0])
-                if not cmd_instance:
+        args = (args or "").split()
+        index = self.registry.help_index
+        try:
+            if not args:
+                page(self._render_all(index.entries()))
+                return 0
+            if args[0] == "--search":
+                return self._search(index, " ".join(args[1:]))
+            if args[0].endswith("*"):
+                prefix = args[0][:-1]
+                entries = index.entries(prefix)
+                if not entries:
                     raise UnknownCommand(
-                        "Command `{}` is " "unknown".format(args[0])
+                        "No command starts with `{}`.{}".format(
+                            prefix, self.registry.find_approx(prefix)
+                        )
                     )
-                else:
-                    help_msg = cmd_instance.get_help(args[0].lower(), *args)
-                print(help_msg)
-            except CommandError as e:
-                cprint(str(e), "red")
-                return 1
-        else:
-            built_ins = PrettyTable(["Command", "Description"])
-            built_ins.align = "l"
-            t = PrettyTable(["Command", "Description"])
-            t.align = "l"
-
-            commands = {
-                cmd_name: cmd
-                for cmd in self.registry.get_all_commands()
-                for cmd_name in cmd.get_command_names()
-            }
-
-            for cmd_name in sorted(commands):
-                cmd = commands[cmd_name]
-                table = built_ins if cmd.built_in else t
-                cmd_help = cmd.get_help(cmd_name)
-                table.add_row([colored(cmd_name, "magenta"), cmd_help])
+                page(self._render_all(entries))
+                return 0
+            cmd_instance = self.registry.find_command(args[0])
+            if not cmd_instance:
+                raise UnknownCommand(
+                    "Command `{}` is unknown.{}".format(
+                        args[0], self.registry.find_approx(args[0])
+                    )
+                )
+            output.print(cmd_instance.get_help(args[0].lower(), *args))
+            return 0
+        except CommandError as e:
+            output.error(str(e))
+            return 1
 
-            print(t)
+    def _search(self, index, terms):
+        if not terms.strip():
+            raise CommandError("Usage: help --search <terms>")
+        results = index.search(terms)
+        if not results:
+            output.cprint("No command matches `{}`".format(terms), "yellow")
+            return 1
+        page(_rows([entry for entry, _ in results]))
+        return 0
 
-            cprint("Built-in Commands", "yellow")
-            print(built_ins)
-            return 0
+    def _render_all(self, entries):
+        commands = [entry for entry in entries if not entry.built_in]
+        built_ins = [entry for entry in entries if entry.built_in]
+        yield from _rows(commands)
+        if built_ins:
+            if commands:
+                yield ""
+            yield colored("Built-in Commands", "yellow")
+            yield from _rows(built_ins)
 
     def get_command_names(self):
         return self.cmds.keys()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+import cProfile
+import pstats
+import sys
+import time
+import tracemalloc
+from functools import partial
+
+from nubia.internal.cmdbase import Command
+from nubia.internal.exceptions import CommandError
+from prettytable import PrettyTable
+from nubia.internal.io import output
+
+try:
+    import resource
+except ImportError:  # resource is only available on Unix
+    resource = None
+
+
+DEFAULT_TOP_FUNCTIONS = 25
+
+
+def split_options(args, allowed):
+    """
+    Splits the leading `--key=value` options from the wrapped command line,
+    e.g. `--top=10 my-command arg=1` => ({'top': '10'}, 'my-command arg=1')
+    """
+    options = {}
+    rest = (args or "").strip()
+    while rest.startswith("--"):
+        token, _, rest = rest.partition(" ")
+        key, _, value = token[2:].partition("=")
+        if key not in allowed:
+            raise CommandError(
+                "Unknown option --{}, valid options: {}".format(
+                    key, ", ".join("--" + a for a in allowed)
+                )
+            )
+        options[key] = value
+        rest = rest.lstrip()
+    if not rest:
+        raise CommandError("A command to run must be supplied")
+    return options, rest
+
+
+class WrapperCommand(Command):
+    """
+    Base class for built-ins that run another command line and report about
+    its execution
+    """
+
+    OPTIONS = []
+
+    def __init__(self):
+        super(WrapperCommand, self).__init__()
+        self._built_in = True
+
+    def run_interactive(self, cmd, args, raw):
+        try:
+            options, line = split_options(args, self.OPTIONS)
+            wrapped_cmd, _, wrapped_args = line.partition(" ")
+            cmd_instance = self._command_registry.find_command(wrapped_cmd)
+            if not cmd_instance:
+                raise CommandError(
+                    "Unknown Command '{}',{}".format(
+                        wrapped_cmd, self._command_registry.find_approx(wrapped_cmd)
+                    )
+                )
+            run = partial(
+                self._run_command, cmd_instance, wrapped_cmd, wrapped_args, line
+            )
+            return self.run_wrapped(options, run)
+        except CommandError as e:
+            output.error(str(e))
+            return 2
+
+    def _run_command(self, cmd_instance, cmd, args, raw):
+        # run like any other command: blacklist, resources, metrics, usage
+        # logging and lifecycle events
+        io_loop = self._command_registry.io_loop
+        if io_loop is None:
+            raise CommandError(
+                "{} is only available in the interactive shell".format(self.CMD)
+            )
+        return io_loop.evaluate_command(cmd, args, raw)
+
+    def run_wrapped(self, options, run):
+        raise NotImplementedError("run_wrapped must be overridden")
+
+    def get_command_names(self):
+        return [self.CMD]
+
+    def get_help(self, cmd, *args):
+        return self.HELP
+
+
+class Profile(WrapperCommand):
+    HELP = (
+        "Runs a command under cProfile and prints the top functions by "
+        "cumulative time. Usage: :profile [--top=N] [--sort=KEY] "
+        "[--save=FILE.pstats] <command line>"
+    )
+    CMD = ":profile"
+    OPTIONS = ["top", "sort", "save"]
+
+    def run_wrapped(self, options, run):
+        try:
+            top = int(options.get("top") or DEFAULT_TOP_FUNCTIONS)
+        except ValueError:
+            raise CommandError("--top expects an integer")
+        sort = options.get("sort") or "cumulative"
+        # checked before running the command, pstats only does it afterwards
+        if sort not in pstats.Stats().get_sort_arg_defs():
+            raise CommandError(
+                "Unknown sort key '{}', valid keys: {}".format(
+                    sort, ", ".join(sorted(pstats.Stats.sort_arg_dict_default))
+                )
+            )
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            ret = run()
+        finally:
+            profiler.disable()
+        # Make sure the output of the command is not mixed with the report
+        output.flush()
+        sys.stdout.flush()
+        stats = pstats.Stats(profiler, stream=sys.stdout)
+        stats.sort_stats(sort).print_stats(top)
+        if options.get("save"):
+            stats.dump_stats(options["save"])
+            output.cprint("Profile saved to {}".format(options["save"]), "green")
+        return ret
+
+
+class Time(WrapperCommand):
+    HELP = (
+        "Runs a command and reports its wall time, CPU time, resource usage "
+        "and peak memory allocations. Usage: :time <command line>"
+    )
+    CMD = ":time"
+
+    def run_wrapped(self, options, run):
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start()
+        elif hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        usage_before = None
+        if resource:
+            usage_before = resource.getrusage(resource.RUSAGE_SELF)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            ret = run()
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            usage_after = None
+            if resource:
+                usage_after = resource.getrusage(resource.RUSAGE_SELF)
+            _, peak = tracemalloc.get_traced_memory()
+            if not was_tracing:
+                tracemalloc.stop()
+
+        table = PrettyTable(["Measure", "Value"])
+        table.align = "l"
+        table.add_row(["wall time", "{:.6f}s".format(wall)])
+        table.add_row(["cpu time", "{:.6f}s".format(cpu)])
+        if usage_before and usage_after:
+            for row in self._rusage_rows(usage_before, usage_after):
+                table.add_row(row)
+        table.add_row(["peak traced memory", "{:.1f} KiB".format(peak / 1024)])
+        sys.stdout.flush()
+        output.print(table)
+        return ret
+
+    def _rusage_rows(self, before, after):
+        def delta(field):
+            return getattr(after, field) - getattr(before, field)
+
+        # ru_maxrss is in bytes on macOS and in kilobytes everywhere else
+        maxrss_kib = after.ru_maxrss
+        if sys.platform == "darwin":
+            maxrss_kib /= 1024
+        return [
+            ["user time", "{:.6f}s".format(delta("ru_utime"))],
+            ["system time", "{:.6f}s".format(delta("ru_stime"))],
+            ["max rss", "{:.0f} KiB".format(maxrss_kib)],
+            ["minor page faults", delta("ru_minflt")],
+            ["major page faults", delta("ru_majflt")],
+            ["block input ops", delta("ru_inblock")],
+            ["block output ops", delta("ru_oublock")],
+            ["voluntary ctx switches", delta("ru_nvcsw")],
+            ["involuntary ctx switches", delta("ru_nivcsw")],
+        ]
@@ -10,6 +10,7 @@
 import logging
 import itertools
 import pyparsing as pp
+from nubia.internal.datasource import is_data_source
 from nubia.internal.helpers import function_to_str
 
 from typing import Iterable, TYPE_CHECKING
@@ -165,6 +166,7 @@ class AutoCommandCompletion:
     ) -> Iterable[Completion]:
         assert parsed_command is not None
         args_meta = self.meta.arguments.values()
+        subcommand = None
         # are we expecting a sub command?
         if self.cmd.super_command:
             # We have a sub-command (supposedly)
@@ -179,7 +181,9 @@ class AutoCommandCompletion:
             # sub-command together
             args_meta = itertools.chain(args_meta, sub_meta.arguments.values())
         # Now let's see if we can figure which argument we are talking about
-        args_meta = self._filter_arguments_by_prefix(last_token, args_meta)
+        args_meta = self._filter_arguments_by_prefix(
+            last_token, args_meta, subcommand
+        )
         # Which arguments did we fully parse already? let's avoid printing them
         # in completions
         parsed_keys = parsed_command.asDict().get("kv", [])
@@ -199,7 +203,10 @@ class AutoCommandCompletion:
         elif parsed_token.is_argument:
             argument_name = parsed_token.argument_name
             arg = self._find_argument_by_name(argument_name)
-            if not arg or arg.choices in [False, None]:
+            if not arg:
+                return []
+            source = arg.completer or arg.choices
+            if source in [False, None]:
                 return []
             # TODO: Support dictionary keys/named tuples completion
             if parsed_token.is_dict:
@@ -211,10 +218,9 @@ class AutoCommandCompletion:
                     text=str(choice),
                     start_position=-len(parsed_token.last_value),
                 )
-                for choice in arg.choices
-                if str(choice)
-                .lower()
-                .startswith(parsed_token.last_value.lower())
+                for choice in self._values_with_prefix(
+                    source, parsed_token.last_value
+                )
             ]
         # We are completing arguments, or positionals.
         # TODO: We would like to only show positional choices if we exhaust all
@@ -232,15 +238,18 @@ class AutoCommandCompletion:
         ]
         return ret
 
-    def _filter_arguments_by_prefix(self, prefix: str, arguments=None):
-        arguments = arguments or self.meta.arguments.values()
+    def _values_with_prefix(self, source, prefix):
+        if is_data_source(source):
+            return source.get_completions(prefix)
+        prefix = prefix.lower()
+        return [v for v in source if str(v).lower().startswith(prefix)]
+
+    def _filter_arguments_by_prefix(
+        self, prefix: str, arguments=None, subcommand=None
+    ):
         if prefix:
-            return [
-                arg_meta
-                for arg_meta in arguments
-                if arg_meta.name.startswith(prefix)
-            ]
-        return arguments
+            return self.cmd.arguments_with_prefix(prefix, subcommand)
+        return arguments or self.meta.arguments.values()
 
     def _prepare_value_completions(self, prefix, partial_result):
         parsed_keys = map(lambda x: x[0], partial_result.get("kv", []))
@@ -10,3 +10,4 @@
 
 DEFAULT_CLIENT_TIMEOUT = 240
 DEFAULT_COMMAND_TIMEOUT = 120
+DEFAULT_FANOUT_ATONCE = 10
@@ -7,70 +7,137 @@
 # LICENSE file in the root directory of this source tree.
 #
 
-import copy
+import argparse
+import contextlib
+import contextvars
 import sys
 import os
 import getpass
+from collections import namedtuple
 
-from nubia.internal.io.eventbus import Listener
+from nubia.internal.io.eventbus import ContextChanged, Listener
+from nubia.internal.io.output import get_output
 from threading import RLock
 from pygments.token import Token
 from typing import List, Tuple, Any
 
+# An immutable snapshot of the state of a context, replaced as a whole
+_State = namedtuple("_State", "binary_name testing registry args")
+
+# the verbosity of the command running in the current thread or task, see
+# override_verbose
+_verbose_override = contextvars.ContextVar("nubia_verbose_override", default=None)
+# the context of the Nubia instance running in the current thread or task,
+# see use_context
+_current = contextvars.ContextVar("nubia_context", default=None)
+
+
+class Args(argparse.Namespace):
+    """An immutable copy of the parsed command line arguments"""
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(
+            "The arguments of the context are immutable, use Context.set_args"
+        )
+
+    def __delattr__(self, name):
+        raise AttributeError("The arguments of the context are immutable")
+
+    def replace(self, **changes):
+        """A copy of the arguments with some of them changed"""
+        return Args(**dict(vars(self), **changes))
+
+
+def _parse_verbose(raw_value):
+    """
+    Accepts verbosity as int or True/False
+    """
+    try:
+        return int(raw_value)
+    except ValueError:
+        return int(raw_value.lower() == "true")
+
 
 class Context(Listener):
+    """
+    The state shared by nubia and the commands.
+
+    The state is an immutable snapshot, reading it takes no lock. The
+    setters build a new snapshot and swap it in, they are serialized by a
+    lock so that none of them is lost.
+    """
+
     def __init__(self):
-        self._binary_name = None
         self._lock = RLock()
-        self._testing = None
-        self._registry = None
-        self._args = {}
+        self._state = _State(binary_name=None, testing=None, registry=None, args=Args())
+
+    def _update(self, **changes):
+        with self._lock:
+            self._state = self._state._replace(**changes)
+            registry = self._state.registry
+        if registry is not None:
+            registry.event_bus.publish(ContextChanged(tuple(changes)))
 
     def set_binary_name(self, name):
-        self._binary_name = name
+        self._update(binary_name=name)
 
     def set_testing(self, testing):
-        with self._lock:
-            self._testing = testing
+        self._update(testing=testing)
 
     def set_registry(self, registry):
-        with self._lock:
-            self._registry = registry
+        self._update(registry=registry)
 
     def set_args(self, args):
-        with self._lock:
-            self._args = copy.deepcopy(args)
+        self._update(args=Args(**vars(args)))
 
     def set_verbose(self, raw_value):
         """
-        Accepts verbosity as int or True/False
+        Accepts verbosity as int or True/False. Changes the verbosity of
+        every command, use override_verbose to only change it for the
+        running command.
         """
-        try:
-            value = int(raw_value)
-        except ValueError:
-            value = int(raw_value.lower() == "true")
-
+        value = _parse_verbose(raw_value)
         with self._lock:
-            self._args.verbose = value
+            self._update(args=self._state.args.replace(verbose=value))
 
     @property
     def binary_name(self):
-        return self._binary_name
+        return self._state.binary_name
 
     @property
     def testing(self):
-        with self._lock:
-            return self._testing
+        return self._state.testing
 
     @property
     def registry(self):
-        with self._lock:
-            return self._registry
+        return self._state.registry
+
+    @property
+    def _registry(self):
+        return self._state.registry
 
     @property
     def args(self):
-        with self._lock:
-            return self._args
+        """
+        The parsed arguments, with the verbosity of the running command if
+        it was overridden
+        """
+        args = self._state.args
+        verbose = _verbose_override.get()
+        if verbose is not None:
+            return args.replace(verbose=verbose)
+        return args
+
+    @property
+    def out(self):
+        """
+        The buffered output (see nubia.internal.io.output), for commands
+        printing a lot
+        """
+        return get_output()
 
     @property
     def isatty(self):
@@ -110,9 +177,41 @@ class Context(Listener):
         pass
 
 
-# This is set by LDShell class on constructor.
+# This is set by LDShell class on constructor, the context used where no
+# other was set by use_context
 _ctx = None
 
 
 def get_context():
-    return _ctx
+    ctx = _current.get()
+    return ctx if ctx is not None else _ctx
+
+
+@contextlib.contextmanager
+def use_context(ctx):
+    """
+    Makes `ctx` the context returned by get_context in the current thread or
+    task (and the tasks and threads started with its contextvars), so that
+    several Nubia instances can live in the same process
+    """
+    token = _current.set(ctx)
+    try:
+        yield ctx
+    finally:
+        _current.reset(token)
+
+
+@contextlib.contextmanager
+def override_verbose(raw_value):
+    """
+    Changes the verbosity seen through Context.args in the current thread
+    or task only, None keeps it unchanged
+    """
+    if raw_value is None:
+        yield
+        return
+    token = _verbose_override.set(_parse_verbose(raw_value))
+    try:
+        yield
+    finally:
+        _verbose_override.reset(token)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+import bisect
+import logging
+import threading
+import time
+
+from nubia.internal.plugin_interface import CompletionDataSource
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 300
+
+
+def is_data_source(obj):
+    return isinstance(obj, CompletionDataSource)
+
+
+class _Snapshot:
+    """An immutable index of the values fetched at a point in time"""
+
+    def __init__(self, values):
+        pairs = sorted(((str(v).lower(), i) for i, v in enumerate(values)))
+        self.keys = [key for key, _ in pairs]
+        self.values = [values[i] for _, i in pairs]
+        self.value_set = frozenset(values)
+        self.fetched_at = time.monotonic()
+
+    def with_prefix(self, prefix):
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self.keys, prefix)
+        output = []
+        for index in range(start, len(self.keys)):
+            if not self.keys[index].startswith(prefix):
+                break
+            output.append(self.values[index])
+        return output
+
+
+class CachedCompletionDataSource(CompletionDataSource):
+    """
+    A data source for values that are expensive to fetch (e.g. hostnames
+    from a service). Values are fetched on first use and kept for `ttl`
+    seconds, after which they keep being served while a background thread
+    fetches them again. Prefix lookups bisect a sorted, lowercased index and
+    membership tests use a hash set.
+
+    Either pass a `fetch` callable or override `fetch()` in a sub-class.
+    """
+
+    def __init__(self, fetch=None, ttl=DEFAULT_TTL):
+        self._fetch = fetch
+        self._ttl = ttl
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+
+    def fetch(self):
+        """Returns an iterable of all the values of this data source"""
+        if self._fetch is None:
+            raise NotImplementedError("fetch must be overridden")
+        return self._fetch()
+
+    def _refresh(self):
+        try:
+            snapshot = _Snapshot(list(self.fetch()))
+            self._snapshot = snapshot
+            logger.debug("Fetched %d values for %s", len(snapshot.keys), self)
+        except Exception:
+            logger.exception("Failed to fetch the values of %s", self)
+
+    def _start_refresh(self):
+        with self._lock:
+            if self._refresh_thread and self._refresh_thread.is_alive():
+                return self._refresh_thread
+            self._refresh_thread = threading.Thread(
+                target=self._refresh, name="nubia-datasource-refresh", daemon=True
+            )
+            self._refresh_thread.start()
+            return self._refresh_thread
+
+    def _is_stale(self, snapshot):
+        return time.monotonic() - snapshot.fetched_at >= self._ttl
+
+    def prefetch(self):
+        """Starts fetching the values in the background if they are missing
+        or stale, returns immediately"""
+        snapshot = self._snapshot
+        if snapshot is None or self._is_stale(snapshot):
+            self._start_refresh()
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def _get_snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            # nothing to serve yet, wait for the (possibly prefetching) fetch
+            self._start_refresh().join()
+            snapshot = self._snapshot
+            if snapshot is None:
+                return _Snapshot([])
+        elif self._is_stale(snapshot):
+            self._start_refresh()
+        return snapshot
+
+    def get_all(self):
+        return list(self._get_snapshot().values)
+
+    def get_completions(self, prefix):
+        return self._get_snapshot().with_prefix(prefix)
+
+    def __contains__(self, value):
+        try:
+            return value in self._get_snapshot().value_set
+        except TypeError:  # unhashable values are never valid
+            return False
+
+    def __bool__(self):
+        # choices are checked for truthiness before the values are fetched
+        return True
+
+    def __repr__(self):
+        snapshot = self._snapshot
+        count = len(snapshot.keys) if snapshot else "?"
+        return "<{} ({} values)>".format(type(self).__name__, count)
@@ -10,7 +10,7 @@
 from functools import wraps
 from typing import Any, Dict, Optional
 
-from termcolor import cprint
+from nubia.internal.io import output
 
 from nubia.internal.typing import inspect_object
 
@@ -27,11 +27,11 @@ def deprecated(
                     command=inspect_object(command).command.name
                 )
             )
-            cprint(warning, "yellow")
+            output.cprint(warning, "yellow")
             if message is not None:
-                cprint(message, "yellow")
+                output.cprint(message, "yellow")
             elif superseded_by is not None:
-                cprint(
+                output.cprint(
                     "Use `{}` command instead".format(superseded_by), "yellow"
                 )
             else:
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+"""
+Fan-out execution engine for commands declared with `@command(fanout=...)`.
+
+The command body is executed once per element of the fan-out argument, with at
+most `atonce` executions in flight at any time. Regular functions run on a
+bounded thread pool while coroutine functions run on the asyncio event loop.
+Targets that are still pending when the deadline expires are cut off and
+reported as timed out: the threads running them are daemon threads that are
+abandoned, they do not delay the exit of the program. The shared resources of
+the command (see `nubia.internal.resources`) are acquired for every target.
+"""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import inspect
+import logging
+import queue
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class FanoutResult:
+    """
+    The aggregated, per-target result of a fan-out execution. A target is
+    considered failed if its execution raised an exception, returned a
+    non-zero integer or returned False.
+    """
+
+    def __init__(self, targets):
+        self.targets = list(targets)
+        # maps a target to the value returned by the command body
+        self.results = OrderedDict()
+        # maps a target to the exception raised by the command body
+        self.errors = OrderedDict()
+        # targets that did not finish before the deadline
+        self.timed_out = []
+
+    @staticmethod
+    def _is_failure(value):
+        if type(value) is bool:
+            return not value
+        return type(value) is int and value != 0
+
+    @property
+    def failed_targets(self):
+        failed = [t for t, v in self.results.items() if self._is_failure(v)]
+        return failed + list(self.errors.keys()) + self.timed_out
+
+    @property
+    def succeeded(self):
+        return len(self.results) - len(
+            [v for v in self.results.values() if self._is_failure(v)]
+        )
+
+    @property
+    def failed(self):
+        return len(self.targets) - self.succeeded
+
+    @property
+    def return_code(self):
+        return 0 if self.failed == 0 else 1
+
+    def summary(self):
+        return "{} target(s): {} succeeded, {} failed ({} timed out)".format(
+            len(self.targets), self.succeeded, self.failed, len(self.timed_out)
+        )
+
+
+class _DaemonExecutor:
+    """
+    A minimal thread pool running on daemon threads. The workers of
+    ThreadPoolExecutor are joined when the interpreter exits, which would make
+    the program wait for the targets cut off by the deadline.
+    """
+
+    def __init__(self, max_workers):
+        self._queue = queue.SimpleQueue()
+        self._threads = [
+            threading.Thread(
+                target=self._work, name="nubia-fanout-{}".format(i), daemon=True
+            )
+            for i in range(max_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, fn, *args):
+        future = concurrent.futures.Future()
+        self._queue.put((future, fn, args))
+        return future
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, fn, args = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def shutdown(self, wait=True):
+        for _ in self._threads:
+            self._queue.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+
+def _target_kwargs(kwargs, fanout_arg, target):
+    # Every execution gets a single-element list so the command body does not
+    # need to change when fan-out is switched on.
+    target_kwargs = dict(kwargs)
+    target_kwargs[fanout_arg] = [target]
+    return target_kwargs
+
+
+def run_fanout(
+    fn, kwargs, fanout_arg, atonce, deadline=None, on_progress=None, acquire=None
+):
+    """
+    Runs `fn` once per element of `kwargs[fanout_arg]` and returns a
+    `FanoutResult`.
+
+    @param atonce       Maximum number of concurrent executions
+    @param deadline     Seconds after which unfinished targets are cut off,
+                        None waits forever
+    @param on_progress  Optional callable receiving (completed, total) after
+                        every finished target
+    @param acquire      Optional callable returning a context manager held
+                        while every target runs, see `ResourceManager.acquire`
+    """
+    targets = list(kwargs[fanout_arg])
+    result = FanoutResult(targets)
+    if not targets:
+        return result
+    atonce = max(1, min(atonce or 1, len(targets)))
+
+    if inspect.iscoroutinefunction(fn):
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(
+            _run_fanout_async(
+                fn, kwargs, fanout_arg, atonce, deadline, on_progress, acquire, result
+            )
+        )
+    else:
+        _run_fanout_threaded(
+            fn, kwargs, fanout_arg, atonce, deadline, on_progress, acquire, result
+        )
+    return result
+
+
+def _call(fn, kwargs, acquire):
+    if acquire is None:
+        return fn(**kwargs)
+    with acquire():
+        return fn(**kwargs)
+
+
+def _record(result, target, future_result, future_exception):
+    if future_exception is not None:
+        logger.info("Fan-out target %s failed: %s", target, future_exception)
+        result.errors[target] = future_exception
+    else:
+        result.results[target] = future_result
+
+
+def _run_fanout_threaded(
+    fn, kwargs, fanout_arg, atonce, deadline, on_progress, acquire, result
+):
+    executor = _DaemonExecutor(atonce)
+    # every target runs with a copy of the contextvars of the command, the
+    # verbosity override for instance
+    futures = OrderedDict(
+        (
+            executor.submit(
+                contextvars.copy_context().run,
+                _call,
+                fn,
+                _target_kwargs(kwargs, fanout_arg, target),
+                acquire,
+            ),
+            target,
+        )
+        for target in result.targets
+    )
+    completed = 0
+    try:
+        for future in concurrent.futures.as_completed(futures, timeout=deadline):
+            _record(
+                result,
+                futures[future],
+                future.result() if future.exception() is None else None,
+                future.exception(),
+            )
+            completed += 1
+            if on_progress:
+                on_progress(completed, len(futures))
+    except concurrent.futures.TimeoutError:
+        for future, target in futures.items():
+            if not future.done():
+                # Queued targets are dropped, running ones are abandoned
+                future.cancel()
+                result.timed_out.append(target)
+    finally:
+        # the targets that timed out keep running in the background until
+        # they return or the program exits
+        executor.shutdown(wait=not result.timed_out)
+
+
+async def _run_fanout_async(
+    fn, kwargs, fanout_arg, atonce, deadline, on_progress, acquire, result
+):
+    semaphore = asyncio.Semaphore(atonce)
+    loop = asyncio.get_event_loop()
+
+    def release_later(held):
+        def release(entered):
+            if not entered.cancelled() and entered.exception() is None:
+                held.__exit__(None, None, None)
+
+        return release
+
+    async def run_target(target):
+        async with semaphore:
+            target_kwargs = _target_kwargs(kwargs, fanout_arg, target)
+            if acquire is None:
+                return await fn(**target_kwargs)
+            held = acquire()
+            # acquiring blocks, wait for it on a thread
+            entered = loop.run_in_executor(None, held.__enter__)
+            try:
+                await asyncio.shield(entered)
+            except asyncio.CancelledError:
+                # cut off while waiting, release once acquired
+                entered.add_done_callback(release_later(held))
+                raise
+            try:
+                return await fn(**target_kwargs)
+            finally:
+                held.__exit__(None, None, None)
+
+    tasks = OrderedDict(
+        (asyncio.ensure_future(run_target(target)), target)
+        for target in result.targets
+    )
+    expires_at = loop.time() + deadline if deadline is not None else None
+    pending = set(tasks)
+    while pending:
+        timeout = None
+        if expires_at is not None:
+            timeout = max(0, expires_at - loop.time())
+        done, pending = await asyncio.wait(
+            pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+        )
+        if not done:
+            break
+        for task in done:
+            exception = task.exception()
+            _record(
+                result,
+                tasks[task],
+                task.result() if exception is None else None,
+                exception,
+            )
+        if on_progress:
+            on_progress(len(tasks) - len(pending), len(tasks))
+
+    for task, target in tasks.items():
+        if task in pending:
+            task.cancel()
+            result.timed_out.append(target)
+    if pending:
+        await asyncio.wait(pending)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+"""
+The help of every command, collected once when the command is registered.
+
+Besides the help messages, the index keeps an inverted index from the words
+of the names, help messages and argument descriptions to the commands, used
+to search the commands. Words are matched by prefix and weighted by where
+they appear, a word in the name counts more than one in an argument.
+"""
+
+import bisect
+import re
+from collections import namedtuple
+from textwrap import dedent
+from typing import List, Tuple
+
+from nubia.internal.cmdbase import AutoCommand
+from nubia.internal.prefix_index import PrefixIndex
+
+HelpEntry = namedtuple("HelpEntry", "name summary help arguments built_in command")
+
+# weight of a word by the field it appears in
+WEIGHT_NAME = 8
+WEIGHT_SUMMARY = 4
+WEIGHT_ARGUMENT = 2
+WEIGHT_HELP = 1
+# a word that only starts with a search term counts for this fraction
+PREFIX_MATCH_FACTOR = 0.5
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return _WORD.findall(text.lower()) if text else []
+
+
+def _summary(help):
+    for line in help.splitlines():
+        if line.strip():
+            return line.strip()
+    return ""
+
+
+def _arguments(cmd_instance):
+    """(name, description) of the arguments of an AutoCommand, if it is one"""
+    if not isinstance(cmd_instance, AutoCommand):
+        return ()
+    metadata = cmd_instance.metadata
+    inspections = [metadata] + [sub for _, sub in metadata.subcommands]
+    return tuple(
+        (arg.name, arg.description or "")
+        for inspection in inspections
+        for arg in inspection.arguments.values()
+    )
+
+
+class HelpIndex:
+    def __init__(self):
+        self._entries = {}
+        # names of the commands, for prefix lookups
+        self._names = PrefixIndex()
+        # word -> {command name: weight}
+        self._postings = {}
+        # the words of the postings, sorted for prefix lookups
+        self._words = []
+        # command name -> its words, to update the postings when overridden
+        self._words_of = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def add(self, name, cmd_instance):
+        """Indexes the help of the command `cmd_instance` known as `name`"""
+        help = cmd_instance.get_help(name) or ""
+        help = dedent(help).strip()
+        entry = HelpEntry(
+            name=name,
+            summary=_summary(help),
+            help=help,
+            arguments=_arguments(cmd_instance),
+            built_in=cmd_instance.built_in,
+            command=cmd_instance,
+        )
+        if name in self._entries:
+            self._remove_postings(name)
+        self._entries[name] = entry
+        self._names.add(name, entry)
+
+        weights = {}
+        fields = [
+            (name.replace("-", " ").replace("_", " "), WEIGHT_NAME),
+            (entry.summary, WEIGHT_SUMMARY),
+            (help, WEIGHT_HELP),
+        ]
+        fields.extend(
+            (" ".join(argument), WEIGHT_ARGUMENT) for argument in entry.arguments
+        )
+        for text, weight in fields:
+            for word in tokenize(text):
+                weights[word] = max(weights.get(word, 0), weight)
+        self._words_of[name] = set(weights)
+        for word, weight in weights.items():
+            postings = self._postings.get(word)
+            if postings is None:
+                postings = self._postings[word] = {}
+                bisect.insort(self._words, word)
+            postings[name] = weight
+        return entry
+
+    def _remove_postings(self, name):
+        for word in self._words_of.pop(name, ()):
+            postings = self._postings[word]
+            del postings[name]
+            if not postings:
+                del self._postings[word]
+                del self._words[bisect.bisect_left(self._words, word)]
+
+    def get(self, name):
+        return self._entries.get(name)
+
+    def entries(self, prefix="") -> List[HelpEntry]:
+        """The entries whose name starts with `prefix`, sorted by name"""
+        return [self._names.meta(name) for name in self._names.with_prefix(prefix)]
+
+    def _matches(self, term):
+        """{command name: weight} of the commands having a word matching term"""
+        matches = dict(self._postings.get(term, {}))
+        index = bisect.bisect_left(self._words, term)
+        while index < len(self._words) and self._words[index].startswith(term):
+            word = self._words[index]
+            if word != term:
+                for name, weight in self._postings[word].items():
+                    matches[name] = max(
+                        matches.get(name, 0), weight * PREFIX_MATCH_FACTOR
+                    )
+            index += 1
+        return matches
+
+    def search(self, text) -> List[Tuple[HelpEntry, float]]:
+        """
+        Returns the (entry, score) of the commands matching the words of
+        `text`, those matching the most words first, then the best scores
+        """
+        matched = {}
+        scores = {}
+        for term in set(tokenize(text)):
+            for name, weight in self._matches(term).items():
+                matched[name] = matched.get(name, 0) + 1
+                scores[name] = scores.get(name, 0) + weight
+        ranked = sorted(scores, key=lambda name: (-matched[name], -scores[name], name))
+        return [(self._entries[name], scores[name]) for name in ranked]
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+"""
+Histories of the interactive shell.
+
+`SQLiteHistory` keeps the history in a sqlite database: every command is
+stored once (running it again moves it to the top), the database is capped
+to a number of entries, several shells can write to it at the same time and
+entries are read from the most recent, in pages, as they are needed. Its
+index on the commands answers the prefix lookups of auto-suggestion without
+scanning the history.
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, Optional
+
+from prompt_toolkit.auto_suggest import AutoSuggest, AutoSuggestFromHistory, Suggestion
+from prompt_toolkit.history import FileHistory, History, InMemoryHistory
+
+logger = logging.getLogger(__name__)
+
+BACKEND_SQLITE = "sqlite"
+BACKEND_FILE = "file"
+BACKEND_MEMORY = "memory"
+BACKENDS = (BACKEND_SQLITE, BACKEND_FILE, BACKEND_MEMORY)
+
+# number of entries read from the database at once
+PAGE_SIZE = 500
+# milliseconds a writer waits for another one to release the database
+BUSY_TIMEOUT = 5000
+# the largest code point, every string starting with a prefix sorts below
+# the prefix followed by it
+_MAX_CHAR = "\U0010ffff"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    command TEXT NOT NULL UNIQUE,
+    used_at REAL NOT NULL
+)
+"""
+
+
+class SQLiteHistory(History):
+    def __init__(self, path: str, max_entries: int = 10000) -> None:
+        super().__init__()
+        self._path = path
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection = None
+        # set when the database cannot be used, the history is then only
+        # kept in memory
+        self._failed = False
+
+    def _connect(self):
+        if self._connection is None and not self._failed:
+            try:
+                exists = os.path.exists(self._path)
+                connection = sqlite3.connect(
+                    self._path,
+                    timeout=BUSY_TIMEOUT / 1000,
+                    isolation_level=None,
+                    check_same_thread=False,
+                )
+                # readers do not block the writers of the other shells
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute("PRAGMA busy_timeout={}".format(BUSY_TIMEOUT))
+                connection.execute(_SCHEMA)
+                self._connection = connection
+                if not exists:
+                    self._import_file_history()
+            except sqlite3.Error as e:
+                logger.warning("History disabled, cannot open %s: %s", self._path, e)
+                self._failed = True
+        return self._connection
+
+    def _execute(self, *args):
+        with self._lock:
+            connection = self._connect()
+            if connection is None:
+                return []
+            try:
+                return connection.execute(*args).fetchall()
+            except sqlite3.Error as e:
+                logger.warning("Cannot access the history in %s: %s", self._path, e)
+                return []
+
+    def _import_file_history(self):
+        """Imports the history of the former file-based backend"""
+        path, _ = os.path.splitext(self._path)
+        if not os.path.isfile(path):
+            return
+        # FileHistory yields the most recent entries first
+        strings = list(FileHistory(path).load_history_strings())[::-1]
+        self._store(self._connection, strings[-self._max_entries :])
+
+    def _store(self, connection, strings):
+        now = time.time()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            for string in strings:
+                connection.execute("DELETE FROM history WHERE command = ?", (string,))
+                connection.execute(
+                    "INSERT INTO history (command, used_at) VALUES (?, ?)",
+                    (string, now),
+                )
+            # keep the `max_entries` most recent entries
+            connection.execute(
+                "DELETE FROM history WHERE id <= "
+                "(SELECT id FROM history ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (self._max_entries,),
+            )
+
+    def store_string(self, string: str) -> None:
+        with self._lock:
+            connection = self._connect()
+            if connection is None:
+                return
+            try:
+                self._store(connection, [string])
+            except sqlite3.Error as e:
+                logger.warning("Cannot write the history to %s: %s", self._path, e)
+
+    def load_history_strings(self, before: Optional[int] = None) -> Iterable[str]:
+        """Yields the entries older than the id `before`, most recent first"""
+        if before is None:
+            rows = self._execute("SELECT MAX(id) FROM history")
+            if not rows or rows[0][0] is None:
+                return
+            before = rows[0][0] + 1
+        while True:
+            rows = self._execute(
+                "SELECT id, command FROM history WHERE id < ? "
+                "ORDER BY id DESC LIMIT ?",
+                (before, PAGE_SIZE),
+            )
+            for _, command in rows:
+                yield command
+            if len(rows) < PAGE_SIZE:
+                return
+            before = rows[-1][0]
+
+    async def load(self):
+        """
+        Yields the entries, most recent first, reading them a page at a time
+        and letting the shell run in between
+        """
+        if self._loaded:
+            for string in self._loaded_strings:
+                yield string
+            return
+        # the entries stored from now on are added to _loaded_strings by
+        # append_string, only read those stored before
+        rows = self._execute("SELECT MAX(id) FROM history")
+        before = rows[0][0] + 1 if rows and rows[0][0] is not None else 0
+        added = list(self._loaded_strings)
+        for string in added:
+            yield string
+        seen = set(added)
+        strings = []
+        for index, string in enumerate(self.load_history_strings(before)):
+            if string in seen:
+                continue
+            strings.append(string)
+            yield string
+            if index % PAGE_SIZE == PAGE_SIZE - 1:
+                await asyncio.sleep(0)
+        self._loaded_strings = self._loaded_strings + strings
+        self._loaded = True
+
+    def find_prefix(self, prefix: str, limit: int = 1) -> List[str]:
+        """The most recent entries starting with `prefix`, using the index"""
+        rows = self._execute(
+            "SELECT command FROM history WHERE command >= ? AND command < ? "
+            "ORDER BY id DESC LIMIT ?",
+            (prefix, prefix + _MAX_CHAR, limit),
+        )
+        return [command for command, in rows]
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+class AutoSuggestFromIndex(AutoSuggest):
+    """
+    Suggests the most recent command starting with the text typed so far,
+    looked up in the index of histories having one (see
+    `SQLiteHistory.find_prefix`) and in the loaded history otherwise
+    """
+
+    def __init__(self):
+        self._fallback = AutoSuggestFromHistory()
+
+    def get_suggestion(self, buffer, document):
+        history = buffer.history
+        if not hasattr(history, "find_prefix"):
+            return self._fallback.get_suggestion(buffer, document)
+        text = document.text
+        if not text.strip() or "\n" in text:
+            return None
+        for command in history.find_prefix(text):
+            # the suggestion only completes the line being typed
+            return Suggestion(command[len(text) :].split("\n", 1)[0])
+        return None
+
+
+def create_history(backend: str, path: str, max_entries: int = 10000) -> History:
+    """
+    Creates the history of the given backend, `path` is the path of the
+    file history, the sqlite backend keeps its database next to it
+    """
+    if backend == BACKEND_SQLITE:
+        return SQLiteHistory(path + ".sqlite", max_entries=max_entries)
+    if backend == BACKEND_FILE:
+        return FileHistory(path)
+    if backend == BACKEND_MEMORY:
+        return InMemoryHistory()
+    raise ValueError(
+        "Unknown history backend {!r}, expected one of {}".format(
+            backend, ", ".join(BACKENDS)
+        )
+    )
@@ -8,25 +8,39 @@
 #
 
 from typing import List, Tuple, Any
+import asyncio
+import contextvars
 import logging
 import os
 import sys
+import threading
+import time
 
 from prompt_toolkit import PromptSession
-from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
+from prompt_toolkit.application.current import get_app_or_none
 from prompt_toolkit.completion import Completer
 from prompt_toolkit.document import Document
 from prompt_toolkit.enums import EditingMode
 from prompt_toolkit.formatted_text import PygmentsTokens
-from prompt_toolkit.history import FileHistory, InMemoryHistory
 from prompt_toolkit.layout.processors import HighlightMatchingBracketProcessor
-from prompt_toolkit.lexers import PygmentsLexer
+from pygments.token import Token
 
-from nubia.internal.ui.lexer import NubiaLexer
-from termcolor import cprint
+from nubia.internal.ui import latency
+from nubia.internal.ui.lexer import NubiaPromptLexer
+from nubia.internal.io import output
 
+from nubia.internal import context
 from nubia.internal.helpers import catchall
-from nubia.internal.io.eventbus import Listener
+from nubia.internal.history import BACKEND_MEMORY, AutoSuggestFromIndex, create_history
+from nubia.internal.io import logger
+from nubia.internal.io.eventbus import (
+    CommandFinished,
+    CommandStarted,
+    CompletionRequested,
+    Listener,
+    new_job_id,
+)
+from nubia.internal.metrics import command_key, return_code
 from nubia.internal.options import Options
 from nubia.internal.ui.style import shell_style
 
@@ -43,19 +57,28 @@ class IOLoop(Listener):
         self._options = options
         self._blacklist = self._plugin.getBlacklistPlugin()
         self._status_bar = self._plugin.get_status_bar(context)
-        self._completer = ShellCompleter(self._command_registry)
+        # times the hooks running while the user types, disabled by default
+        self._ui_monitor = self._command_registry.ui_monitor
+        self._completer = ShellCompleter(
+            self._command_registry,
+            debounce=options.completion_debounce,
+            deadline=options.completion_deadline,
+            monitor=self._ui_monitor,
+        )
         self._command_registry.register_listener(self)
+        self._command_registry.set_io_loop(self)
         self._usagelogger = usagelogger
 
     def _build_cli(self):
-        if self._options.persistent_history:
-            history = FileHistory(
-                os.path.join(
-                    os.path.expanduser("~"), ".{}_history".format(self._ctx.binary_name)
-                )
-            )
-        else:
-            history = InMemoryHistory()
+        history = create_history(
+            self._options.history_backend
+            if self._options.persistent_history
+            else BACKEND_MEMORY,
+            os.path.join(
+                os.path.expanduser("~"), ".{}_history".format(self._ctx.binary_name)
+            ),
+            max_entries=self._options.history_max_entries,
+        )
 
         # If EDITOR does not exist, take EMACS
         # if it does, try fit the EMACS/VI pattern using upper
@@ -65,37 +88,69 @@ class IOLoop(Listener):
             EditingMode.EMACS,
         )
 
+        lexer = NubiaPromptLexer()
+        if self._ui_monitor:
+            lexer = latency.TimedLexer(
+                lexer, self._ui_monitor, self._command_registry
+            )
+
         return PromptSession(
             history=history,
-            auto_suggest=AutoSuggestFromHistory(),
-            lexer=PygmentsLexer(NubiaLexer),
+            auto_suggest=AutoSuggestFromIndex(),
+            lexer=lexer,
             completer=self._completer,
             input_processors=[HighlightMatchingBracketProcessor(chars="[](){}")],
             style=shell_style,
-            bottom_toolbar=self._get_bottom_toolbar,
+            bottom_toolbar=self._timed(
+                latency.HOOK_TOOLBAR, self._get_bottom_toolbar
+            ),
             editing_mode=editor,
-            complete_in_thread=True,
-            refresh_interval=1,
+            # ShellCompleter runs the completion sources on its own threads
+            complete_in_thread=False,
+            # the status bar redraws the screen when it changes
             include_default_pygments_style=False,
         )
 
+    def _timed(self, hook, fn):
+        if not self._ui_monitor:
+            return fn
+        return self._ui_monitor.wrap(hook, fn, self._typed_command)
+
+    def _typed_command(self):
+        app = get_app_or_none()
+        if app is None:
+            return latency.UNKNOWN_COMMAND
+        return latency.typed_command(
+            app.current_buffer.text, self._command_registry
+        )
+
     def _get_prompt_tokens(self) -> List[Tuple[Any, str]]:
         return self._plugin.get_prompt_tokens(self._ctx)
 
     def _get_bottom_toolbar(self) -> List[Tuple[Any, str]]:
-        return PygmentsTokens(self._status_bar.get_tokens())
+        tokens = self._status_bar.render_tokens()
+        if self._completer.loading:
+            tokens = list(tokens) + [(Token.Toolbar, " " + LOADING_HINT)]
+        return PygmentsTokens(tokens)
+
+    def _get_rprompt(self) -> List[Tuple[Any, str]]:
+        return PygmentsTokens(self._status_bar.render_rprompt_tokens())
 
     def parse_and_evaluate(self, input):
         command_parts = split_command(input)
         if command_parts and command_parts[0]:
             cmd = command_parts[0]
             args = command_parts[1] if len(command_parts) > 1 else None
-            return self.evaluate_command(cmd, args, input)
+            try:
+                with context.use_context(self._ctx):
+                    return self.evaluate_command(cmd, args, input)
+            finally:
+                output.flush()
 
     def evaluate_command(self, cmd, args, raw):
         if cmd not in self._command_registry:
-            print()
-            cprint(
+            output.print()
+            output.error(
                 "Unknown Command '{}',{} type `help` to see all "
                 "available commands".format(
                     cmd, self._command_registry.find_approx(cmd)
@@ -107,6 +162,7 @@ class IOLoop(Listener):
             if args is None:
                 args = ""
             cmd_instance = self._command_registry.find_command(cmd)
+            self._command_registry.record_usage(cmd)
             try:
                 ret = self._blacklist.is_blacklisted(cmd)
                 if ret:
@@ -117,30 +173,64 @@ class IOLoop(Listener):
                     "all commands are available.\n"
                     "{}".format(str(e))
                 )
-                cprint(err_message, "red")
+                output.error(err_message)
                 logging.error(err_message)
+            events = self._command_registry.event_bus
+            job_id = new_job_id()
+            start = time.perf_counter()
+            events.publish(CommandStarted(cmd, raw, job_id, True))
+            metrics = self._command_registry.metrics
+            metrics_key = command_key(cmd_instance)
+            # reported if the command raises
+            result = 1
             try:
-                catchall(self._usagelogger.pre_exec)
-                result = cmd_instance.run_interactive(cmd, args, raw)
+                catchall(self._usagelogger.pre_exec_command, cmd, args, False)
+                resources = cmd_instance.get_resources(cmd, args)
+                with self._command_registry.resources.acquire(resources) as grant:
+                    if resources:
+                        metrics.record(metrics_key, "queue", grant.wait_time)
+                    with logger.log_job(cmd, job_id):
+                        result = cmd_instance.run_interactive(cmd, args, raw)
+                if resources:
+                    catchall(
+                        self._usagelogger.record_queue_wait,
+                        cmd,
+                        resources,
+                        grant.wait_time,
+                    )
                 catchall(self._usagelogger.post_exec, cmd, args, result, False)
                 self._status_bar.set_last_command_status(result)
+                self._status_bar.invalidate()
                 return result
             except NotImplementedError as e:
-                cprint("[NOT IMPLEMENTED]: {}".format(str(e)), "yellow", attrs=["bold"])
+                output.error(
+                    "[NOT IMPLEMENTED]: {}".format(str(e)), "yellow", attrs=["bold"]
+                )
                 # not implemented error code
-                return 99
+                result = 99
+                return result
+            finally:
+                duration = time.perf_counter() - start
+                metrics.record_result(metrics_key, result, duration)
+                events.publish(
+                    CommandFinished(cmd, raw, job_id, True, result, duration)
+                )
+                log_buffer = self._command_registry.log_buffer
+                if log_buffer is not None and return_code(result):
+                    logger.dump_after_failure(log_buffer)
 
     def run(self):
         prompt = self._build_cli()
+        get_prompt_tokens = self._timed(latency.HOOK_PROMPT, self._get_prompt_tokens)
+        get_rprompt = self._timed(latency.HOOK_RPROMPT, self._get_rprompt)
+        self._status_bar.set_invalidate_callback(prompt.app.invalidate)
         self._status_bar.start()
         try:
             while True:
                 try:
+                    output.flush()
                     text = prompt.prompt(
-                        PygmentsTokens(self._get_prompt_tokens()),
-                        rprompt=PygmentsTokens(
-                            self._status_bar.get_rprompt_tokens()
-                        ),
+                        PygmentsTokens(get_prompt_tokens()), rprompt=get_rprompt
                     )
                     self.parse_and_evaluate(text)
                 except KeyboardInterrupt:
@@ -153,11 +243,44 @@ class IOLoop(Listener):
     def on_connected(self, *args, **kwargs):
         pass
 
+    def on_fanout_progress(self, cmd, completed, total):
+        self._status_bar.set_progress(cmd, completed, total)
+        self._status_bar.invalidate()
+
+
+# shown in the toolbar while slow completion sources are loading
+LOADING_HINT = "\u2026loading"
+# how often a pending completion request checks whether it was superseded
+_POLL_INTERVAL = 0.02
+_DONE = object()
+
 
 class ShellCompleter(Completer):
-    def __init__(self, command_registry):
+    """
+    Completes command names and delegates the completion of their arguments
+    to the commands.
+
+    Asynchronously, the completions are computed on a worker thread and
+    streamed to the menu as they are produced. Requests are debounced while
+    the user is typing and abandoned as soon as the input changes. When the
+    completions take longer than `deadline` seconds, `loading` is True
+    until they are all loaded and the shell shows a hint in the toolbar.
+    """
+
+    def __init__(self, command_registry, debounce=0.0, deadline=None, monitor=None):
         super(Completer, self).__init__()
         self._command_registry = command_registry
+        self._debounce = debounce
+        self._deadline = deadline
+        # a UILatencyMonitor timing the completions, if any
+        self._monitor = monitor
+        # the document of the request that missed its deadline, if any
+        self._loading = None
+
+    @property
+    def loading(self):
+        """True while completions past their deadline are being computed"""
+        return self._loading is not None
 
     def get_completions(self, document, complete_event):
         if document.on_first_line:
@@ -181,3 +304,86 @@ class ShellCompleter(Completer):
                 return self._command_registry.get_completions(document, complete_event)
 
         return []
+
+    async def get_completions_async(self, document, complete_event):
+        if self._debounce and complete_event.text_inserted:
+            await asyncio.sleep(self._debounce)
+            if self._is_superseded(document):
+                return
+
+        if self._command_registry:
+            self._command_registry.event_bus.publish(
+                CompletionRequested(document.text_before_cursor)
+            )
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        cancelled = threading.Event()
+        # the completion sources see the context of the shell
+        threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(self._produce, document, complete_event, loop, queue, cancelled),
+            name="nubia-completer",
+            daemon=True,
+        ).start()
+        deadline = None if self._deadline is None else loop.time() + self._deadline
+        try:
+            while True:
+                try:
+                    completion = await asyncio.wait_for(queue.get(), _POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    if self._is_superseded(document):
+                        return
+                    if (
+                        self._loading is not document
+                        and deadline is not None
+                        and loop.time() >= deadline
+                    ):
+                        self._set_loading(document)
+                    continue
+                if completion is _DONE:
+                    break
+                yield completion
+        finally:
+            cancelled.set()
+            if self._loading is document:
+                self._set_loading(None)
+
+    def _set_loading(self, document):
+        self._loading = document
+        app = get_app_or_none()
+        if app is not None:
+            app.invalidate()
+
+    def _produce(self, document, complete_event, loop, queue, cancelled):
+        def put(item):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                # the event loop is closed, nobody is waiting anymore
+                cancelled.set()
+
+        start = time.perf_counter()
+        try:
+            for completion in self.get_completions(document, complete_event):
+                if cancelled.is_set():
+                    return
+                put(completion)
+            if self._monitor:
+                self._monitor.record(
+                    latency.HOOK_COMPLETION,
+                    latency.typed_command(
+                        document.text_before_cursor, self._command_registry
+                    ),
+                    time.perf_counter() - start,
+                )
+        except Exception:
+            logging.exception("Failed to compute the completions")
+        finally:
+            put(_DONE)
+
+    def _is_superseded(self, document):
+        app = get_app_or_none()
+        if app is None or not app.is_running:
+            return False
+        current = app.current_buffer.document
+        return current.text_before_cursor != document.text_before_cursor
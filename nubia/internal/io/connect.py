@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+"""
+Runs the `on_connected` callbacks of the listeners when the shell connects.
+
+Listeners run after the listeners they depend on (see
+`Listener.depends_on`), on a thread pool when more than one worker is
+allowed. Listeners that take longer than their `connect_timeout` stop
+holding up the others. Deferred listeners only connect the first time
+`Listener.ensure_connected` is called, unless a listener that is not deferred
+depends on them. Priority listeners (the context) connect before all the
+others.
+"""
+
+import concurrent.futures
+import contextvars
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# states of the connection of a listener
+PENDING = "pending"
+CONNECTED = "connected"
+FAILED = "failed"
+TIMED_OUT = "timed out"
+DEFERRED = "deferred"
+
+
+class _Connection:
+    """The connection state of a listener, kept on the listener itself"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.status = PENDING
+        # seconds spent in on_connected, None until it returns
+        self.duration = None
+        # the arguments of the CONNECTED message, for deferred listeners
+        self.args = ()
+        self.kwargs = {}
+        # the listeners it depends on, connected first by ensure_connected
+        self.dependencies = []
+
+
+_state_lock = threading.Lock()
+
+
+def connection(listener) -> _Connection:
+    state = listener.__dict__.get("_nubia_connection")
+    if state is None:
+        with _state_lock:
+            state = listener.__dict__.setdefault("_nubia_connection", _Connection())
+    return state
+
+
+def dependency_names(listener):
+    return [d if isinstance(d, str) else d.__name__ for d in listener.depends_on]
+
+
+def topological_order(listeners):
+    """
+    The listeners sorted so that every listener comes after those it depends
+    on, otherwise keeping their order. Raises ValueError on cycles.
+    """
+    by_name = {}
+    for listener in listeners:
+        by_name.setdefault(listener.listener_name, listener)
+    ordered, visiting, done = [], set(), set()
+
+    def visit(listener, path):
+        if id(listener) in done:
+            return
+        if id(listener) in visiting:
+            raise ValueError(
+                "Listeners depend on each other: {}".format(
+                    " -> ".join(path + [listener.listener_name])
+                )
+            )
+        visiting.add(id(listener))
+        for name in dependency_names(listener):
+            dependency = by_name.get(name)
+            if dependency is None:
+                logger.warning(
+                    "Listener %s depends on unknown listener %s",
+                    listener.listener_name,
+                    name,
+                )
+            else:
+                visit(dependency, path + [listener.listener_name])
+        visiting.discard(id(listener))
+        done.add(id(listener))
+        ordered.append(listener)
+
+    for listener in listeners:
+        visit(listener, [])
+    return ordered
+
+
+def run_on_connected(listener, args=(), kwargs=None):
+    """Calls on_connected, recording its duration and whether it failed"""
+    state = connection(listener)
+    start = time.perf_counter()
+    state.status = FAILED
+    try:
+        if listener._on_connected(*args, **(kwargs or {})):
+            state.status = CONNECTED
+    finally:
+        state.duration = time.perf_counter() - start
+        logger.debug(
+            "Listener %s connected in %.3fs", listener.listener_name, state.duration
+        )
+
+
+def _run_with_timeout(listener, args, kwargs):
+    """Runs on_connected inline, or on a thread if it has a timeout"""
+    timeout = listener.connect_timeout
+    if timeout is None:
+        run_on_connected(listener, args, kwargs)
+        return
+    errors = []
+
+    def run():
+        try:
+            run_on_connected(listener, args, kwargs)
+        except BaseException as e:
+            errors.append(e)
+
+    thread = threading.Thread(
+        target=contextvars.copy_context().run,
+        args=(run,),
+        name="nubia-connect-" + listener.listener_name,
+        daemon=True,
+    )
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        _timed_out(listener)
+    elif errors:
+        raise errors[0]
+
+
+def _timed_out(listener):
+    connection(listener).status = TIMED_OUT
+    logger.warning(
+        "Listener %s did not connect within %ss, not waiting for it",
+        listener.listener_name,
+        listener.connect_timeout,
+    )
+
+
+def _needed(listeners):
+    """
+    The listeners that are not deferred and the deferred ones they depend
+    on, directly or not
+    """
+    by_name = {}
+    for listener in listeners:
+        by_name.setdefault(listener.listener_name, listener)
+    needed = set()
+    pending = [listener for listener in listeners if not listener.deferred]
+    while pending:
+        listener = pending.pop()
+        if id(listener) in needed:
+            continue
+        needed.add(id(listener))
+        for name in dependency_names(listener):
+            if name in by_name:
+                pending.append(by_name[name])
+    return [listener for listener in listeners if id(listener) in needed]
+
+
+def connect_listeners(listeners, args=(), kwargs=None, workers=1, priority=()):
+    """
+    Runs the on_connected of the listeners that are not deferred, with at
+    most `workers` of them at the same time. The `priority` listeners run
+    first, one after the other. Returns the listeners in the order they were
+    started.
+    """
+    kwargs = kwargs or {}
+    # rejects cycles, deferred listeners included
+    topological_order(listeners)
+    by_name = {}
+    for listener in listeners:
+        by_name.setdefault(listener.listener_name, listener)
+    needed = _needed(listeners)
+    for listener in listeners:
+        if not any(listener is other for other in needed):
+            state = connection(listener)
+            state.status = DEFERRED
+            state.args, state.kwargs = args, kwargs
+            state.dependencies = [
+                by_name[name] for name in dependency_names(listener) if name in by_name
+            ]
+    # every other listener implicitly depends on the priority ones
+    priority_ids = {id(listener) for listener in priority}
+    first = [listener for listener in needed if id(listener) in priority_ids]
+    ordered = topological_order(needed)
+    rest = [listener for listener in ordered if id(listener) not in priority_ids]
+    for listener in first:
+        _run_with_timeout(listener, args, kwargs)
+    if workers <= 1:
+        for listener in rest:
+            _run_with_timeout(listener, args, kwargs)
+    else:
+        _connect_concurrently(rest, args, kwargs, workers)
+    return first + rest
+
+
+def _connect_concurrently(ordered, args, kwargs, workers):
+    names = {listener.listener_name for listener in ordered}
+    # listener -> names of the dependencies it still waits for
+    waiting = {
+        listener: {name for name in dependency_names(listener) if name in names}
+        for listener in ordered
+    }
+    # listener -> the time on_connected started, set by the worker
+    started = {}
+    running = {}
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="nubia-connect"
+    )
+
+    def run(listener):
+        started[listener] = time.monotonic()
+        run_on_connected(listener, args, kwargs)
+
+    def release(listener):
+        for other in waiting:
+            waiting[other].discard(listener.listener_name)
+
+    try:
+        while waiting or running:
+            ready = [pending for pending, deps in waiting.items() if not deps]
+            for listener in ready:
+                del waiting[listener]
+                future = executor.submit(contextvars.copy_context().run, run, listener)
+                running[future] = listener
+            if not running:
+                # only happens if a dependency never started
+                break
+            deadlines = [
+                started[listener] + listener.connect_timeout
+                for listener in running.values()
+                if listener.connect_timeout is not None and listener in started
+            ]
+            timeout = None
+            if deadlines:
+                timeout = max(min(deadlines) - time.monotonic(), 0)
+            elif any(
+                listener.connect_timeout is not None for listener in running.values()
+            ):
+                # waiting for a listener with a timeout to start
+                timeout = 0.01
+            done, _ = concurrent.futures.wait(
+                running, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                listener = running.pop(future)
+                release(listener)
+                # re-raises NotImplementedError, like the sequential dispatch
+                future.result()
+            now = time.monotonic()
+            for future, listener in list(running.items()):
+                timeout = listener.connect_timeout
+                if (
+                    timeout is not None
+                    and listener in started
+                    and now - started[listener] >= timeout
+                ):
+                    del running[future]
+                    _timed_out(listener)
+                    release(listener)
+    finally:
+        # listeners that timed out keep running in the background
+        executor.shutdown(wait=False)
+
+
+def ensure_connected(listener):
+    """
+    Connects a deferred listener, once, the first time it is called. The
+    deferred listeners it depends on connect first.
+    """
+    state = connection(listener)
+    if state.status != DEFERRED:
+        return
+    # there are no cycles, connect_listeners checked
+    for dependency in state.dependencies:
+        ensure_connected(dependency)
+    with state.lock:
+        if state.status == DEFERRED:
+            run_on_connected(listener, state.args, state.kwargs)
@@ -7,30 +7,260 @@
 # LICENSE file in the root directory of this source tree.
 #
 
+"""
+Messages and events of nubia.
+
+`Message`s are delivered synchronously, in order, to the `Listener`s of the
+registry (see `CommandsRegistry.dispatch_message`). `Event`s are published
+to the `EventBus` of the registry, which queues them and delivers them to
+its subscribers on a worker thread, so slow subscribers never delay the
+commands.
+"""
+
+import itertools
 import logging
+import threading
+import time
 import traceback
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
 
 class Message:
     CONNECTED = 1
+    FANOUT_PROGRESS = 2
 
 
 class Listener:
+    # names (or classes) of the listeners whose on_connected must have run
+    # before this one's, see Options.listener_init_workers
+    depends_on = ()
+    # seconds after which the listeners depending on this one stop waiting
+    # for its on_connected
+    connect_timeout = None
+    # if True, on_connected only runs on the first call to ensure_connected
+    deferred = False
+
+    @property
+    def listener_name(self):
+        return type(self).__name__
+
+    def ensure_connected(self):
+        """
+        Runs on_connected if the listener is deferred and did not connect
+        yet, call it before using what on_connected sets up
+        """
+        from nubia.internal.io.connect import ensure_connected
+
+        ensure_connected(self)
+
     def react(self, msg, *args, **kwargs):
         if msg == Message.CONNECTED:
+            self._on_connected(*args, **kwargs)
+        elif msg == Message.FANOUT_PROGRESS:
             try:
-                self.on_connected(*args, **kwargs)
-            except NotImplementedError:
-                raise
+                self.on_fanout_progress(*args, **kwargs)
             except Exception as e:
                 logger.info(
-                    "Couldn't initialize {}: " "{}".format(type(self), e)
+                    "Couldn't report fan-out progress to {}: "
+                    "{}".format(type(self), e)
                 )
-                traceback.print_exc()
+
+    def _on_connected(self, *args, **kwargs):
+        """Runs on_connected, returns False if it raised"""
+        try:
+            self.on_connected(*args, **kwargs)
+        except NotImplementedError:
+            raise
+        except Exception as e:
+            logger.info(
+                "Couldn't initialize {}: " "{}".format(type(self), e)
+            )
+            traceback.print_exc()
+            return False
+        return True
 
     def on_connected(*args, **kwargs):
         raise NotImplementedError(
             "Listeners must implement on_connected method"
         )
+
+    def on_fanout_progress(self, cmd, completed, total):
+        """
+        Called every time a target of a fan-out command finishes
+        """
+        pass
+
+
+@dataclass(frozen=True)
+class Event:
+    # seconds since the epoch at which the event happened
+    timestamp: float = field(default_factory=time.time, init=False)
+
+
+@dataclass(frozen=True)
+class CommandStarted(Event):
+    command: str
+    # the command line as typed, or the CLI arguments
+    raw: str
+    # identifies a run of a command across events
+    job_id: int
+    interactive: bool
+
+
+@dataclass(frozen=True)
+class CommandFinished(Event):
+    command: str
+    raw: str
+    job_id: int
+    interactive: bool
+    return_code: Any
+    # seconds, including the time spent waiting for resources
+    duration: float
+
+
+@dataclass(frozen=True)
+class ParseError(Event):
+    command: str
+    raw: str
+    error: str
+
+
+@dataclass(frozen=True)
+class CompletionRequested(Event):
+    # the text before the cursor
+    text: str
+
+
+@dataclass(frozen=True)
+class ContextChanged(Event):
+    # names of the context attributes that changed (args, registry, ...)
+    fields: Tuple[str, ...]
+
+
+_job_ids = itertools.count(1)
+
+
+def new_job_id():
+    return next(_job_ids)
+
+
+# what publish does when the queue is full
+POLICY_DROP = "drop"
+POLICY_BLOCK = "block"
+
+
+class Subscription:
+    def __init__(self, callback, event_types, predicate):
+        self.callback = callback
+        self.event_types = event_types
+        self.predicate = predicate
+
+    def wants(self, event):
+        return isinstance(event, self.event_types) and (
+            self.predicate is None or self.predicate(event)
+        )
+
+
+class EventBus:
+    """
+    Delivers events to the subscribers interested in their type, on a worker
+    thread, through a bounded queue. When the queue is full, events are
+    dropped (and counted in `dropped`) with the "drop" policy, the publisher
+    waits for room with the "block" policy.
+    """
+
+    def __init__(self, max_size: int = 1024, policy: str = POLICY_DROP):
+        if policy not in (POLICY_DROP, POLICY_BLOCK):
+            raise ValueError(
+                "Unknown backpressure policy {!r}, expected {!r} or {!r}".format(
+                    policy, POLICY_DROP, POLICY_BLOCK
+                )
+            )
+        self._max_size = max_size
+        self._policy = policy
+        # replaced, never mutated, so that publish reads it without a lock
+        self._subscriptions = ()
+        self._types = ()
+        self._events = deque()
+        # events queued or being delivered
+        self._pending = 0
+        self._condition = threading.Condition()
+        self._worker = None
+        self.dropped = 0
+
+    def subscribe(self, callback, event_types=Event, predicate=None) -> Subscription:
+        """
+        Calls `callback(event)` for the events of `event_types` (a type or a
+        tuple of types) for which `predicate(event)`, if given, is true
+        """
+        if not isinstance(event_types, tuple):
+            event_types = (event_types,)
+        subscription = Subscription(callback, event_types, predicate)
+        with self._condition:
+            self._set_subscriptions(self._subscriptions + (subscription,))
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._condition:
+            self._set_subscriptions(
+                tuple(s for s in self._subscriptions if s is not subscription)
+            )
+
+    def _set_subscriptions(self, subscriptions):
+        self._subscriptions = subscriptions
+        self._types = tuple({t for s in subscriptions for t in s.event_types})
+
+    def wants(self, event_type) -> bool:
+        """Whether events of `event_type` have subscribers"""
+        return any(issubclass(event_type, t) for t in self._types)
+
+    def publish(self, event: Event) -> bool:
+        """Queues the event, returns False if it was dropped"""
+        if not isinstance(event, self._types):
+            return True
+        with self._condition:
+            while len(self._events) >= self._max_size:
+                # subscribers publishing cannot wait for themselves
+                blocking = threading.current_thread() is not self._worker
+                if self._policy == POLICY_DROP or not blocking:
+                    self.dropped += 1
+                    return False
+                self._condition.wait()
+            self._events.append(event)
+            self._pending += 1
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._deliver, name="nubia-events", daemon=True
+                )
+                self._worker.start()
+            self._condition.notify_all()
+        return True
+
+    def _deliver(self):
+        while True:
+            with self._condition:
+                while not self._events:
+                    self._condition.wait()
+                event = self._events.popleft()
+                # publishers blocked on a full queue
+                self._condition.notify_all()
+            for subscription in self._subscriptions:
+                try:
+                    if subscription.wants(event):
+                        subscription.callback(event)
+                except Exception:
+                    logger.exception(
+                        "Event subscriber %s failed", subscription.callback
+                    )
+            with self._condition:
+                self._pending -= 1
+                self._condition.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Waits until the queued events are delivered"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._pending == 0, timeout)
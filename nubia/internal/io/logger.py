@@ -7,51 +7,353 @@
 # LICENSE file in the root directory of this source tree.
 #
 
+"""
+Logging of nubia programs.
+
+Records are put on a queue by the thread logging them and formatted and
+written by a background thread, so that logging does not slow the commands
+down. Levels are colored only when writing to a terminal, and the records
+can be written as JSON lines carrying the command and job id they were
+logged from.
+
+`RingBufferHandler` keeps the last records in memory instead, they are only
+written to a rotating log file when asked to (when a command fails for
+instance).
+"""
+
+import atexit
+import collections
+import contextlib
+import contextvars
+import datetime
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import sys
 import threading
+import time
+
 from termcolor import colored
 
+FORMAT_TEXT = "text"
+FORMAT_JSON = "json"
+FORMATS = (FORMAT_TEXT, FORMAT_JSON)
+
+# every run logs to a new temporary file
+LOG_MODE_TEMPFILE = "tempfile"
+# records are kept in memory and written to the log directory on failures
+LOG_MODE_BUFFER = "buffer"
+LOG_MODES = (LOG_MODE_TEMPFILE, LOG_MODE_BUFFER)
+
+_LEVEL_COLORS = (
+    (logging.ERROR, "red"),
+    (logging.WARNING, "yellow"),
+    (logging.INFO, None),
+    (logging.NOTSET, "blue"),
+)
+
+# (command, job id) of the command running in the current context
+_job = contextvars.ContextVar("nubia_log_job", default=(None, None))
+
+
+@contextlib.contextmanager
+def log_job(command, job_id):
+    """Attaches `command` and `job_id` to the records logged in the block"""
+    token = _job.set((command, job_id))
+    try:
+        yield
+    finally:
+        _job.reset(token)
+
 
 class ContextFilter(logging.Filter):
+    """
+    Attaches the command and job id of the current context to the records,
+    it runs on the thread logging them
+    """
+
     def filter(self, record):
-        # colorize the level
+        record.command, record.job_id = _job.get()
+        return True
+
+
+def _logger_name(record):
+    if record.name == "__main__":
+        return "main"
+    return record.name.split(".")[-1]
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self, colors=False):
+        super().__init__(
+            fmt="[%(asctime)-15s] [%(level)6s] [%(logger_name)s] "
+            "%(thread_prefix)s%(message)s"
+        )
+        self._colors = colors
+
+    def format(self, record):
         level = record.levelname.lower().rjust(7)
-        if record.levelno <= logging.DEBUG:
-            level = colored(level, "blue")
-        elif record.levelno >= logging.ERROR:
-            level = colored(level, "red")
-        elif record.levelno >= logging.WARNING:
-            level = colored(level, "yellow")
+        if self._colors:
+            for levelno, color in _LEVEL_COLORS:
+                if record.levelno >= levelno:
+                    break
+            if color:
+                level = colored(level, color)
         record.level = level
+        record.logger_name = _logger_name(record)
+        # the thread that logged the record, not the one writing it
+        record.thread_prefix = ""
+        if record.levelno <= logging.DEBUG and record.threadName != "MainThread":
+            record.thread_prefix = "thread {}: ".format(record.threadName)
+        return super().format(record)
 
-        # logger name
-        if record.name == "__main__":
-            logger_name = "main"
-        else:
-            logger_name = record.name.split(".")[-1]
-        record.logger_name = logger_name
 
-        # thread name (optional)
-        record.thread = ""
-        if record.levelno <= logging.DEBUG:
-            thread = threading.current_thread().getName()
-            if thread != "MainThread":
-                record.thread = "thread {}: ".format(thread)
+class JSONFormatter(logging.Formatter):
+    """Formats the records as JSON objects, one per line"""
 
-        return True
+    def format(self, record):
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created)
+            .astimezone()
+            .isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        command = getattr(record, "command", None)
+        if command is not None:
+            entry["command"] = command
+            entry["job_id"] = getattr(record, "job_id", None)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
 
 
-def get_formatter():
-    return logging.Formatter(
-        fmt="[%(asctime)-15s] [%(level)6s] [%(logger_name)s] "
-        "%(thread)s%(message)s"
+def get_formatter(log_format=FORMAT_TEXT, colors=False):
+    if log_format == FORMAT_JSON:
+        return JSONFormatter()
+    if log_format == FORMAT_TEXT:
+        return TextFormatter(colors)
+    raise ValueError(
+        "Unknown log format {!r}, expected one of {}".format(
+            log_format, ", ".join(FORMATS)
+        )
     )
 
 
-def setup_logger(level, stream):
-    log_handler = logging.StreamHandler(stream)
-    log_handler.setFormatter(get_formatter())
-    log_handler.addFilter(ContextFilter())
-    logging.root.addHandler(log_handler)
+def _isatty(stream):
+    try:
+        return stream.isatty()
+    except (AttributeError, ValueError):
+        return False
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # QueueHandler.prepare merges the traceback into the message, keep
+        # it apart for the JSON formatter
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        message = record.getMessage()
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg, record.message, record.args = message, message, None
+        record.exc_info = None
+        return record
+
+
+def _prune(log_dir, prefix, retention_days):
+    """Deletes the files of `log_dir` starting with `prefix` older than that"""
+    cutoff = time.time() - retention_days * 24 * 3600
+    try:
+        entries = list(os.scandir(log_dir))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if (
+                entry.name.startswith(prefix)
+                and entry.is_file()
+                and entry.stat().st_mtime < cutoff
+            ):
+                os.remove(entry.path)
+        except OSError:
+            # removed by another process in the meantime
+            pass
+
+
+def create_file_handler(
+    log_dir,
+    name,
+    max_bytes=10 * 1024 * 1024,
+    backup_count=5,
+    retention_days=None,
+    log_format=FORMAT_TEXT,
+):
+    """
+    A handler appending to `<log_dir>/<name>.log`, rotated once it reaches
+    `max_bytes` and keeping `backup_count` rotated files. The files of the log
+    older than `retention_days` are deleted first.
+    """
+    os.makedirs(log_dir, exist_ok=True)
+    filename = name + ".log"
+    if retention_days is not None:
+        _prune(log_dir, filename, retention_days)
+    handler = logging.handlers.RotatingFileHandler(
+        os.path.join(log_dir, filename),
+        maxBytes=max_bytes,
+        backupCount=backup_count,
+        delay=True,
+    )
+    handler.setFormatter(get_formatter(log_format))
+    return handler
+
+
+class RingBufferHandler(logging.Handler):
+    """
+    Keeps the last `capacity` records in memory, `dump` writes them to the
+    handler created by `create_target` (see `create_file_handler`) the first
+    time it is called
+    """
+
+    def __init__(self, capacity, create_target):
+        super().__init__()
+        self._records = collections.deque(maxlen=capacity)
+        self._create_target = create_target
+        self._target = None
+
+    def emit(self, record):
+        self._records.append(record)
+
+    def dump(self):
+        """
+        Writes the buffered records and empties the buffer, returns the path
+        they were written to or None if there were none
+        """
+        # the records still queued go to the buffer first
+        flush_logger()
+        with self.lock:
+            records = list(self._records)
+            self._records.clear()
+            if not records:
+                return None
+            if self._target is None:
+                self._target = self._create_target()
+            for record in records:
+                self._target.handle(record)
+            self._target.flush()
+            return self._target.baseFilename
+
+    def close(self):
+        with self.lock:
+            if self._target is not None:
+                self._target.close()
+        super().close()
+
+
+def dump_after_failure(log_buffer):
+    """Dumps `log_buffer` after a command failed and tells the user where"""
+    try:
+        path = log_buffer.dump()
+    except OSError as e:
+        print("Failed to write the logs: {}".format(e), file=sys.stderr)
+        return
+    if path is not None:
+        print("Logs written to {}".format(path), file=sys.stderr)
+
+
+class _Flush:
+    """Put on the queue by flush_logger, set once the listener reaches it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def start(self):
+        # named so that the slow command watchdog does not sample it
+        self._thread = threading.Thread(
+            target=self._monitor, name="nubia-log-writer", daemon=True
+        )
+        self._thread.start()
+
+    def handle(self, record):
+        if isinstance(record, _Flush):
+            record.done.set()
+            return
+        super().handle(record)
+
+
+# the queue handler and the listener writing its records, see setup_logger
+_pipeline = None
+# held while the pipeline is replaced, stopped or flushed
+_pipeline_lock = threading.Lock()
+
+
+def setup_logger(level, stream=None, log_format=FORMAT_TEXT, handlers=()):
+    """
+    Sends the records logged from now on to `stream` (colored if it is a
+    terminal) and to `handlers`, written by a background thread. `level` is
+    the level of the records written to `stream`, the handlers get the
+    records of their own level.
+    """
+    targets = list(handlers)
+    if stream is not None:
+        stream_handler = logging.StreamHandler(stream)
+        stream_handler.setLevel(level)
+        stream_handler.setFormatter(get_formatter(log_format, _isatty(stream)))
+        targets.append(stream_handler)
+    with _pipeline_lock:
+        _stop()
+
+        global _pipeline
+        queue_handler = _QueueHandler(queue.SimpleQueue())
+        queue_handler.addFilter(ContextFilter())
+        listener = _QueueListener(
+            queue_handler.queue, *targets, respect_handler_level=True
+        )
+        listener.start()
+        _pipeline = (queue_handler, listener)
+        logging.root.addHandler(queue_handler)
+
+    # records below every level are not even queued
+    logging.root.setLevel(
+        min([level] + [handler.level or logging.DEBUG for handler in handlers])
+    )
+
+
+def flush_logger():
+    """Waits for the records logged so far to be written"""
+    with _pipeline_lock:
+        if _pipeline is None:
+            return
+        queue_handler, listener = _pipeline
+        if threading.current_thread() is listener._thread:
+            # called by a handler, the records before it are written already
+            return
+        marker = _Flush()
+        queue_handler.queue.put(marker)
+        marker.done.wait()
+
+
+@atexit.register
+def stop_logger():
+    """Writes the pending records and stops the background writer"""
+    with _pipeline_lock:
+        _stop()
+
 
-    logging.root.setLevel(level)
+def _stop():
+    global _pipeline
+    if _pipeline is None:
+        return
+    queue_handler, listener = _pipeline
+    _pipeline = None
+    logging.root.removeHandler(queue_handler)
+    listener.stop()
+    for handler in listener.handlers:
+        handler.flush()
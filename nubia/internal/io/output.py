@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+"""
+Buffered output of the commands, available as `context.get_context().out`.
+
+Writes are batched and written at once when the buffer is full, shortly
+after the last write, before the shell prompts again and before error
+messages are printed. Colors are not computed at all when they are disabled
+(`--no-color` or output that is not a terminal).
+
+The buffer is not shared with `print`: output written both through it and
+through `print` (or `sys.stdout`) by the same command may be reordered
+unless it is flushed in between.
+"""
+
+import atexit
+import os
+import sys
+import threading
+import time
+
+from termcolor import colored
+
+# bytes buffered before the buffer is written
+DEFAULT_BUFFER_SIZE = 64 * 1024
+# seconds after which buffered output is written anyway
+DEFAULT_FLUSH_INTERVAL = 0.1
+
+
+def colors_enabled():
+    return not (os.environ.get("ANSI_COLORS_DISABLED") or "NO_COLOR" in os.environ)
+
+
+class Output:
+    def __init__(
+        self,
+        stream=None,
+        buffer_size=DEFAULT_BUFFER_SIZE,
+        flush_interval=DEFAULT_FLUSH_INTERVAL,
+    ):
+        # None writes to whatever sys.stdout is at the time of writing
+        self._stream = stream
+        self._buffer_size = buffer_size
+        self._flush_interval = flush_interval
+        self._lock = threading.RLock()
+        self._chunks = []
+        self._size = 0
+        # the stream the buffered chunks are written to
+        self._target = None
+        self._pending = threading.Event()
+        self._flusher = None
+
+    def write(self, text):
+        with self._lock:
+            target = self._stream or sys.stdout
+            if target is not self._target:
+                # sys.stdout was replaced, what was written before goes to
+                # the former one
+                self._flush_locked()
+                self._target = target
+            self._chunks.append(text)
+            self._size += len(text)
+            if self._size >= self._buffer_size:
+                self._flush_locked()
+            elif self._flush_interval is not None:
+                self._schedule()
+        return len(text)
+
+    def print(self, *values, sep=" ", end="\n", flush=False):
+        self.write(sep.join(str(value) for value in values) + end)
+        if flush:
+            self.flush()
+
+    def cprint(self, text, color=None, on_color=None, attrs=None, **kwargs):
+        """Like termcolor.cprint, skipping the colors when they are disabled"""
+        if colors_enabled():
+            text = colored(text, color, on_color, attrs)
+        self.print(text, **kwargs)
+
+    def error(self, text, color="red", attrs=None):
+        """Prints an error message right away, after the pending output"""
+        self.cprint(text, color, attrs=attrs, flush=True)
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._chunks:
+            return
+        data = "".join(self._chunks)
+        self._chunks = []
+        self._size = 0
+        self._target.write(data)
+        self._target.flush()
+
+    def _schedule(self):
+        if self._flusher is None:
+            self._flusher = threading.Thread(
+                target=self._flush_periodically, name="nubia-output", daemon=True
+            )
+            self._flusher.start()
+        self._pending.set()
+
+    def _flush_periodically(self):
+        while True:
+            self._pending.wait()
+            time.sleep(self._flush_interval)
+            with self._lock:
+                self._pending.clear()
+                self._flush_locked()
+
+
+_output = Output()
+
+
+def get_output():
+    """The output shared by nubia and the commands"""
+    return _output
+
+
+def print(*values, **kwargs):
+    _output.print(*values, **kwargs)
+
+
+def cprint(text, color=None, on_color=None, attrs=None, **kwargs):
+    _output.cprint(text, color, on_color, attrs, **kwargs)
+
+
+def error(text, color="red", attrs=None):
+    _output.error(text, color, attrs)
+
+
+def flush():
+    _output.flush()
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        _output.flush()
+    except (OSError, ValueError):
+        # stdout is already closed
+        pass
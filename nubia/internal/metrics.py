@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+"""
+Built-in per-command latency metrics.
+
+Latencies are recorded per command and per phase (parse, bind, convert,
+execute, ...) into log-linear histograms in the spirit of HdrHistogram:
+values are bucketed by their power of two and then linearly within it, which
+bounds the relative error of every reported percentile to a few percent while
+using a small, fixed amount of memory regardless of the number of samples.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict
+
+# Number of bits used for the linear sub-buckets of every power of two, the
+# relative error of the recorded values is at most 2 ** -(SUB_BUCKET_BITS - 1)
+SUB_BUCKET_BITS = 6
+_SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+_HALF_SUB_BUCKETS = _SUB_BUCKETS >> 1
+
+PHASE_TOTAL = "total"
+PERCENTILES = (50, 90, 99)
+
+
+def _bucket_index(value):
+    if value < _SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return _SUB_BUCKETS + (shift - 1) * _HALF_SUB_BUCKETS + (
+        (value >> shift) - _HALF_SUB_BUCKETS
+    )
+
+
+def _bucket_bounds(index):
+    if index < _SUB_BUCKETS:
+        return index, index
+    shift = (index - _SUB_BUCKETS) // _HALF_SUB_BUCKETS + 1
+    mantissa = (index - _SUB_BUCKETS) % _HALF_SUB_BUCKETS + _HALF_SUB_BUCKETS
+    return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """A log-linear histogram of latencies, recorded in microseconds"""
+
+    def __init__(self):
+        self._buckets = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, seconds):
+        value = max(0, int(seconds * 1e6))
+        index = _bucket_index(value)
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.min = value if self.min is None else min(self.min, value)
+
+    def merge(self, other):
+        """Adds the samples of another histogram to this one"""
+        for index, count in other._buckets.items():
+            self._buckets[index] = self._buckets.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+
+    def percentile(self, percentile):
+        """Returns the given percentile in seconds"""
+        if not self.count:
+            return 0.0
+        rank = max(1, int(round(self.count * percentile / 100.0)))
+        seen = 0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen >= rank:
+                low, high = _bucket_bounds(index)
+                return min(self.max, (low + high) // 2) / 1e6
+        return self.max / 1e6
+
+    @property
+    def mean(self):
+        return self.total / self.count / 1e6 if self.count else 0.0
+
+    def to_dict(self):
+        output = OrderedDict(
+            [
+                ("count", self.count),
+                ("sum", self.total / 1e6),
+                ("mean", self.mean),
+                ("max", self.max / 1e6),
+            ]
+        )
+        for percentile in PERCENTILES:
+            output["p{}".format(percentile)] = self.percentile(percentile)
+        return output
+
+
+class CommandMetrics:
+    def __init__(self):
+        self.phases = OrderedDict()
+        self.errors = 0
+        self.return_codes = Counter()
+
+    def histogram(self, phase):
+        histogram = self.phases.get(phase)
+        if histogram is None:
+            histogram = self.phases[phase] = LatencyHistogram()
+        return histogram
+
+
+def command_key(cmd_instance):
+    """The name under which the metrics of a command are recorded"""
+    return next(iter(cmd_instance.get_command_names()))
+
+
+def return_code(result):
+    """Maps a command result to an exit code the same way the CLI does"""
+    if type(result) is int:
+        return result
+    if type(result) is bool:
+        return int(not result)
+    return 0 if result is None else 1
+
+
+class _Timer:
+    __slots__ = ("_collector", "_cmd", "_phase", "_start")
+
+    def __init__(self, collector, cmd, phase):
+        self._collector = collector
+        self._cmd = cmd
+        self._phase = phase
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._collector.record(
+            self._cmd, self._phase, time.perf_counter() - self._start
+        )
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class MetricsCollector:
+    """
+    Collects latencies, error counts and return codes of the commands. All
+    the recording methods return immediately when the collector is disabled.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._commands = OrderedDict()
+
+    def _metrics_for(self, cmd):
+        metrics = self._commands.get(cmd)
+        if metrics is None:
+            metrics = self._commands[cmd] = CommandMetrics()
+        return metrics
+
+    def timer(self, cmd, phase):
+        """A context manager that records the duration of its block"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, cmd, phase)
+
+    def record(self, cmd, phase, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._metrics_for(cmd).histogram(phase).record(seconds)
+
+    def record_result(self, cmd, result, seconds):
+        """Records the end-to-end latency and the result of a command"""
+        if not self.enabled:
+            return
+        code = return_code(result)
+        with self._lock:
+            metrics = self._metrics_for(cmd)
+            metrics.histogram(PHASE_TOTAL).record(seconds)
+            metrics.return_codes[code] += 1
+            if code != 0:
+                metrics.errors += 1
+
+    def reset(self):
+        with self._lock:
+            self._commands.clear()
+
+    def to_dict(self):
+        output = OrderedDict()
+        with self._lock:
+            for cmd, metrics in self._commands.items():
+                output[cmd] = OrderedDict(
+                    [
+                        ("errors", metrics.errors),
+                        (
+                            "return_codes",
+                            {str(k): v for k, v in metrics.return_codes.items()},
+                        ),
+                        (
+                            "phases",
+                            OrderedDict(
+                                (phase, histogram.to_dict())
+                                for phase, histogram in metrics.phases.items()
+                            ),
+                        ),
+                    ]
+                )
+        return output
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self):
+        """Renders the metrics in the Prometheus text exposition format"""
+        lines = ["# TYPE nubia_command_latency_seconds summary"]
+        errors = ["# TYPE nubia_command_errors_total counter"]
+        codes = ["# TYPE nubia_command_return_codes_total counter"]
+        for cmd, metrics in self.to_dict().items():
+            for phase, histogram in metrics["phases"].items():
+                labels = 'command="{}",phase="{}"'.format(cmd, phase)
+                for percentile in PERCENTILES:
+                    lines.append(
+                        'nubia_command_latency_seconds{{{},quantile="{}"}} {}'.format(
+                            labels,
+                            percentile / 100.0,
+                            histogram["p{}".format(percentile)],
+                        )
+                    )
+                lines.append(
+                    "nubia_command_latency_seconds_sum{{{}}} {}".format(
+                        labels, histogram["sum"]
+                    )
+                )
+                lines.append(
+                    "nubia_command_latency_seconds_count{{{}}} {}".format(
+                        labels, histogram["count"]
+                    )
+                )
+            errors.append(
+                'nubia_command_errors_total{{command="{}"}} {}'.format(
+                    cmd, metrics["errors"]
+                )
+            )
+            for code, count in metrics["return_codes"].items():
+                codes.append(
+                    'nubia_command_return_codes_total{{command="{}",code="{}"}} '
+                    "{}".format(cmd, code, count)
+                )
+        return "\n".join(lines + errors + codes) + "\n"
+
+    def dump(self, path):
+        """
+        Writes the metrics to `path`, as JSON if the file name ends with
+        `.json` and in the Prometheus text format otherwise
+        """
+        data = self.to_json() if path.endswith(".json") else self.to_prometheus()
+        directory = os.path.dirname(os.path.abspath(path))
+        # write-then-rename so that scrapers never see a partial file
+        with tempfile.NamedTemporaryFile(
+            mode="w", dir=directory, delete=False
+        ) as f:
+            f.write(data)
+        os.replace(f.name, path)
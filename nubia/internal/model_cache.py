@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+"""
+Keeps the completion model read by `_nubia_complete` up to date.
+
+Every command is fingerprinted by the path, size and modification time of the
+file defining it, and the global options by those of the plugin. The
+fingerprints of the generated model are stored next to it. When a regular
+invocation finds that they no longer match, the program is started again in
+a detached process with `--_refresh-completion-model`, which rebuilds only
+the entries of the commands that changed and reuses the others from the
+previous model.
+"""
+
+import hashlib
+import inspect
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from nubia.internal.registry_tools import (
+    MODEL_FORMAT_JSON,
+    build_model,
+    exportable_commands,
+    serialize_model,
+)
+from nubia_complete.completer import load_model
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINTS_SUFFIX = ".fingerprints"
+LOCK_SUFFIX = ".lock"
+# the hidden option making the program refresh the model and exit
+REFRESH_FLAG = "--_refresh-completion-model"
+# a lock older than this belongs to a refresh that died
+STALE_LOCK_SECONDS = 300
+# bump when the structure of the model changes
+CACHE_VERSION = 1
+
+
+def _file_fingerprint(path, stats_cache):
+    if not path:
+        return None
+    if path not in stats_cache:
+        try:
+            st = os.stat(path)
+            stats_cache[path] = "{}:{}:{}".format(
+                os.path.abspath(path), st.st_mtime_ns, st.st_size
+            )
+        except OSError:
+            stats_cache[path] = None
+    return stats_cache[path]
+
+
+def _hash(*parts):
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+
+def _atomic_write(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    mode = "wb" if isinstance(data, bytes) else "w"
+    with tempfile.NamedTemporaryFile(mode=mode, dir=directory, delete=False) as f:
+        f.write(data)
+    # temporary files are private, the model is read by every user's shell
+    os.chmod(f.name, 0o644)
+    os.replace(f.name, path)
+
+
+def program_command(argv=None, main_module=None):
+    """
+    The command line starting this program again, None if it cannot be
+    guessed (embedded interpreters, `python -c`)
+    """
+    argv = sys.argv if argv is None else argv
+    main_module = sys.modules.get("__main__") if main_module is None else main_module
+    if getattr(sys, "frozen", False):
+        # PyInstaller and the like, the executable is the program
+        return [sys.executable]
+    spec = getattr(main_module, "__spec__", None)
+    if spec is not None:
+        # python -m package runs package.__main__
+        name = spec.name
+        if name.endswith(".__main__"):
+            name = name[: -len(".__main__")]
+        return [sys.executable, "-m", name]
+    if argv and os.path.isfile(argv[0]):
+        return [sys.executable, os.path.abspath(argv[0])]
+    return None
+
+
+class CompletionModelCache:
+    """The completion model stored at `path` and its fingerprints"""
+
+    def __init__(self, path, format=MODEL_FORMAT_JSON):
+        self._path = path
+        self._format = format
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def _fingerprints_path(self):
+        return self._path + FINGERPRINTS_SUFFIX
+
+    def fingerprints(self, plugin, opts_parser, registry):
+        stats_cache = {}
+        commands = {}
+        for cmd in exportable_commands(registry):
+            name = cmd.metadata.command.name
+            commands[name] = _hash(
+                name, _file_fingerprint(cmd.get_source_file(), stats_cache)
+            )
+        try:
+            plugin_file = inspect.getsourcefile(type(plugin))
+        except TypeError:
+            plugin_file = None
+        option_names = sorted(
+            name for action in opts_parser._actions for name in action.option_strings
+        )
+        options = _hash(_file_fingerprint(plugin_file, stats_cache), option_names)
+        return {
+            "version": CACHE_VERSION,
+            "format": self._format,
+            "options": options,
+            "commands": commands,
+        }
+
+    def _read_fingerprints(self):
+        try:
+            with open(self._fingerprints_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def is_stale(self, fingerprints):
+        if not os.path.exists(self._path):
+            return True
+        return self._read_fingerprints() != fingerprints
+
+    def refresh(self, plugin, opts_parser, registry, fingerprints=None):
+        """
+        Regenerates the model, reusing the entries of the previous model whose
+        fingerprints did not change. Returns the names of the rebuilt commands.
+        """
+        if fingerprints is None:
+            fingerprints = self.fingerprints(plugin, opts_parser, registry)
+        cached_commands, cached_options = {}, None
+        previous = self._read_fingerprints()
+        if (
+            previous
+            and previous.get("version") == fingerprints["version"]
+            and previous.get("format") == fingerprints["format"]
+            and os.path.exists(self._path)
+        ):
+            try:
+                model = load_model(self._path)
+                old = previous.get("commands", {})
+                for name, fingerprint in fingerprints["commands"].items():
+                    if old.get(name) == fingerprint:
+                        entry = model.find_command(name)
+                        if entry is not None:
+                            cached_commands[name] = entry
+                if previous.get("options") == fingerprints["options"]:
+                    cached_options = model.options
+                if hasattr(model, "close"):
+                    model.close()
+            except Exception as e:
+                logger.warning("Ignoring unreadable completion model: %s", e)
+                cached_commands, cached_options = {}, None
+
+        model = build_model(
+            plugin, opts_parser, registry, cached_commands, cached_options
+        )
+        _atomic_write(self._path, serialize_model(model, self._format))
+        _atomic_write(self._fingerprints_path, json.dumps(fingerprints))
+        rebuilt = sorted(set(fingerprints["commands"]) - set(cached_commands))
+        logger.info("Completion model refreshed, rebuilt commands: %s", rebuilt)
+        return rebuilt
+
+    def _try_lock(self):
+        lock = self._path + LOCK_SUFFIX
+        try:
+            if time.time() - os.path.getmtime(lock) > STALE_LOCK_SECONDS:
+                os.unlink(lock)
+        except OSError:
+            pass
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return lock
+        except OSError:
+            return None
+
+    def refresh_in_background(self, plugin, opts_parser, registry, argv):
+        """
+        Regenerates the model if it is stale by running `argv` (the program
+        with REFRESH_FLAG, see `program_command`) in a detached process,
+        returns immediately. Only one refresh runs at a time.
+        """
+        fingerprints = self.fingerprints(plugin, opts_parser, registry)
+        if not self.is_stale(fingerprints):
+            return False
+        lock = self._try_lock()
+        if not lock:
+            logger.debug("A completion model refresh is already running")
+            return False
+        try:
+            # a new session, the shell does not wait for it nor forwards it
+            # its signals
+            subprocess.Popen(
+                list(argv),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                close_fds=True,
+                start_new_session=True,
+            )
+        except OSError:
+            os.unlink(lock)
+            raise
+        return True
+
+    def refresh_detached(self, plugin, opts_parser, registry):
+        """
+        Run by the process started by `refresh_in_background`, releases its
+        lock once the model is regenerated
+        """
+        try:
+            self.refresh(plugin, opts_parser, registry)
+        except Exception:
+            logger.exception("Failed to refresh the completion model")
+            return 1
+        finally:
+            try:
+                os.unlink(self._path + LOCK_SUFFIX)
+            except OSError:
+                pass
+        return 0
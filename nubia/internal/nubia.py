@@ -8,15 +8,18 @@
 #
 
 import argparse
+import atexit
 import codecs
+import functools
 import locale
 import logging
 import os
 import sys
 import tempfile
+import time
 import traceback
 import typing
-from termcolor import cprint
+from nubia.internal.io import output
 
 from nubia.internal import context
 from nubia.internal import exceptions
@@ -25,14 +28,31 @@ from nubia.internal.typing.argparse import create_subparser_class
 from nubia.internal.blackcmd import CommandBlacklist
 from nubia.internal.cmdbase import AutoCommand
 from nubia.internal import cmdloader
+from nubia.internal import registry_tools as regtools
 from nubia.internal.commands import builtin
 from nubia.internal.commands import help
+from nubia.internal.commands import profiling
 from nubia.internal.helpers import catchall
 from nubia.internal.interactive import IOLoop
 from nubia.internal.io import logger
+from nubia.internal.io.eventbus import (
+    CommandFinished,
+    CommandStarted,
+    EventBus,
+    new_job_id,
+)
+from nubia.internal.metrics import command_key
+from nubia.internal.model_cache import (
+    REFRESH_FLAG,
+    CompletionModelCache,
+    program_command,
+)
+from nubia.internal.resources import ResourceManager
 from nubia.internal.plugin_interface import PluginInterface
 from nubia.internal.registry import CommandsRegistry
+from nubia.internal.ui.latency import UILatencyMonitor
 from nubia.internal.usage_logger_interface import UsageLoggerInterface
+from nubia.internal.watchdog import SlowCommandWatchdog
 
 
 def set_default_subparser(self, name, args=None):
@@ -68,6 +88,24 @@ def set_default_subparser(self, name, args=None):
 argparse.ArgumentParser.set_default_subparser = set_default_subparser
 
 
+# seconds to wait for the subscribers to receive the last events at exit
+EXIT_FLUSH_TIMEOUT = 2
+
+
+def _in_context(method):
+    """
+    Runs the method with the context of the Nubia instance as the one
+    returned by context.get_context, see context.use_context
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with context.use_context(self._ctx):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
 class Nubia:
     """
     This is the core class that creates and runs nubia, the constructor takes
@@ -109,6 +147,15 @@ class Nubia:
         self._opts_parser.add_argument(
             "--_print-completion-model", action="store_true", help=argparse.SUPPRESS
         )
+        self._opts_parser.add_argument(
+            REFRESH_FLAG, action="store_true", help=argparse.SUPPRESS
+        )
+        self._opts_parser.add_argument(
+            "--_completion-model-format",
+            choices=regtools.MODEL_FORMATS,
+            default=regtools.MODEL_FORMAT_JSON,
+            help=argparse.SUPPRESS,
+        )
 
         cmd_parser = self._opts_parser.add_subparsers(
             dest="_cmd",
@@ -122,26 +169,56 @@ class Nubia:
             builtin.Connect,
             builtin.Exit,
             builtin.Verbose,
+            builtin.Stats,
+            builtin.Perf,
+            builtin.DumpLog,
+            profiling.Profile,
+            profiling.Time,
             help.HelpCommand,
         ]
 
         listeners = self._plugin.get_listeners()
         self._registry = CommandsRegistry(cmd_parser, listeners)
+        self._registry.set_event_bus(
+            EventBus(self._options.event_queue_size, self._options.event_backpressure)
+        )
+        for subscriber in self._plugin.get_event_subscribers():
+            self._registry.event_bus.subscribe(*subscriber)
+        atexit.register(self._flush_events)
         self._ctx.set_registry(self._registry)
         self._registry.register_priority_listener(self._ctx)
+        self._registry.set_blacklist(self._blacklist)
+        self._registry.set_listener_init_workers(self._options.listener_init_workers)
+        self._registry.set_resources(ResourceManager(self._resource_lock_dir()))
+        self._registry.resources.register_all(self._plugin.get_resource_limits())
+        self._registry.metrics.enabled = self._options.metrics
+        if self._options.metrics and self._options.metrics_dump_path:
+            atexit.register(self._dump_metrics)
+        if self._options.slow_command_threshold is not None:
+            self._registry.set_watchdog(
+                SlowCommandWatchdog(
+                    self._options.slow_command_threshold,
+                    self._options.slow_command_profile_dir,
+                    self._options.slow_command_sample_interval,
+                )
+            )
+        if self._options.ui_latency_metrics:
+            self._registry.set_ui_monitor(
+                UILatencyMonitor(self._options.ui_latency_budget)
+            )
         # register built-in commands
-        for cmd in builtin_cmds:
-            self._registry.register_command(cmd())
+        self._registry.register_commands(cmd() for cmd in builtin_cmds)
 
         # load commands from plugin
-        for cmd in self._plugin.get_commands():
-            self._registry.register_command(cmd, override=True)
+        self._registry.register_commands(self._plugin.get_commands(), override=True)
         # load commands from command packages
         if not isinstance(self._command_pkgs, list):
             self._command_pkgs = [self._command_pkgs]
         for pkg in self._command_pkgs:
-            for cmd in cmdloader.load_commands(pkg):
-                self._registry.register_command(AutoCommand(cmd), override=True)
+            self._registry.register_commands(
+                (AutoCommand(cmd) for cmd in cmdloader.load_commands(pkg)),
+                override=True,
+            )
 
         # By default, if we didn't receive any command we will use the connect
         # command which drops us to an interactive mode.
@@ -159,8 +236,22 @@ class Nubia:
         else:
             logging_level = logging.WARN
 
+        if self._options.log_mode not in logger.LOG_MODES:
+            raise ValueError(
+                "Unknown log mode {!r}, expected one of {}".format(
+                    self._options.log_mode, ", ".join(logger.LOG_MODES)
+                )
+            )
+        handlers = []
+        if self._options.log_mode == logger.LOG_MODE_BUFFER:
+            # the buffer keeps the debug records whatever the verbosity, they
+            # are only written after failures
+            handlers.append(self._get_log_buffer())
+
         if args.stderr:
             logging_stream = sys.stderr
+        elif handlers:
+            logging_stream = None
         else:
             logging_stream = tempfile.NamedTemporaryFile(
                 mode="w+",  # default is 'w+b', oddly enough
@@ -169,7 +260,65 @@ class Nubia:
             )
             print("Logging to {}".format(logging_stream.name), file=sys.stderr)
 
-        logger.setup_logger(level=logging_level, stream=logging_stream)
+        logger.setup_logger(
+            level=logging_level,
+            stream=logging_stream,
+            log_format=self._options.log_format,
+            handlers=handlers,
+        )
+
+    def _resource_lock_dir(self):
+        """Where the limits of the resources are shared between processes"""
+        if not self._options.share_resource_limits:
+            return None
+        lock_dir = self._options.resource_lock_dir
+        if lock_dir is None and hasattr(os, "getuid"):
+            lock_dir = os.path.join(
+                tempfile.gettempdir(),
+                "{}-resources-{}".format(self._name, os.getuid()),
+            )
+        return lock_dir
+
+    def _get_log_buffer(self):
+        log_buffer = self._registry.log_buffer
+        if log_buffer is not None:
+            # run again in the same process, keep what was logged before
+            return log_buffer
+        options = self._options
+        log_dir = options.log_dir or os.path.expanduser(
+            "~/.{}_logs".format(self._name)
+        )
+        log_buffer = logger.RingBufferHandler(
+            options.log_buffer_size,
+            functools.partial(
+                logger.create_file_handler,
+                log_dir,
+                self._name,
+                max_bytes=options.log_max_bytes,
+                backup_count=options.log_backup_count,
+                retention_days=options.log_retention_days,
+                log_format=options.log_format,
+            ),
+        )
+        log_buffer.setLevel(logging.DEBUG)
+        self._registry.set_log_buffer(log_buffer)
+        return log_buffer
+
+    def _dump_log(self):
+        """Writes the logs kept in memory, if any, after a failure"""
+        log_buffer = self._registry.log_buffer
+        if log_buffer is not None:
+            logger.dump_after_failure(log_buffer)
+
+    def _flush_events(self):
+        if not self._registry.event_bus.flush(EXIT_FLUSH_TIMEOUT):
+            logging.warning("Some events were not delivered before exiting")
+
+    def _dump_metrics(self):
+        try:
+            self._registry.metrics.dump(self._options.metrics_dump_path)
+        except Exception as e:
+            print("Failed to dump metrics: {}".format(e), file=sys.stderr)
 
     def start_ipython(self, args):
         from nubia.internal.ipython import start_interactive_python
@@ -215,7 +364,7 @@ class Nubia:
             commands = sys.stdin.readlines()
             for command in commands:
                 # execute
-                print("> {}".format(command))
+                output.print("> {}".format(command))
                 ret = io_loop.parse_and_evaluate(sys.stdout, command)
                 # We fail execution on the first failing command
                 if ret:
@@ -242,18 +391,18 @@ class Nubia:
             # The argument validation will raise ArgsValidationError
             self._plugin.validate_args(args)
         except exceptions.ArgsValidationError as e:
-            cprint("Arguments validation error: {}".format(str(e)), "red")
+            output.error("Arguments validation error: {}".format(str(e)))
             return 1
         except Exception as e:
-            cprint(
+            output.error(
                 "An exception occurred while validating the command "
                 "arguments: {}".format(str(e)),
-                "red",
             )
             return 1
 
-    def run_cli(self, args):
-        catchall(self.usage_logger.pre_exec)
+    @_in_context
+    def run_cli(self, args, cli_args=None):
+        catchall(self.usage_logger.pre_exec_command, args._cmd, args, True)
         try:
             ret = self._blacklist.is_blacklisted(args._cmd)
             if ret:
@@ -264,14 +413,51 @@ class Nubia:
                 "all commands are available.\n"
                 "{}".format(str(e))
             )
-            cprint(err_message, "red")
+            output.error(err_message)
             logging.error(err_message)
         self._ctx.on_cli(args._cmd, args)
-        ret = self._registry.find_command(args._cmd).run_cli(args)
+        cmd_instance = self._registry.find_command(args._cmd)
+        metrics = self._registry.metrics
+        metrics_key = command_key(cmd_instance)
+        resources = cmd_instance.get_resources(args._cmd, args)
+        # the command line run, not necessarily the one of this process
+        raw = " ".join(sys.argv if cli_args is None else cli_args)
+        job_id = new_job_id()
+        events = self._registry.event_bus
+        start = time.perf_counter()
+        events.publish(CommandStarted(args._cmd, raw, job_id, False))
+        # reported if the command raises
+        ret = 1
+        try:
+            with self._registry.resources.acquire(resources) as grant:
+                if resources:
+                    metrics.record(metrics_key, "queue", grant.wait_time)
+                with logger.log_job(args._cmd, job_id):
+                    ret = cmd_instance.run_cli(args)
+            output.flush()
+        finally:
+            duration = time.perf_counter() - start
+            metrics.record_result(metrics_key, ret, duration)
+            events.publish(
+                CommandFinished(args._cmd, raw, job_id, False, ret, duration)
+            )
+        if resources:
+            catchall(
+                self.usage_logger.record_queue_wait,
+                args._cmd,
+                resources,
+                grant.wait_time,
+            )
         return ret
 
     def _pre_run(self, cli_args):
+        parse_start = time.perf_counter()
         args = self._parse_args(cli_args)
+        cmd_instance = self._registry.find_command(args._cmd)
+        if cmd_instance:
+            self._registry.metrics.record(
+                command_key(cmd_instance), "parse", time.perf_counter() - parse_start
+            )
         self._setup_logging(args)
         # check if we can add colors to sdout
         self._setup_terminal(args)
@@ -282,6 +468,28 @@ class Nubia:
         self._registry.set_cli_args(args)
         return args
 
+    def _completion_model_cache(self):
+        return CompletionModelCache(
+            self._options.completion_model_path,
+            self._options.completion_model_format,
+        )
+
+    def _refresh_completion_model(self):
+        command = self._options.completion_model_refresh_command or program_command()
+        if not command:
+            logging.debug("Cannot start the program to refresh the completion model")
+            return
+        try:
+            self._completion_model_cache().refresh_in_background(
+                self._plugin,
+                self._opts_parser,
+                self._registry,
+                list(command) + [REFRESH_FLAG],
+            )
+        except Exception as e:
+            logging.warning("Failed to refresh the completion model: %s", e)
+
+    @_in_context
     def run(self, cli_args=sys.argv, ipython=False):
         """
         Runs nubia either in interactive or cli (or parsing commands from
@@ -292,34 +500,56 @@ class Nubia:
         args = self._pre_run(cli_args)
 
         if args._print_completion_model:
-            from nubia.internal import registry_tools as regtools
-
             try:
                 data = regtools.export_registry(
-                    self._plugin, args, self._opts_parser, self._registry
+                    self._plugin,
+                    args,
+                    self._opts_parser,
+                    self._registry,
+                    args._completion_model_format,
                 )
-                print(data)
+                if isinstance(data, bytes):
+                    sys.stdout.flush()
+                    sys.stdout.buffer.write(data)
+                    sys.stdout.buffer.flush()
+                else:
+                    print(data)
                 return 0
             except Exception as e:
                 print("Failed to export model: {}".format(e), file=sys.stderr)
                 traceback.print_exc()
                 return 1
+        if args._refresh_completion_model:
+            if not self._options.completion_model_path:
+                print("No completion_model_path option is set", file=sys.stderr)
+                return 1
+            return self._completion_model_cache().refresh_detached(
+                self._plugin, self._opts_parser, self._registry
+            )
+        if self._options.completion_model_path:
+            self._refresh_completion_model()
         if ipython:
             return self.start_ipython(args)
         # by default, if no command is passed we will get 'connect'
         if args._cmd == "connect":
             return self.start_interactive(args)
         else:
-            ret = self.run_cli(args)
+            try:
+                ret = self.run_cli(args, cli_args)
+            except BaseException:
+                self._dump_log()
+                raise
             catchall(self.usage_logger.post_exec, args._cmd, cli_args, ret, True)
 
         if type(ret) is int:
-            return ret
-
-        if type(ret) is bool:
-            return int(not (ret))
-
-        if ret is None:
-            return 0
+            code = ret
+        elif type(ret) is bool:
+            code = int(not (ret))
+        elif ret is None:
+            code = 0
         else:
-            return 1
+            code = 1
+        if code:
+            # fan-out commands whose targets timed out fail too
+            self._dump_log()
+        return code
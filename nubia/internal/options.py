@@ -8,6 +8,7 @@
 #
 
 from dataclasses import dataclass
+from typing import List, Optional
 
 
 @dataclass
@@ -17,3 +18,87 @@ class Options:
     # File-based history is enabled by default. If this is set to false, we
     # fallback to the in-memory history.
     persistent_history: bool = True
+    # Backend of the persistent history: "sqlite" keeps every command once,
+    # in a database capped to `history_max_entries` entries and shared by
+    # concurrent shells, "file" appends every command to a text file and
+    # "memory" does not persist it
+    history_backend: str = "sqlite"
+    history_max_entries: int = 10000
+
+    # Records per-command and per-phase latencies, error counts and return
+    # codes, see the `:stats` command.
+    metrics: bool = False
+    # If set, the metrics are written to this file when the program exits,
+    # as JSON if the file name ends with .json or in the Prometheus text
+    # format otherwise.
+    metrics_dump_path: Optional[str] = None
+
+    # Commands running longer than this many seconds get their stack samples
+    # written to `slow_command_profile_dir` in the collapsed-stack format
+    # (flamegraph.pl, speedscope). None disables the watchdog.
+    slow_command_threshold: Optional[float] = None
+    # Defaults to the system temporary directory
+    slow_command_profile_dir: Optional[str] = None
+    # Seconds between two stack samples of a running command
+    slow_command_sample_interval: float = 0.01
+
+    # If set, the completion model read by `_nubia_complete` is kept at this
+    # path and regenerated in the background whenever the commands change.
+    completion_model_path: Optional[str] = None
+    # "json" or "indexed", see `nubia_complete`
+    completion_model_format: str = "json"
+    # The command line starting the program, run with
+    # `--_refresh-completion-model` appended to regenerate the model. Guessed
+    # from how the program was started (script, `python -m`, frozen binary)
+    # if not set.
+    completion_model_refresh_command: Optional[List[str]] = None
+
+    # Times the completion, lexing, status bar and prompt rendering of the
+    # interactive shell, see `:perf ui`. Calls slower than `ui_latency_budget`
+    # seconds are logged as warnings.
+    ui_latency_metrics: bool = False
+    ui_latency_budget: float = 0.016
+
+    # Seconds to wait for the user to stop typing before computing the
+    # completions of the interactive shell
+    completion_debounce: float = 0.05
+    # Seconds after which the toolbar shows a loading hint while completions
+    # are still being computed. None disables the hint.
+    completion_deadline: Optional[float] = 0.5
+
+    # Events (see `nubia.eventbus.EventBus`) waiting to be delivered to the
+    # subscribers, and what to do once that many are waiting: "drop" the new
+    # events or "block" the command publishing them until there is room
+    event_queue_size: int = 1024
+    event_backpressure: str = "drop"
+
+    # Listeners whose `on_connected` run at the same time when the shell
+    # connects, once the listeners they depend on (`Listener.depends_on`) are
+    # connected. 1 connects them one after the other. See `:perf startup`.
+    listener_init_workers: int = 1
+
+    # The limits of the shared resources (see
+    # `PluginInterface.get_resource_limits`) apply to all the processes of the
+    # program, every CLI invocation included, through lock files kept in
+    # `resource_lock_dir` (a directory of the system temporary directory by
+    # default). If False, they only apply within every process.
+    share_resource_limits: bool = True
+    resource_lock_dir: Optional[str] = None
+
+    # "text", or "json" to write the logs as JSON lines carrying the command
+    # and job id (see `nubia.eventbus.CommandStarted`) they were logged from
+    log_format: str = "text"
+
+    # Without --stderr, "tempfile" writes the logs of every run to a new
+    # temporary file. "buffer" keeps the last `log_buffer_size` records, of
+    # any level, in memory and appends them to `<log_dir>/<program>.log` only
+    # when a command fails or on `:dump-log`. `log_dir` defaults to `~/.<program>_logs`.
+    log_mode: str = "tempfile"
+    log_buffer_size: int = 10000
+    log_dir: Optional[str] = None
+    # The log file is rotated once it reaches `log_max_bytes`, keeping
+    # `log_backup_count` rotated files. Files of the log older than
+    # `log_retention_days` are deleted, None keeps them.
+    log_max_bytes: int = 10 * 1024 * 1024
+    log_backup_count: int = 5
+    log_retention_days: Optional[float] = 30
@@ -11,7 +11,10 @@ import argparse
 from typing import Any, List, MutableMapping, Tuple
 
 from nubia.internal.blackcmd import CommandBlacklist
-from nubia.internal.constants import DEFAULT_COMMAND_TIMEOUT
+from nubia.internal.constants import (
+    DEFAULT_COMMAND_TIMEOUT,
+    DEFAULT_FANOUT_ATONCE,
+)
 from nubia.internal.context import Context
 from nubia.internal.ui import statusbar
 
@@ -25,6 +28,16 @@ class CompletionDataSource:
         """
         return []
 
+    def get_completions(self, prefix):
+        """
+        Returns the values starting with `prefix` (case-insensitive)
+        """
+        prefix = prefix.lower()
+        return [v for v in self.get_all() if str(v).lower().startswith(prefix)]
+
+    def __contains__(self, value):
+        return value in self.get_all()
+
 
 class PluginInterface:
     """
@@ -109,11 +122,46 @@ class PluginInterface:
             default=DEFAULT_COMMAND_TIMEOUT,
             help="Timeout for commands (default %ds)" % DEFAULT_COMMAND_TIMEOUT,
         )
+        opts_parser.add_argument(
+            "--atonce",
+            required=False,
+            type=int,
+            default=DEFAULT_FANOUT_ATONCE,
+            help="Maximum number of targets a fan-out command runs against "
+            "concurrently (default %d)" % DEFAULT_FANOUT_ATONCE,
+        )
         return opts_parser
 
+    def get_resource_limits(self):
+        """
+        Override this and return a dict that maps resource names (as used in
+        `@command(resources=...)`) to `ResourceLimit` objects. Commands using
+        a resource wait until it has enough capacity before they run.
+        """
+        return {}
+
+    def get_event_subscribers(self):
+        """
+        Override this and return (callback, event types) pairs, the callbacks
+        are called with the events of these types (see `nubia.eventbus`) on
+        a background thread
+        """
+        return []
+
     def get_completion_datasource_for_global_argument(self, name):
         return None
 
+    def get_completion_values_hook(self):
+        """
+        Override this and return a "package.module:function" string to let
+        the external shell completer (`_nubia_complete`) fetch the values of
+        dynamic options itself. The function is called with the key of the
+        option (e.g. "--config" or "my-command --host") and must return a
+        list of values. Keep its module light, it is imported by the completer
+        without loading the rest of your program.
+        """
+        return None
+
     def get_status_bar(self, context):
         return statusbar.StatusBar(context)
 
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+import bisect
+from typing import Iterable, List, Tuple
+
+from prompt_toolkit.completion import Completer, Completion
+
+# maximum number of fuzzy suggestions returned when nothing matches the prefix
+FUZZY_LIMIT = 20
+
+
+class PrefixIndex:
+    """
+    A case-insensitive index of words, kept as a sorted array so that all the
+    words starting with a prefix are found by bisection. Every word can carry
+    a `meta` object (e.g. the help message shown next to the completion).
+    """
+
+    def __init__(self, words: Iterable[Tuple[str, object]] = ()):
+        # sorted (lowercased word, word) pairs
+        self._entries = []
+        self._meta = {}
+        self.update(words)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, word):
+        return word in self._meta
+
+    def __iter__(self):
+        return (word for _, word in self._entries)
+
+    def add(self, word: str, meta=None):
+        """Adds a single word, prefer `update` to add words in bulk"""
+        if word not in self._meta:
+            bisect.insort(self._entries, (word.lower(), word))
+        self._meta[word] = meta
+
+    def update(self, words: Iterable[Tuple[str, object]]):
+        """Adds (word, meta) pairs, sorting the index only once"""
+        added = False
+        for word, meta in words:
+            if word not in self._meta:
+                self._entries.append((word.lower(), word))
+                added = True
+            self._meta[word] = meta
+        if added:
+            self._entries.sort()
+
+    def meta(self, word):
+        return self._meta.get(word)
+
+    def with_prefix(self, prefix: str) -> List[str]:
+        """Returns the words starting with `prefix`, in sorted order"""
+        prefix = prefix.lower()
+        output = []
+        for index in range(bisect.bisect_left(self._entries, (prefix,)), len(self)):
+            key, word = self._entries[index]
+            if not key.startswith(prefix):
+                break
+            output.append(word)
+        return output
+
+    def fuzzy(self, text: str, limit: int = FUZZY_LIMIT) -> List[str]:
+        """
+        Returns the words containing all the characters of `text` in order,
+        the most compact and earliest matches first
+        """
+        text = text.lower()
+        ranked = []
+        for key, word in self._entries:
+            start = key.find(text[0]) if text else 0
+            if start < 0:
+                continue
+            end = start
+            for char in text[1:]:
+                end = key.find(char, end + 1)
+                if end < 0:
+                    break
+            else:
+                ranked.append((end - start, start, len(key), word))
+        ranked.sort()
+        return [word for _, _, _, word in ranked[:limit]]
+
+
+class PrefixCompleter(Completer):
+    """
+    Completes the text before the cursor (as a whole, like a `WordCompleter`
+    with `sentence=True`) with the words of a `PrefixIndex`, falling back to
+    fuzzy matches when no word starts with it
+    """
+
+    def __init__(self, index: PrefixIndex, fuzzy: bool = True):
+        self._index = index
+        self._fuzzy = fuzzy
+
+    @property
+    def index(self) -> PrefixIndex:
+        return self._index
+
+    def get_completions(self, document, complete_event):
+        text = document.text_before_cursor
+        words = self._index.with_prefix(text)
+        if not words and text and self._fuzzy:
+            words = self._index.fuzzy(text)
+        for word in words:
+            yield Completion(
+                word, start_position=-len(text), display_meta=self._index.meta(word)
+            )
@@ -7,14 +7,18 @@
 # LICENSE file in the root directory of this source tree.
 #
 
-import jellyfish
+from collections import Counter
 
+from nubia.internal.bktree import BKTree, did_you_mean, suggest
 from nubia.internal.cmdbase import Command
-from nubia.internal.io.eventbus import Listener
+from nubia.internal.help_index import HelpIndex
+from nubia.internal.io.connect import connect_listeners
+from nubia.internal.io.eventbus import EventBus, Listener, Message
+from nubia.internal.metrics import MetricsCollector
+from nubia.internal.prefix_index import PrefixCompleter, PrefixIndex
+from nubia.internal.resources import ResourceManager
 
-from prompt_toolkit.completion import WordCompleter
-
-from termcolor import cprint
+from nubia.internal.io import output
 
 
 class CommandsRegistry:
@@ -25,18 +29,63 @@ class CommandsRegistry:
     """
 
     def __init__(self, parser, listeners):
-        self._completer = WordCompleter([], ignore_case=True, sentence=True)
+        # bumped whenever commands are registered
+        self._version = 0
+        # command names and their help, used for completion
+        self._index = PrefixIndex()
+        self._completer = PrefixCompleter(self._index)
+        # help messages of the commands, searched by `help`
+        self._help_index = HelpIndex()
+        # command names and aliases, used to suggest close names
+        self._names_tree = BKTree()
+        # how many times every command name was run, to rank suggestions
+        self._usage = Counter()
         # maps a command to Command Instance
         self._cmd_instance_map = {}
         # objects interested in receiving messages
         self._listeners = []
+        # the listeners connected before all the others
+        self._priority_listeners = []
+        # on_connected callbacks of the listeners running at the same time
+        self._listener_init_workers = 1
+        # delivers the events of the commands to their subscribers
+        self._event_bus = EventBus()
         # argparser so each command can add its options
         self._parser = parser
+        # quotas and rate limits of the resources used by commands
+        self._resources = ResourceManager()
+        # latency metrics of the commands, disabled by default
+        self._metrics = MetricsCollector()
+        self._blacklist = None
+        # records kept in memory, see Options.log_mode
+        self._log_buffer = None
+        # the loop of the interactive shell, None in CLI mode
+        self._io_loop = None
+        # captures the stacks of slow commands, disabled by default
+        self._watchdog = None
+        # times the UI hooks of the interactive shell, disabled by default
+        self._ui_monitor = None
 
         for lst in listeners:
             self.register_listener(lst(self))
 
     def register_command(self, cmd_instance, override=False):
+        self._index.update(self._register(cmd_instance, override))
+        self._version += 1
+
+    def register_commands(self, cmd_instances, override=False):
+        """
+        Registers many commands at once, the completion index is only updated
+        once all of them are registered
+        """
+        words = []
+        for cmd_instance in cmd_instances:
+            words.extend(self._register(cmd_instance, override))
+        self._index.update(words)
+        self._version += 1
+
+    def _register(self, cmd_instance, override):
+        """Registers a command, returns its (name, help) index entries"""
         if not isinstance(cmd_instance, Command):
             raise TypeError(
                 "Invalid command instance, must be an instance of "
@@ -47,16 +96,15 @@ class CommandsRegistry:
         cmd_keys = cmd_instance.get_command_names()
         for cmd in cmd_keys:
             if not cmd_instance.get_help(cmd):
-                cprint(
+                output.error(
                     (
                         "[WARNING] The command {} will not be loaded. "
                         "Please provide a help message by either defining a "
                         "docstring or filling the help argument in the "
                         "@command annotation"
                     ).format(cmd_keys[0]),
-                    "red",
                 )
-                return None
+                return []
 
         cmd_instance.add_arguments(self._parser)
 
@@ -73,15 +121,19 @@ class CommandsRegistry:
         if isinstance(cmd_instance, Listener):
             self._listeners.append(cmd_instance)
 
+        words = []
         for cmd in cmd_keys:
             self._cmd_instance_map[cmd.lower()] = cmd_instance
-            if cmd not in self._completer.words:
-                self._completer.words.append(cmd)
-                self._completer.meta_dict[cmd] = cmd_instance.get_help(cmd)
+            self._names_tree.add(cmd.lower())
+            self._help_index.add(cmd, cmd_instance)
+            if cmd not in self._index:
+                words.append((cmd, cmd_instance.get_help(cmd)))
 
         aliases = cmd_instance.get_cli_aliases()
         for alias in aliases:
             self._cmd_instance_map[alias.lower()] = cmd_instance
+            self._names_tree.add(alias.lower())
+        return words
 
     def register_priority_listener(self, instance):
         """
@@ -90,6 +142,7 @@ class CommandsRegistry:
         if not isinstance(instance, Listener):
             raise TypeError("Only Listeners can be registered")
         self._listeners.insert(0, instance)
+        self._priority_listeners.append(instance)
 
     def register_listener(self, instance):
         if not isinstance(instance, Listener):
@@ -99,6 +152,80 @@ class CommandsRegistry:
     def __contains__(self, cmd):
         return cmd.lower() in self._cmd_instance_map
 
+    @property
+    def version(self):
+        """A counter bumped whenever commands are registered"""
+        return self._version
+
+    @property
+    def help_index(self):
+        return self._help_index
+
+    @property
+    def resources(self):
+        return self._resources
+
+    def set_resources(self, resources):
+        self._resources = resources
+
+    @property
+    def metrics(self):
+        return self._metrics
+
+    @property
+    def event_bus(self):
+        return self._event_bus
+
+    def set_event_bus(self, event_bus):
+        self._event_bus = event_bus
+
+    @property
+    def watchdog(self):
+        return self._watchdog
+
+    def set_watchdog(self, watchdog):
+        self._watchdog = watchdog
+
+    @property
+    def ui_monitor(self):
+        return self._ui_monitor
+
+    def set_ui_monitor(self, monitor):
+        self._ui_monitor = monitor
+
+    @property
+    def listeners(self):
+        return list(self._listeners)
+
+    def set_listener_init_workers(self, workers):
+        self._listener_init_workers = workers
+
+    @property
+    def io_loop(self):
+        return self._io_loop
+
+    def set_io_loop(self, io_loop):
+        self._io_loop = io_loop
+
+    @property
+    def log_buffer(self):
+        return self._log_buffer
+
+    def set_log_buffer(self, log_buffer):
+        self._log_buffer = log_buffer
+
+    def set_blacklist(self, blacklist):
+        self._blacklist = blacklist
+
+    def is_blacklisted(self, cmd):
+        """
+        Returns the blacklist verdict for the command, anything other than 0
+        means that the command must not be executed
+        """
+        if self._blacklist is None:
+            return 0
+        return self._blacklist.is_blacklisted(cmd)
+
     def get_completer(self):
         return self._completer
 
@@ -108,30 +235,35 @@ class CommandsRegistry:
     def find_command(self, cmd):
         return self._cmd_instance_map.get(cmd.lower())
 
+    def record_usage(self, cmd):
+        """Counts a run of `cmd`, frequently used commands are suggested first"""
+        self._usage[cmd.lower()] += 1
+
+    def suggest(self, command):
+        """Returns the names closest to the passed command, the best first"""
+        return suggest(
+            [self._names_tree], str(command).lower(), usage=self._usage.__getitem__
+        )
+
     def find_approx(self, command) -> str:
         """Finds the closest command to the passed cmd, this is used in case we
         cannot find an exact match for the cmd
         """
-        def are_close_enough(this, that):
-            return jellyfish.damerau_levenshtein_distance(this, that) <= 2
-
-        suggestions = [
-            another_command
-            for another_command in self._cmd_instance_map
-            if are_close_enough(str(command), str(another_command))
-        ]
-
-        if not suggestions:
-            return ""
-        elif len(suggestions) == 1:
-            return f" Did you mean {suggestions[0]}?"
-        else:
-            return f" Did you mean {', '.join(suggestions[:-1])} or {suggestions[-1]}?"
+        return did_you_mean(self.suggest(command))
 
     def get_completions(self, document, complete_event):
         return self._completer.get_completions(document, complete_event)
 
     def dispatch_message(self, msg, *args, **kwargs):
+        if msg == Message.CONNECTED:
+            connect_listeners(
+                self._listeners,
+                args,
+                kwargs,
+                workers=self._listener_init_workers,
+                priority=self._priority_listeners,
+            )
+            return
         for mod in self._listeners:
             mod.react(msg, *args, **kwargs)
 
@@ -11,12 +11,19 @@ import json
 import logging
 from argparse import _SubParsersAction
 
+from nubia.internal.datasource import is_data_source
 from nubia.internal.typing import Command, FunctionInspection
 from nubia.internal.typing.argparse import transform_argument_name
+from nubia_complete import indexed_model
 
 
 logger = logging.getLogger(__name__)
 
+MODEL_FORMAT_JSON = "json"
+# memory-mappable format with per-command shards, see nubia_complete
+MODEL_FORMAT_INDEXED = "indexed"
+MODEL_FORMATS = (MODEL_FORMAT_JSON, MODEL_FORMAT_INDEXED)
+
 
 def _dump_command(cmd):
     assert isinstance(cmd, Command)
@@ -26,34 +33,44 @@ def _dump_command(cmd):
     }
 
 
-def _dump_arguments(arguments):
+def _dump_values(source, key, with_hook):
+    if is_data_source(source):
+        # with a hook the completer fetches the values itself, otherwise we
+        # have to take a snapshot
+        return {
+            "values": None if with_hook else source.get_all(),
+            "dynamic": key,
+        }
+    return {"values": list(source) if source else None}
+
+
+def _dump_arguments(arguments, path, with_hook):
     output = {"options": [], "positionals": []}
     for arg in arguments.values():
+        name = transform_argument_name(arg.name)
+        values = _dump_values(
+            arg.completer or arg.choices, " ".join(path + [name]), with_hook
+        )
         if arg.positional:
-            output["positionals"].append(
-                {
-                    "name": transform_argument_name(arg.name),
-                    "values": list(arg.choices) if arg.choices else None,
-                }
-            )
+            output["positionals"].append({"name": name, **values})
         else:
             output["options"].append(
                 {
-                    "name": transform_argument_name(arg.name),
+                    "name": name,
                     "extra_names": list(map(transform_argument_name, arg.extra_names)),
                     "expects_argument": not (
                         arg.type == bool or arg.default_value is False
                     ),
                     "default": arg.default_value,
                     "required": not arg.default_value_set,
-                    "values": list(arg.choices) if arg.choices else None,
+                    **values,
                 }
             )
     return output
 
 
-def _dump_subcommands(subcommands):
-    return [_fn_to_dict(cmd) for _, cmd in subcommands]
+def _dump_subcommands(subcommands, path, with_hook):
+    return [_fn_to_dict(cmd, path, with_hook) for _, cmd in subcommands]
 
 
 def _dump_opts_parser_common(opts_parser, plugin):
@@ -83,35 +100,74 @@ def _dump_opts_parser_common(opts_parser, plugin):
         if option_name:
             ds = plugin.get_completion_datasource_for_global_argument(option_name)
             if ds:
-                option["values"] = ds.get_all()
+                # values may change after the model is exported, static
+                # completers must defer to the Python completer for these
+                option["dynamic"] = option_name
+                if not plugin.get_completion_values_hook():
+                    option["values"] = ds.get_all()
         output.append(option)
     return output
 
 
-def _fn_to_dict(inspection):
+def _fn_to_dict(inspection, path=(), with_hook=False):
     cmd = _dump_command(inspection.command)
-    cmd.update(_dump_arguments(inspection.arguments))
+    path = list(path) + [cmd["name"]]
+    cmd.update(_dump_arguments(inspection.arguments, path, with_hook))
     if inspection.subcommands:
-        cmd["commands"] = _dump_subcommands(inspection.subcommands)
+        cmd["commands"] = _dump_subcommands(inspection.subcommands, path, with_hook)
     return cmd
 
 
-def export_registry(plugin, args, opts_parser, registry):
-    cmds = registry.get_all_commands()
-    commands = []
-    for cmd in cmds:
+def exportable_commands(registry):
+    """The commands (excluding built-ins) that are part of the command model"""
+    for cmd in registry.get_all_commands():
         if cmd.built_in:
             continue
-        inspection = cmd.metadata
-        if isinstance(inspection, FunctionInspection):
-            commands.append(_fn_to_dict(inspection))
+        if isinstance(cmd.metadata, FunctionInspection):
+            yield cmd
         else:
             logger.warning("Command %s is not instance of FunctionInspection", cmd)
 
-    model = {
+
+def build_model(
+    plugin, opts_parser, registry, cached_commands=None, cached_options=None
+):
+    """
+    Builds the command model. Entries found in `cached_commands` (keyed by
+    command name) and `cached_options` are reused as they are instead of
+    being built again.
+    """
+    cached_commands = cached_commands or {}
+    hook = plugin.get_completion_values_hook()
+    commands = []
+    for cmd in exportable_commands(registry):
+        entry = cached_commands.get(cmd.metadata.command.name)
+        if entry is None:
+            entry = _fn_to_dict(cmd.metadata, with_hook=bool(hook))
+        commands.append(entry)
+
+    if cached_options is None:
+        cached_options = _dump_opts_parser_common(opts_parser, plugin)
+    return {
         "commands": commands,
         # This will include the shell top-level options, this will be included
         # in a future diff
-        "options": _dump_opts_parser_common(opts_parser, plugin),
+        "options": cached_options,
+        # called by the completer to fetch the values of dynamic options
+        "values_hook": hook,
     }
+
+
+def serialize_model(model, format=MODEL_FORMAT_JSON):
+    """Returns a string for the JSON format and bytes for the indexed one"""
+    if format == MODEL_FORMAT_INDEXED:
+        return indexed_model.dumps(model)
     return json.dumps(model)
+
+
+def export_registry(plugin, args, opts_parser, registry, format=MODEL_FORMAT_JSON):
+    """
+    Exports the command model used by the shell completer, returns a string
+    for the JSON format and bytes for the indexed format
+    """
+    return serialize_model(build_model(plugin, opts_parser, registry), format)
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+"""
+Per-resource concurrency quotas and rate limits.
+
+Commands declare the resources they use through `@command(resources=...)`
+and the plugin registers the limits of every resource through
+`PluginInterface.get_resource_limits`. Before running a command the
+dispatcher acquires all of its resources, waiting for a free slot in the
+concurrency quota and for enough tokens in the rate limiter.
+
+The limits are enforced across fan-out workers, threads issuing commands
+and, when the manager has a lock directory, across every process of the
+program: quotas are then held as `fcntl` locks on slot files and rate
+limiters keep their state in a locked file. Without `fcntl` (on Windows) the
+limits only apply within a process.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Mapping, Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# seconds between two attempts to take the lock files of a shared quota
+POLL_INTERVAL = 0.01
+_unsafe_chars = re.compile(r"[^\w.-]")
+
+
+@dataclass
+class ResourceLimit:
+    """Limits applied to a shared resource"""
+
+    # Maximum number of units held concurrently, None means unlimited
+    capacity: Optional[int] = None
+    # Units granted per second, None means no rate limiting
+    rate: Optional[float] = None
+    # Maximum number of units that can be granted in a burst, defaults to
+    # one second worth of units
+    burst: Optional[int] = None
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket refilled at `rate` tokens per second and
+    holding at most `burst` tokens
+    """
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        if rate <= 0:
+            raise ValueError("rate must be a positive number")
+        self._rate = rate
+        self._burst = burst or max(1, int(rate))
+        self._tokens = float(self._burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def burst(self) -> int:
+        return self._burst
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self._burst, self._tokens + (now - self._last) * self._rate
+        )
+        self._last = now
+
+    def acquire(self, amount: int = 1):
+        if amount > self._burst:
+            raise ValueError(
+                "Cannot acquire {} tokens from a bucket holding at most "
+                "{}".format(amount, self._burst)
+            )
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                missing = amount - self._tokens
+            time.sleep(missing / self._rate)
+
+
+class Quota:
+    """A counting semaphore where every acquisition can take several units"""
+
+    def __init__(self, capacity: int):
+        if capacity <= 0:
+            raise ValueError("capacity must be a positive number")
+        self._capacity = capacity
+        self._available = capacity
+        self._condition = threading.Condition()
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def acquire(self, amount: int = 1):
+        """Returns what `release` takes to give the units back"""
+        if amount > self._capacity:
+            raise ValueError(
+                "Cannot acquire {} units from a quota of {}".format(
+                    amount, self._capacity
+                )
+            )
+        with self._condition:
+            while self._available < amount:
+                self._condition.wait()
+            self._available -= amount
+        return amount
+
+    def release(self, amount: int = 1):
+        with self._condition:
+            self._available += amount
+            self._condition.notify_all()
+
+
+class SharedQuota:
+    """
+    A quota shared by the processes using the same `path`: each of its
+    `capacity` units is a lock file, held with `fcntl.flock`. Locks die with
+    the process holding them, a crashed process does not leak units.
+    """
+
+    def __init__(self, path: str, capacity: int):
+        if capacity <= 0:
+            raise ValueError("capacity must be a positive number")
+        self._capacity = capacity
+        self._paths = ["{}.{}.lock".format(path, slot) for slot in range(capacity)]
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def _try_acquire(self, amount):
+        held = []
+        for path in self._paths:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            held.append(fd)
+            if len(held) == amount:
+                return held
+        # not enough free units, give back the partial grant so that two
+        # waiters never hold part of what the other needs
+        self.release(held)
+        return None
+
+    def acquire(self, amount: int = 1):
+        """Returns the locked files, to pass to `release`"""
+        if amount > self._capacity:
+            raise ValueError(
+                "Cannot acquire {} units from a quota of {}".format(
+                    amount, self._capacity
+                )
+            )
+        while True:
+            held = self._try_acquire(amount)
+            if held is not None:
+                return held
+            time.sleep(POLL_INTERVAL)
+
+    def release(self, held):
+        for fd in held:
+            # closing the file releases its lock
+            os.close(fd)
+
+
+class SharedTokenBucket:
+    """
+    A token bucket shared by the processes using the same `path`, which
+    holds its state (the tokens left and when they were counted)
+    """
+
+    def __init__(self, path: str, rate: float, burst: Optional[int] = None):
+        if rate <= 0:
+            raise ValueError("rate must be a positive number")
+        self._path = path + ".bucket"
+        self._rate = rate
+        self._burst = burst or max(1, int(rate))
+
+    @property
+    def burst(self) -> int:
+        return self._burst
+
+    def _take(self, amount):
+        """Takes `amount` tokens, returns how many were missing"""
+        fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            # wall clock time, monotonic clocks are not shared by processes
+            now = time.time()
+            try:
+                tokens, last = map(float, os.read(fd, 64).split())
+            except ValueError:
+                # created just now
+                tokens, last = self._burst, now
+            tokens = min(self._burst, tokens + max(now - last, 0) * self._rate)
+            missing = max(amount - tokens, 0)
+            if not missing:
+                tokens -= amount
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, "{!r} {!r}".format(tokens, now).encode())
+            return missing
+        finally:
+            os.close(fd)
+
+    def acquire(self, amount: int = 1):
+        if amount > self._burst:
+            raise ValueError(
+                "Cannot acquire {} tokens from a bucket holding at most "
+                "{}".format(amount, self._burst)
+            )
+        while True:
+            missing = self._take(amount)
+            if not missing:
+                return
+            time.sleep(missing / self._rate)
+
+
+class ResourceGrant:
+    """Describes a successful acquisition of resources"""
+
+    def __init__(self, resources: Mapping[str, int]):
+        self.resources = dict(resources)
+        # seconds spent waiting in the queues of the resources
+        self.wait_time = 0.0
+
+
+class ResourceManager:
+    """
+    Holds the quotas and rate limiters of all the registered resources. They
+    are shared with the other processes using the same `lock_dir`, if set.
+    """
+
+    def __init__(self, lock_dir: Optional[str] = None):
+        self._quotas = {}
+        self._buckets = {}
+        if lock_dir is not None and fcntl is None:
+            logger.warning(
+                "Resource limits cannot be shared between processes on this "
+                "platform, they only apply within this process"
+            )
+            lock_dir = None
+        self._lock_dir = lock_dir
+
+    def register(self, name: str, limit: ResourceLimit):
+        if self._lock_dir is None:
+            if limit.capacity is not None:
+                self._quotas[name] = Quota(limit.capacity)
+            if limit.rate is not None:
+                self._buckets[name] = TokenBucket(limit.rate, limit.burst)
+            return
+        os.makedirs(self._lock_dir, mode=0o700, exist_ok=True)
+        path = os.path.join(self._lock_dir, _unsafe_chars.sub("_", name))
+        if limit.capacity is not None:
+            self._quotas[name] = SharedQuota(path, limit.capacity)
+        if limit.rate is not None:
+            self._buckets[name] = SharedTokenBucket(path, limit.rate, limit.burst)
+
+    def register_all(self, limits: Mapping[str, ResourceLimit]):
+        for name, limit in limits.items():
+            self.register(name, limit)
+
+    @contextmanager
+    def acquire(self, resources: Mapping[str, int]):
+        """
+        Blocks until all the requested resources are available and releases
+        them when the block exits. Resources are always acquired in the same
+        (sorted) order to avoid deadlocks between commands.
+        """
+        grant = ResourceGrant(resources)
+        if not resources:
+            yield grant
+            return
+        acquired = []
+        start = time.monotonic()
+        try:
+            for name in sorted(resources):
+                amount = resources[name]
+                quota = self._quotas.get(name)
+                if quota:
+                    acquired.append((quota, quota.acquire(amount)))
+                bucket = self._buckets.get(name)
+                if bucket:
+                    bucket.acquire(amount)
+            grant.wait_time = time.monotonic() - start
+            logger.debug(
+                "Acquired resources %s after %.3fs", resources, grant.wait_time
+            )
+            yield grant
+        finally:
+            for quota, held in reversed(acquired):
+                quota.release(held)
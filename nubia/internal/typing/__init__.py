@@ -65,7 +65,7 @@ from collections.abc import Container
 from functools import partial
 from inspect import ismethod, isclass
 
-from termcolor import cprint
+from nubia.internal.io import output
 
 from nubia.internal.helpers import (
     get_arg_spec,
@@ -79,16 +79,19 @@ Argument = namedtuple(
     "Argument",
     "arg description type "
     "default_value_set default_value "
-    "name extra_names positional choices",
+    "name extra_names positional choices completer",
 )
 
-Command = namedtuple("Command", "name help aliases exclusive_arguments")
+Command = namedtuple(
+    "Command", "name help aliases exclusive_arguments fanout resources"
+)
 
 FunctionInspection = namedtuple(
     "FunctionInspection", "arguments " "command subcommands"
 )
 _ArgDecoratorSpec = namedtuple(
-    "_ArgDecoratorSpec", "arg name aliases description positional choices"
+    "_ArgDecoratorSpec",
+    "arg name aliases description positional choices completer",
 )
 
 
@@ -100,6 +103,7 @@ def _empty_arg_decorator_spec(arg):
         description=None,
         positional=False,
         choices=None,
+        completer=None,
     )
 
 
@@ -121,10 +125,15 @@ def argument(
     aliases=None,
     positional=False,
     choices=None,
+    completer=None,
 ):
     """
     Annotation decorator to specify metadata for an argument
 
+    `choices` restricts the accepted values and `completer` only suggests
+    values, both accept a list or a `CompletionDataSource` whose values are
+    fetched when needed (see `CachedCompletionDataSource`).
+
     Check the module documentation for more info and tests.py in this module
     for usage examples
     """
@@ -186,6 +195,7 @@ def argument(
             aliases=aliases or [],
             positional=positional,
             choices=choices or [],
+            completer=completer,
         )
 
         return function
@@ -194,22 +204,37 @@ def argument(
 
 
 def command(
-    name_or_function=None, help=None, aliases=None, exclusive_arguments=None
+    name_or_function=None,
+    help=None,
+    aliases=None,
+    exclusive_arguments=None,
+    fanout=None,
+    resources=None,
 ):
     """
     Annotation decorator to specify that a function or method is a command
     that should be exported by nubia
 
+    `fanout` names a list argument of the command. When set, the command body
+    is executed once per element of that list (with bounded concurrency, see
+    `nubia.internal.fanout`) instead of once with the whole list
+
     Check the module documentation for more info and tests.py in this module
     for usage examples
     """
 
     def decorator(function, name=None):
-        is_supercommand = isclass(name_or_function)
+        is_supercommand = isclass(function)
         exclusive_arguments_ = _normalize_exclusive_arguments(
             exclusive_arguments
         )
         _validate_exclusive_arguments(function, exclusive_arguments_)
+        if fanout and fanout not in (get_arg_spec(function).args or []):
+            raise NameError(
+                "Fan-out argument {} does not exist in function {}".format(
+                    fanout, function_to_str(function)
+                )
+            )
 
         _init_attr(function, "__command", {})
         if name:
@@ -223,6 +248,8 @@ def command(
         function.__command["help"] = help
         function.__command["aliases"] = aliases or []
         function.__command["exclusive_arguments"] = exclusive_arguments_
+        function.__command["fanout"] = fanout
+        function.__command["resources"] = _normalize_resources(resources)
         return function
 
     # Allows the decorator to be used directly (`@command`) or as a
@@ -263,6 +290,8 @@ def inspect_object(obj, accept_bound_methods=False):
             help=command["help"] or obj.__doc__,
             aliases=command["aliases"],
             exclusive_arguments=command["exclusive_arguments"],
+            fanout=command.get("fanout"),
+            resources=command.get("resources") or {},
         )
 
     # Is this a super command?
@@ -302,6 +331,7 @@ def inspect_object(obj, accept_bound_methods=False):
             extra_names=arg_decor_spec.aliases,
             positional=arg_decor_spec.positional,
             choices=arg_decor_spec.choices,
+            completer=arg_decor_spec.completer,
         )
     if argspec.varkw:
         # We will inject all the arguments that are not defined explicitly in
@@ -320,6 +350,7 @@ def inspect_object(obj, accept_bound_methods=False):
                     extra_names=arg_decor_spec.aliases,
                     positional=arg_decor_spec.positional,
                     choices=arg_decor_spec.choices,
+                    completer=arg_decor_spec.completer,
                 )
 
     # Super Command Support
@@ -335,7 +366,7 @@ def inspect_object(obj, accept_bound_methods=False):
             # ignore subcommands without docstring
             if metadata.command:
                 if not metadata.command.help:
-                    cprint(
+                    output.error(
                         (f"[WARNING] The sub-command {metadata.command.name} "
                          "will not be loaded. "
                          "Please provide a help message by either defining a "
@@ -387,6 +418,23 @@ def _normalize_exclusive_arguments(exclusive_arguments):
     return tuple(tuple(group) for group in exclusive_arguments)
 
 
+def _normalize_resources(resources):
+    """
+    Guarantees that resources is a dict mapping resource names to a positive
+    number of units
+    """
+    if not resources:
+        return {}
+    if not all(
+        isinstance(name, str) and isinstance(units, int) and units > 0
+        for name, units in dict(resources).items()
+    ):
+        raise ValueError(
+            "resources must map resource names to a positive number of units"
+        )
+    return dict(resources)
+
+
 def _validate_exclusive_arguments(function, normalized_exclusive_arguments):
     if not normalized_exclusive_arguments:
         return
@@ -9,14 +9,11 @@
 
 import argparse
 import copy
-import os
-import shutil
-import subprocess
-import sys
 from collections import defaultdict
 from functools import partial
 from typing import Any, Dict, List, Tuple  # noqa F401
 
+from nubia.internal.datasource import is_data_source
 from nubia.internal.typing.builder import (
     build_value,
     get_dict_kv_arg_type_as_str,
@@ -28,6 +25,7 @@ from nubia.internal.typing.inspect import (
     is_mapping_type,
     is_optional_type,
 )
+from nubia.internal.ui.pager import page
 
 from . import command, inspect_object, transform_name
 
@@ -222,7 +220,11 @@ def _argument_to_argparse_input(arg):
     else:
         add_argument_kwargs["type"] = argument_type
 
-    if arg.choices:
+    if is_data_source(arg.choices):
+        # argparse would fetch every value to render the help and its errors,
+        # AutoCommand validates these choices instead
+        add_argument_kwargs.setdefault("metavar", arg.arg.upper())
+    elif arg.choices:
         add_argument_kwargs["choices"] = arg.choices
         add_argument_kwargs["metavar"] = "{{{}}}".format(
             ",".join(map(str, arg.choices))
@@ -313,7 +315,7 @@ def _parse_dict(target_type):
 
 
 class NubiaHelpAction(argparse.Action):
-    """An action that pipes help message to the pager."""
+    """An action that shows the help message in the pager."""
 
     def __init__(
         self,
@@ -331,13 +333,5 @@ class NubiaHelpAction(argparse.Action):
         )
 
     def __call__(self, parser, namespace, values, option_string=None):
-        help_message = parser.format_help()
-        help_message_length = len(help_message.split("\n"))
-        _, rows = shutil.get_terminal_size()
-        fits_one_page = help_message_length <= rows
-        if sys.stdout.isatty() and not fits_one_page:
-            pager = os.environ.get("PAGER", "less")
-            subprocess.run([pager], input=help_message.encode())
-        else:  # fallback
-            parser.print_help()
+        page(parser.format_help())
         parser.exit()
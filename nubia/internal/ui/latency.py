@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+"""
+Latency of the hooks that run while the user types in the interactive shell
+(completion, lexing, status bar and prompt rendering).
+
+Every call is timed and recorded, per hook and per command being typed, into
+the histograms of the command metrics. Only the recent calls are reported:
+samples are kept in two windows of `window` seconds, the current one and the
+previous one. Calls slower than the budget (a frame at 60Hz by default) are
+logged as they happen.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from prompt_toolkit.lexers import Lexer
+
+from nubia.internal.metrics import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+HOOK_COMPLETION = "completion"
+HOOK_LEXER = "lexer"
+HOOK_TOOLBAR = "toolbar"
+HOOK_RPROMPT = "rprompt"
+HOOK_PROMPT = "prompt"
+
+DEFAULT_BUDGET = 0.016
+DEFAULT_WINDOW = 300
+
+
+class _Window:
+    __slots__ = ("histogram", "over_budget")
+
+    def __init__(self):
+        self.histogram = LatencyHistogram()
+        self.over_budget = 0
+
+
+class _Timer:
+    __slots__ = ("_monitor", "_hook", "_command", "_start")
+
+    def __init__(self, monitor, hook, command):
+        self._monitor = monitor
+        self._hook = hook
+        self._command = command
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._monitor.record(
+            self._hook, self._command, time.perf_counter() - self._start
+        )
+
+
+class UILatencyMonitor:
+    def __init__(self, budget=DEFAULT_BUDGET, window=DEFAULT_WINDOW):
+        self.budget = budget
+        self._window = window
+        self._lock = threading.Lock()
+        self._rotated_at = time.monotonic()
+        # (hook, command) -> window, for the current and the previous window
+        self._current = {}
+        self._previous = {}
+
+    def _rotate(self, now):
+        if now - self._rotated_at < self._window:
+            return
+        # nothing recorded during a whole window, the previous one is stale too
+        expired = now - self._rotated_at >= 2 * self._window
+        self._previous = {} if expired else self._current
+        self._current = {}
+        self._rotated_at = now
+
+    def timer(self, hook, command=""):
+        """A context manager that records the duration of its block"""
+        return _Timer(self, hook, command)
+
+    def wrap(self, hook, fn, command=None):
+        """
+        Wraps `fn` so that its calls are recorded, `command` is called to get
+        the command being typed
+        """
+
+        @wraps(fn)
+        def timed(*args, **kwargs):
+            with self.timer(hook, command() if command else ""):
+                return fn(*args, **kwargs)
+
+        return timed
+
+    def record(self, hook, command, seconds):
+        key = (hook, command)
+        with self._lock:
+            self._rotate(time.monotonic())
+            window = self._current.get(key)
+            if window is None:
+                window = self._current[key] = _Window()
+            window.histogram.record(seconds)
+            if seconds > self.budget:
+                window.over_budget += 1
+        if seconds > self.budget:
+            logger.warning(
+                "UI hook %s took %.1fms (budget %.1fms) while typing %r",
+                hook,
+                seconds * 1000,
+                self.budget * 1000,
+                command,
+            )
+
+    def reset(self):
+        with self._lock:
+            self._current = {}
+            self._previous = {}
+            self._rotated_at = time.monotonic()
+
+    def to_dict(self):
+        """Returns {hook: {command: stats}} for the recent calls"""
+        with self._lock:
+            self._rotate(time.monotonic())
+            merged = {}
+            for windows in (self._previous, self._current):
+                for key, window in windows.items():
+                    total = merged.get(key)
+                    if total is None:
+                        total = merged[key] = _Window()
+                    total.histogram.merge(window.histogram)
+                    total.over_budget += window.over_budget
+        output = OrderedDict()
+        for hook, command in sorted(merged):
+            window = merged[(hook, command)]
+            stats = window.histogram.to_dict()
+            stats["over_budget"] = window.over_budget
+            output.setdefault(hook, OrderedDict())[command] = stats
+        return output
+
+
+# the row of the lines that do not start with a command, partially typed
+# command names for instance
+UNKNOWN_COMMAND = "-"
+
+
+def typed_command(text, commands):
+    """
+    The command name at the start of a line of input, UNKNOWN_COMMAND if it
+    is not in `commands` (the command registry)
+    """
+    word = text.lstrip().split(" ", 1)[0]
+    return word if word and word in commands else UNKNOWN_COMMAND
+
+
+class TimedLexer(Lexer):
+    """Records the time spent lexing every line with another lexer"""
+
+    def __init__(self, lexer, monitor, commands):
+        self._lexer = lexer
+        self._monitor = monitor
+        self._commands = commands
+
+    def lex_document(self, document):
+        command = typed_command(document.text, self._commands)
+        return self._monitor.wrap(
+            HOOK_LEXER, self._lexer.lex_document(document), lambda: command
+        )
+
+    def invalidation_hash(self):
+        return self._lexer.invalidation_hash()
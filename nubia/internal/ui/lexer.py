@@ -8,7 +8,11 @@
 #
 
 import re
-from pygments.lexer import RegexLexer, bygroups
+from collections import OrderedDict
+
+from prompt_toolkit.lexers import Lexer
+from prompt_toolkit.styles.pygments import pygments_token_to_classname
+from pygments.lexer import ExtendedRegexLexer, LexerContext, RegexLexerMeta, bygroups
 from pygments.token import (
     Punctuation,
     Text,
@@ -29,8 +33,82 @@ _unquoted_string = "([a-zA-Z0-9{}]+)".format(
 
 _command = r"(:?[a-zA-Z_][a-zA-Z0-9_\-]*)"
 
+# looked up (upper-cased) by `sql_word_callback` instead of being matched by
+# a regex alternation
+SQL_KEYWORDS = frozenset(
+    """
+    ABORT ABS ABSOLUTE ACCESS ADA ADD ADMIN AFTER AGGREGATE ALIAS ALL ALLOCATE
+    ALTER ANALYSE ANALYZE AND ANY ARE AS ASC ASENSITIVE ASSERTION ASSIGNMENT
+    ASYMMETRIC AT ATOMIC AUTHORIZATION AVG BACKWARD BEFORE BEGIN BETWEEN BITVAR
+    BIT_LENGTH BOTH BREADTH BY C CACHE CALL CALLED CARDINALITY CASCADE CASCADED
+    CASE CAST CATALOG CATALOG_NAME CHAIN CHARACTERISTICS CHARACTER_LENGTH
+    CHARACTER_SET_CATALOG CHARACTER_SET_NAME CHARACTER_SET_SCHEMA CHAR_LENGTH
+    CHECK CHECKED CHECKPOINT CLASS CLASS_ORIGIN CLOB CLOSE CLUSTER COALSECE
+    COBOL COLLATE COLLATION COLLATION_CATALOG COLLATION_NAME COLLATION_SCHEMA
+    COLUMN COLUMN_NAME COMMAND_FUNCTION COMMAND_FUNCTION_CODE COMMENT COMMIT
+    COMMITTED COMPLETION CONDITION_NUMBER CONNECT CONNECTION CONNECTION_NAME
+    CONSTRAINT CONSTRAINTS CONSTRAINT_CATALOG CONSTRAINT_NAME CONSTRAINT_SCHEMA
+    CONSTRUCTOR CONTAINS CONTINUE CONVERSION CONVERT COPY CORRESPONTING COUNT
+    CREATE CREATEDB CREATEUSER CROSS CUBE CURRENT CURRENT_DATE CURRENT_PATH
+    CURRENT_ROLE CURRENT_TIME CURRENT_TIMESTAMP CURRENT_USER CURSOR CURSOR_NAME
+    CYCLE DATA DATABASE DATETIME_INTERVAL_CODE DATETIME_INTERVAL_PRECISION DAY
+    DEALLOCATE DECLARE DEFAULT DEFAULTS DEFERRABLE DEFERRED DEFINED DEFINER
+    DELETE DELIMITER DELIMITERS DEREF DESC DESCRIBE DESCRIPTOR DESTROY
+    DESTRUCTOR DETERMINISTIC DIAGNOSTICS DICTIONARY DISCONNECT DISPATCH DISTINCT
+    DO DOMAIN DROP DYNAMIC DYNAMIC_FUNCTION DYNAMIC_FUNCTION_CODE EACH ELSE
+    ENCODING ENCRYPTED END EXEC EQUALS ESCAPE EVERY EXCEPT ESCEPTION
+    EXCLUDING EXCLUSIVE EXEC EXECUTE EXISTING EXISTS EXPLAIN EXTERNAL EXTRACT
+    FALSE FETCH FINAL FIRST FOR FORCE FOREIGN FORTRAN FORWARD FOUND FREE FREEZE
+    FROM FULL FUNCTION G GENERAL GENERATED GET GLOBAL GO GOTO GRANT GRANTED
+    GROUP GROUPING HANDLER HAVING HIERARCHY HOLD HOST IDENTITY IGNORE ILIKE
+    IMMEDIATE IMMUTABLE IMPLEMENTATION IMPLICIT IN INCLUDING INCREMENT INDEX
+    INDITCATOR INFIX INHERITS INITIALIZE INITIALLY INNER INOUT INPUT INSENSITIVE
+    INSERT INSTANTIABLE INSTEAD INTERSECT INTO INVOKER IS ISNULL ISOLATION
+    ITERATE JOIN KEY KEY_MEMBER KEY_TYPE LANCOMPILER LANGUAGE LARGE LAST LATERAL
+    LEADING LEFT LENGTH LESS LEVEL LIKE LIMIT LISTEN LOAD LOCAL LOCALTIME
+    LOCALTIMESTAMP LOCATION LOCATOR LOCK LOWER MAP MATCH MAX MAXVALUE
+    MESSAGE_LENGTH MESSAGE_OCTET_LENGTH MESSAGE_TEXT METHOD MIN MINUTE MINVALUE
+    MOD MODE MODIFIES MODIFY MONTH MORE MOVE MUMPS NAMES NATIONAL NATURAL NCHAR
+    NCLOB NEW NEXT NO NOCREATEDB NOCREATEUSER NONE NOT NOTHING NOTIFY NOTNULL
+    NULL NULLABLE NULLIF OBJECT OCTET_LENGTH OF OFF OFFSET OIDS OLD ON ONLY OPEN
+    OPERATION OPERATOR OPTION OPTIONS OR ORDER ORDINALITY OUT OUTER OUTPUT
+    OVERLAPS OVERLAY OVERRIDING OWNER PAD PARAMETER PARAMETERS PARAMETER_MODE
+    PARAMATER_NAME PARAMATER_ORDINAL_POSITION PARAMETER_SPECIFIC_CATALOG
+    PARAMETER_SPECIFIC_NAME PARAMATER_SPECIFIC_SCHEMA PARTIAL PASCAL PENDANT
+    PLACING PLI POSITION POSTFIX PRECISION PREFIX PREORDER PREPARE PRESERVE
+    PRIMARY PRIOR PRIVILEGES PROCEDURAL PROCEDURE PUBLIC READ READS RECHECK
+    RECURSIVE REF REFERENCES REFERENCING REINDEX RELATIVE RENAME REPEATABLE
+    REPLACE RESET RESTART RESTRICT RESULT RETURN RETURNED_LENGTH
+    RETURNED_OCTET_LENGTH RETURNED_SQLSTATE RETURNS REVOKE RIGHT ROLE ROLLBACK
+    ROLLUP ROUTINE ROUTINE_CATALOG ROUTINE_NAME ROUTINE_SCHEMA ROW ROWS
+    ROW_COUNT RULE SAVE_POINT SCALE SCHEMA SCHEMA_NAME SCOPE SCROLL SEARCH
+    SECOND SECURITY SELECT SELF SENSITIVE SERIALIZABLE SERVER_NAME SESSION
+    SESSION_USER SET SETOF SETS SHARE SHOW SIMILAR SIMPLE SIZE SOME SOURCE SPACE
+    SPECIFIC SPECIFICTYPE SPECIFIC_NAME SQL SQLCODE SQLERROR SQLEXCEPTION
+    SQLSTATE SQLWARNINIG STABLE START STATE STATEMENT STATIC STATISTICS STDIN
+    STDOUT STORAGE STRICT STRUCTURE STYPE SUBCLASS_ORIGIN SUBLIST SUBSTRING SUM
+    SYMMETRIC SYSID SYSTEM SYSTEM_USER TABLE TABLE_NAME TEMP TEMPLATE TEMPORARY
+    TERMINATE THAN THEN TIMESTAMP TIMEZONE_HOUR TIMEZONE_MINUTE TO TOAST
+    TRAILING TRANSATION TRANSACTIONS_COMMITTED TRANSACTIONS_ROLLED_BACK
+    TRANSATION_ACTIVE TRANSFORM TRANSFORMS TRANSLATE TRANSLATION TREAT TRIGGER
+    TRIGGER_CATALOG TRIGGER_NAME TRIGGER_SCHEMA TRIM TRUE TRUNCATE TRUSTED TYPE
+    UNCOMMITTED UNDER UNENCRYPTED UNION UNIQUE UNKNOWN UNLISTEN UNNAMED UNNEST
+    UNTIL UPDATE UPPER USAGE USER USER_DEFINED_TYPE_CATALOG
+    USER_DEFINED_TYPE_NAME USER_DEFINED_TYPE_SCHEMA USING VACUUM VALID VALIDATOR
+    VALUES VARIABLE VERBOSE VERSION VIEW VOLATILE WHEN WHENEVER WHERE WITH
+    WITHOUT WORK WRITE YEAR ZONE
+    """.split()
+)
+SQL_TYPES = frozenset(
+    """
+    ARRAY BIGINT BINARY BIT BLOB BOOLEAN CHAR CHARACTER DATE DEC DECIMAL FLOAT
+    INT INTEGER INTERVAL NUMBER NUMERIC REAL SERIAL SMALLINT VARCHAR VARYING
+    INT8 SERIAL8 TEXT
+    """.split()
+)
+
 
-def command_callback(lexer, match):
+def command_callback(lexer, match, ctx=None):
     """
     When matching a command, the lexer would look up the command registry to
     decide on how to highlight the command. We will emit Name.Command if this is
@@ -42,8 +120,7 @@ def command_callback(lexer, match):
     # We do need to know whether we are parsing two groups (command) or four
     # (command with subcommand)
     command_with_argument = len(match.groups()) > 2
-    ctx = context.get_context()
-    cmd = ctx.registry.find_command(command.strip())
+    cmd = context.get_context().registry.find_command(command.strip())
     # We know this command
     command_token = Name.InvalidCommand
     subcommand_token = Name.InvalidCommand
@@ -67,9 +144,46 @@ def command_callback(lexer, match):
         yield (match.start(3), subcommand_token, match.group(3))
         # matches the spaces
         yield (match.start(4), Text, match.group(4))
+    if ctx:
+        ctx.pos = match.end()
+
+
+def sql_word_callback(lexer, match, ctx=None):
+    word = match.group()
+    if word.upper() in SQL_KEYWORDS:
+        token = Keyword
+    elif word.upper() in SQL_TYPES:
+        token = Name.Builtin
+    else:
+        token = Name
+    yield (match.start(), token, word)
+    if ctx:
+        ctx.pos = match.end()
 
 
-class NubiaLexer(RegexLexer):
+class _LazyStates(dict):
+    """The compiled states of a lexer, compiled the first time they are used"""
+
+    def __init__(self, lexer_cls, tokendefs):
+        super(_LazyStates, self).__init__()
+        self._lexer_cls = lexer_cls
+        self._tokendefs = tokendefs
+
+    def __missing__(self, state):
+        if state not in self._tokendefs:
+            raise KeyError(state)
+        return self._lexer_cls._process_state(self._tokendefs, self, state)
+
+
+class _LazyRegexLexerMeta(RegexLexerMeta):
+    def process_tokendef(cls, name, tokendefs=None):
+        processed = cls._all_tokens[name] = _LazyStates(
+            cls, tokendefs or cls.tokens[name]
+        )
+        return processed
+
+
+class NubiaLexer(ExtendedRegexLexer, metaclass=_LazyRegexLexerMeta):
     name = "Nubia Interactive Lexer"
     filenames = ["*.nubia"]
     flags = re.IGNORECASE
@@ -96,96 +210,90 @@ class NubiaLexer(RegexLexer):
         ],
         str("query"): [
             (r"\s+", Text),
-            (
-                r"(ABORT|ABS|ABSOLUTE|ACCESS|ADA|ADD|ADMIN|AFTER|AGGREGATE|"
-                r"ALIAS|ALL|ALLOCATE|ALTER|ANALYSE|ANALYZE|AND|ANY|ARE|AS|"
-                r"ASC|ASENSITIVE|ASSERTION|ASSIGNMENT|ASYMMETRIC|AT|ATOMIC|"
-                r"AUTHORIZATION|AVG|BACKWARD|BEFORE|BEGIN|BETWEEN|BITVAR|"
-                r"BIT_LENGTH|BOTH|BREADTH|BY|C|CACHE|CALL|CALLED|CARDINALITY|"
-                r"CASCADE|CASCADED|CASE|CAST|CATALOG|CATALOG_NAME|CHAIN|"
-                r"CHARACTERISTICS|CHARACTER_LENGTH|CHARACTER_SET_CATALOG|"
-                r"CHARACTER_SET_NAME|CHARACTER_SET_SCHEMA|CHAR_LENGTH|CHECK|"
-                r"CHECKED|CHECKPOINT|CLASS|CLASS_ORIGIN|CLOB|CLOSE|CLUSTER|"
-                r"COALSECE|COBOL|COLLATE|COLLATION|COLLATION_CATALOG|"
-                r"COLLATION_NAME|COLLATION_SCHEMA|COLUMN|COLUMN_NAME|"
-                r"COMMAND_FUNCTION|COMMAND_FUNCTION_CODE|COMMENT|COMMIT|"
-                r"COMMITTED|COMPLETION|CONDITION_NUMBER|CONNECT|CONNECTION|"
-                r"CONNECTION_NAME|CONSTRAINT|CONSTRAINTS|CONSTRAINT_CATALOG|"
-                r"CONSTRAINT_NAME|CONSTRAINT_SCHEMA|CONSTRUCTOR|CONTAINS|"
-                r"CONTINUE|CONVERSION|CONVERT|COPY|CORRESPONTING|COUNT|"
-                r"CREATE|CREATEDB|CREATEUSER|CROSS|CUBE|CURRENT|CURRENT_DATE|"
-                r"CURRENT_PATH|CURRENT_ROLE|CURRENT_TIME|CURRENT_TIMESTAMP|"
-                r"CURRENT_USER|CURSOR|CURSOR_NAME|CYCLE|DATA|DATABASE|"
-                r"DATETIME_INTERVAL_CODE|DATETIME_INTERVAL_PRECISION|DAY|"
-                r"DEALLOCATE|DECLARE|DEFAULT|DEFAULTS|DEFERRABLE|DEFERRED|"
-                r"DEFINED|DEFINER|DELETE|DELIMITER|DELIMITERS|DEREF|DESC|"
-                r"DESCRIBE|DESCRIPTOR|DESTROY|DESTRUCTOR|DETERMINISTIC|"
-                r"DIAGNOSTICS|DICTIONARY|DISCONNECT|DISPATCH|DISTINCT|DO|"
-                r"DOMAIN|DROP|DYNAMIC|DYNAMIC_FUNCTION|DYNAMIC_FUNCTION_CODE|"
-                r"EACH|ELSE|ENCODING|ENCRYPTED|END|END-EXEC|EQUALS|ESCAPE|EVERY|"
-                r"EXCEPT|ESCEPTION|EXCLUDING|EXCLUSIVE|EXEC|EXECUTE|EXISTING|"
-                r"EXISTS|EXPLAIN|EXTERNAL|EXTRACT|FALSE|FETCH|FINAL|FIRST|FOR|"
-                r"FORCE|FOREIGN|FORTRAN|FORWARD|FOUND|FREE|FREEZE|FROM|FULL|"
-                r"FUNCTION|G|GENERAL|GENERATED|GET|GLOBAL|GO|GOTO|GRANT|GRANTED|"
-                r"GROUP|GROUPING|HANDLER|HAVING|HIERARCHY|HOLD|HOST|IDENTITY|"
-                r"IGNORE|ILIKE|IMMEDIATE|IMMUTABLE|IMPLEMENTATION|IMPLICIT|IN|"
-                r"INCLUDING|INCREMENT|INDEX|INDITCATOR|INFIX|INHERITS|INITIALIZE|"
-                r"INITIALLY|INNER|INOUT|INPUT|INSENSITIVE|INSERT|INSTANTIABLE|"
-                r"INSTEAD|INTERSECT|INTO|INVOKER|IS|ISNULL|ISOLATION|ITERATE|JOIN|"
-                r"KEY|KEY_MEMBER|KEY_TYPE|LANCOMPILER|LANGUAGE|LARGE|LAST|"
-                r"LATERAL|LEADING|LEFT|LENGTH|LESS|LEVEL|LIKE|LIMIT|LISTEN|LOAD|"
-                r"LOCAL|LOCALTIME|LOCALTIMESTAMP|LOCATION|LOCATOR|LOCK|LOWER|"
-                r"MAP|MATCH|MAX|MAXVALUE|MESSAGE_LENGTH|MESSAGE_OCTET_LENGTH|"
-                r"MESSAGE_TEXT|METHOD|MIN|MINUTE|MINVALUE|MOD|MODE|MODIFIES|"
-                r"MODIFY|MONTH|MORE|MOVE|MUMPS|NAMES|NATIONAL|NATURAL|NCHAR|"
-                r"NCLOB|NEW|NEXT|NO|NOCREATEDB|NOCREATEUSER|NONE|NOT|NOTHING|"
-                r"NOTIFY|NOTNULL|NULL|NULLABLE|NULLIF|OBJECT|OCTET_LENGTH|OF|OFF|"
-                r"OFFSET|OIDS|OLD|ON|ONLY|OPEN|OPERATION|OPERATOR|OPTION|OPTIONS|"
-                r"OR|ORDER|ORDINALITY|OUT|OUTER|OUTPUT|OVERLAPS|OVERLAY|OVERRIDING|"
-                r"OWNER|PAD|PARAMETER|PARAMETERS|PARAMETER_MODE|PARAMATER_NAME|"
-                r"PARAMATER_ORDINAL_POSITION|PARAMETER_SPECIFIC_CATALOG|"
-                r"PARAMETER_SPECIFIC_NAME|PARAMATER_SPECIFIC_SCHEMA|PARTIAL|"
-                r"PASCAL|PENDANT|PLACING|PLI|POSITION|POSTFIX|PRECISION|PREFIX|"
-                r"PREORDER|PREPARE|PRESERVE|PRIMARY|PRIOR|PRIVILEGES|PROCEDURAL|"
-                r"PROCEDURE|PUBLIC|READ|READS|RECHECK|RECURSIVE|REF|REFERENCES|"
-                r"REFERENCING|REINDEX|RELATIVE|RENAME|REPEATABLE|REPLACE|RESET|"
-                r"RESTART|RESTRICT|RESULT|RETURN|RETURNED_LENGTH|"
-                r"RETURNED_OCTET_LENGTH|RETURNED_SQLSTATE|RETURNS|REVOKE|RIGHT|"
-                r"ROLE|ROLLBACK|ROLLUP|ROUTINE|ROUTINE_CATALOG|ROUTINE_NAME|"
-                r"ROUTINE_SCHEMA|ROW|ROWS|ROW_COUNT|RULE|SAVE_POINT|SCALE|SCHEMA|"
-                r"SCHEMA_NAME|SCOPE|SCROLL|SEARCH|SECOND|SECURITY|SELECT|SELF|"
-                r"SENSITIVE|SERIALIZABLE|SERVER_NAME|SESSION|SESSION_USER|SET|"
-                r"SETOF|SETS|SHARE|SHOW|SIMILAR|SIMPLE|SIZE|SOME|SOURCE|SPACE|"
-                r"SPECIFIC|SPECIFICTYPE|SPECIFIC_NAME|SQL|SQLCODE|SQLERROR|"
-                r"SQLEXCEPTION|SQLSTATE|SQLWARNINIG|STABLE|START|STATE|STATEMENT|"
-                r"STATIC|STATISTICS|STDIN|STDOUT|STORAGE|STRICT|STRUCTURE|STYPE|"
-                r"SUBCLASS_ORIGIN|SUBLIST|SUBSTRING|SUM|SYMMETRIC|SYSID|SYSTEM|"
-                r"SYSTEM_USER|TABLE|TABLE_NAME| TEMP|TEMPLATE|TEMPORARY|TERMINATE|"
-                r"THAN|THEN|TIMESTAMP|TIMEZONE_HOUR|TIMEZONE_MINUTE|TO|TOAST|"
-                r"TRAILING|TRANSATION|TRANSACTIONS_COMMITTED|"
-                r"TRANSACTIONS_ROLLED_BACK|TRANSATION_ACTIVE|TRANSFORM|"
-                r"TRANSFORMS|TRANSLATE|TRANSLATION|TREAT|TRIGGER|TRIGGER_CATALOG|"
-                r"TRIGGER_NAME|TRIGGER_SCHEMA|TRIM|TRUE|TRUNCATE|TRUSTED|TYPE|"
-                r"UNCOMMITTED|UNDER|UNENCRYPTED|UNION|UNIQUE|UNKNOWN|UNLISTEN|"
-                r"UNNAMED|UNNEST|UNTIL|UPDATE|UPPER|USAGE|USER|"
-                r"USER_DEFINED_TYPE_CATALOG|USER_DEFINED_TYPE_NAME|"
-                r"USER_DEFINED_TYPE_SCHEMA|USING|VACUUM|VALID|VALIDATOR|VALUES|"
-                r"VARIABLE|VERBOSE|VERSION|VIEW|VOLATILE|WHEN|WHENEVER|WHERE|"
-                r"WITH|WITHOUT|WORK|WRITE|YEAR|ZONE)\b",
-                Keyword,
-            ),
-            (
-                r"(ARRAY|BIGINT|BINARY|BIT|BLOB|BOOLEAN|CHAR|CHARACTER|DATE|"
-                r"DEC|DECIMAL|FLOAT|INT|INTEGER|INTERVAL|NUMBER|NUMERIC|REAL|"
-                r"SERIAL|SMALLINT|VARCHAR|VARYING|INT8|SERIAL8|TEXT)\b",
-                Name.Builtin,
-            ),
+            (r"[a-zA-Z_][a-zA-Z0-9_]*", sql_word_callback),
             (r"[+*/<>=~!@#%^&|`?-]", Operator),
             (r"[0-9]+", Number.Integer),
             (r"'(''|[^'])*'", String.Single),
             # not a real string literal in ANSI SQL
             (r'"(""|[^"])*"', String.Symbol),
-            (r"[a-zA-Z_][a-zA-Z0-9_]*", Name),
             (r"[;:()\[\],\.]", Punctuation),
         ],
     }
+
+
+# maximum number of lexed lines kept by NubiaPromptLexer
+LINES_CACHE_SIZE = 512
+
+
+def _registry_version():
+    return context.get_context().registry.version
+
+
+class NubiaPromptLexer(Lexer):
+    """
+    Highlights the input of the interactive shell with `NubiaLexer`.
+
+    The fragments of every line are cached along with the state of the lexer
+    at the end of the line, keyed by the line, the state at its start and the
+    version of the registry (commands are highlighted depending on whether
+    they exist). Editing a line only re-lexes that line, and the following
+    ones if the state at its end changed.
+    """
+
+    def __init__(self, lexer_cls=NubiaLexer, cache_size=LINES_CACHE_SIZE):
+        self._lexer = lexer_cls()
+        self._cache_size = cache_size
+        # (registry version, start state, is first line, line) ->
+        # (fragments, end state)
+        self._cache = OrderedDict()
+        self._styles = {}
+
+    def _style(self, token):
+        style = self._styles.get(token)
+        if style is None:
+            style = self._styles[token] = "class:" + pygments_token_to_classname(
+                token
+            )
+        return style
+
+    def _lex_line(self, version, state, first, line):
+        key = (version, state, first, line)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            return cached
+        # `^` must only match at the start of the input, not of every line
+        prefix = "" if first else "\n"
+        ctx = LexerContext(prefix + line, len(prefix), list(state))
+        fragments = [
+            (self._style(token), value)
+            for _, token, value in self._lexer.get_tokens_unprocessed(context=ctx)
+        ]
+        cached = self._cache[key] = (fragments, tuple(ctx.stack))
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return cached
+
+    def lex_document(self, document):
+        lines = document.lines
+        version = _registry_version()
+        # fragments of the lines lexed so far, and the state after the last one
+        lexed = []
+        state = ("root",)
+
+        def get_line(lineno):
+            nonlocal state
+            if not 0 <= lineno < len(lines):
+                return []
+            while len(lexed) <= lineno:
+                index = len(lexed)
+                fragments, state = self._lex_line(
+                    version, state, index == 0, lines[index]
+                )
+                lexed.append(fragments)
+            return lexed[lineno]
+
+        return get_line
+
+    def invalidation_hash(self):
+        return (id(self), _registry_version())
@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+"""
+A full-screen pager for the output of commands.
+
+The output is pulled lazily from an iterable of lines (a generator, a list,
+a file or a string) as the user scrolls through it, and only the lines on
+the screen are rendered. Paging a million lines costs what is on screen,
+plus whatever was scrolled past. Keys follow less: j/k, space/b, g/G,
+h/l to scroll wide tables horizontally and / or ? to search.
+"""
+
+import asyncio
+import os
+import pydoc
+import re
+import shutil
+import sys
+
+from nubia.internal.io import output
+from prompt_toolkit.application import Application
+from prompt_toolkit.filters import Condition
+from prompt_toolkit.formatted_text import ANSI, to_formatted_text
+from prompt_toolkit.layout.utils import explode_text_fragments
+from prompt_toolkit.key_binding import KeyBindings
+from prompt_toolkit.keys import Keys
+from prompt_toolkit.layout import HSplit, Layout, Window
+from prompt_toolkit.layout.controls import (
+    FormattedTextControl,
+    UIContent,
+    UIControl,
+)
+from prompt_toolkit.styles import Style
+
+_ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]")
+
+pager_style = Style.from_dict(
+    {
+        "pager.status": "reverse",
+        "pager.match": "reverse",
+        "pager.message": "bold",
+    }
+)
+
+
+def plain(line):
+    """The text of `line` without its ANSI escape sequences"""
+    return _ANSI_ESCAPE.sub("", line)
+
+
+class LineSource:
+    """The lines of an output, pulled from it as they are needed"""
+
+    def __init__(self, lines):
+        if isinstance(lines, str):
+            lines = lines.splitlines()
+        self._iterator = iter(lines)
+        self._lines = []
+        self.exhausted = False
+
+    def __len__(self):
+        """The number of lines pulled so far"""
+        return len(self._lines)
+
+    def _fill(self, count):
+        while len(self._lines) < count and not self.exhausted:
+            try:
+                line = next(self._iterator)
+            except StopIteration:
+                self.exhausted = True
+                break
+            self._lines.append(str(line).rstrip("\r\n").expandtabs())
+
+    def window(self, start, count):
+        """The lines from `start` to `start + count`, pulling them if needed"""
+        self._fill(start + count)
+        return self._lines[start : start + count]
+
+    def load_all(self):
+        self._fill(float("inf"))
+        return len(self._lines)
+
+    def find(self, pattern, start, backward=False):
+        """
+        The index of the first line from `start` whose text matches
+        `pattern`, going backward or forward (pulling lines until one
+        matches), None if no line matches
+        """
+        if backward:
+            indexes = range(min(start, len(self._lines) - 1), -1, -1)
+        else:
+            indexes = _count(start)
+        for index in indexes:
+            self._fill(index + 1)
+            if index >= len(self._lines):
+                return None
+            if pattern.search(plain(self._lines[index])):
+                return index
+        return None
+
+
+def _count(start):
+    while True:
+        yield start
+        start += 1
+
+
+def _compile(query):
+    # smart case, like less -i: lowercase queries ignore case
+    flags = 0 if query != query.lower() else re.IGNORECASE
+    try:
+        return re.compile(query, flags)
+    except re.error:
+        return re.compile(re.escape(query), flags)
+
+
+def _fragments(line, left, width, pattern=None):
+    """The fragments of the columns [left, left + width) of `line`"""
+    fragments = [
+        fragment
+        for fragment in explode_text_fragments(to_formatted_text(ANSI(line)))
+        if "[ZeroWidthEscape]" not in fragment[0]
+    ]
+    if pattern is not None:
+        text = "".join(fragment[1] for fragment in fragments)
+        for match in pattern.finditer(text):
+            for index in range(match.start(), match.end()):
+                style, char = fragments[index][:2]
+                fragments[index] = (style + " class:pager.match", char)
+    return fragments[left : left + width]
+
+
+class Pager:
+    """The state of the pager, rendered and driven by its application"""
+
+    def __init__(self, lines):
+        self.source = lines if isinstance(lines, LineSource) else LineSource(lines)
+        # first line and first column on the screen
+        self.top = 0
+        self.left = 0
+        self.width = 80
+        # height of the lines, without the status line
+        self.height = 24
+        self.pattern = None
+        self.search_backward = False
+        # the query being typed after / or ?, None when not searching
+        self.query = None
+        self.message = None
+
+    def resize(self, width, height):
+        self.width = max(width, 1)
+        self.height = max(height, 1)
+
+    def visible_lines(self):
+        return self.source.window(self.top, self.height)
+
+    def visible_fragments(self):
+        return [
+            _fragments(line, self.left, self.width, self.pattern)
+            for line in self.visible_lines()
+        ]
+
+    def at_end(self):
+        source = self.source
+        source.window(self.top, self.height + 1)
+        return source.exhausted and self.top + self.height >= len(source)
+
+    def scroll(self, lines):
+        self.message = None
+        top = max(self.top + lines, 0)
+        # pull the lines needed to fill the screen from the new top
+        self.source.window(top, self.height)
+        self.top = max(min(top, len(self.source) - self.height), 0)
+
+    def scroll_pages(self, pages):
+        self.scroll(int(pages * self.height))
+
+    def home(self):
+        self.scroll(-self.top)
+
+    def end(self):
+        self.message = None
+        self.top = max(self.source.load_all() - self.height, 0)
+
+    def scroll_horizontally(self, columns):
+        widest = max((len(plain(line)) for line in self.visible_lines()), default=0)
+        left = min(self.left + columns, widest - self.width)
+        self.left = max(left, 0)
+
+    def search(self, query, backward=False):
+        self.pattern = _compile(query) if query else self.pattern
+        self.search_backward = backward
+        self.next_match()
+
+    def next_match(self, reverse=False):
+        if self.pattern is None:
+            return
+        backward = self.search_backward != reverse
+        start = self.top - 1 if backward else self.top + 1
+        index = self.source.find(self.pattern, start, backward=backward)
+        if index is None:
+            self.message = "Pattern not found"
+            return
+        self.scroll(index - self.top)
+        # the match may be in a column scrolled out of the screen
+        line = plain(self.source.window(index, 1)[0])
+        match = self.pattern.search(line)
+        if not self.left <= match.start() < self.left + self.width:
+            self.left = max(match.start() - self.width // 4, 0)
+
+    def status(self):
+        if self.query is not None:
+            return [("", ("?" if self.search_backward else "/") + self.query)]
+        if self.message:
+            return [("class:pager.message", self.message)]
+        source = self.source
+        last = min(self.top + self.height, len(source))
+        text = "lines {}-{} of {}{}".format(
+            self.top + 1, last, len(source), "" if source.exhausted else "+"
+        )
+        if self.left:
+            text += ", column {}".format(self.left + 1)
+        if self.at_end():
+            text += " (END)"
+        return [("class:pager.status", " {} ".format(text))]
+
+
+class _PagerControl(UIControl):
+    def __init__(self, pager):
+        self._pager = pager
+
+    def is_focusable(self):
+        return True
+
+    def create_content(self, width, height):
+        self._pager.resize(width, height)
+        lines = self._pager.visible_fragments()
+
+        def get_line(index):
+            return lines[index] if index < len(lines) else []
+
+        return UIContent(get_line=get_line, line_count=len(lines), show_cursor=False)
+
+
+def _key_bindings(pager):
+    kb = KeyBindings()
+    searching = Condition(lambda: pager.query is not None)
+    browsing = ~searching
+
+    def handle(*keys, filter=browsing, **kwargs):
+        return kb.add(*keys, filter=filter, **kwargs)
+
+    @handle("q")
+    @handle("Q")
+    @handle("c-c")
+    @handle("escape", eager=True)
+    def _quit(event):
+        event.app.exit()
+
+    @handle("down")
+    @handle("j")
+    @handle("e")
+    @handle("enter")
+    @handle("c-n")
+    def _down(event):
+        pager.scroll(event.arg)
+
+    @handle("up")
+    @handle("k")
+    @handle("y")
+    @handle("c-p")
+    def _up(event):
+        pager.scroll(-event.arg)
+
+    @handle("space")
+    @handle("f")
+    @handle("pagedown")
+    @handle("c-f")
+    @handle("c-v")
+    def _page_down(event):
+        pager.scroll_pages(event.arg)
+
+    @handle("b")
+    @handle("pageup")
+    @handle("c-b")
+    def _page_up(event):
+        pager.scroll_pages(-event.arg)
+
+    @handle("d")
+    @handle("c-d")
+    def _half_page_down(event):
+        pager.scroll_pages(event.arg / 2)
+
+    @handle("u")
+    @handle("c-u")
+    def _half_page_up(event):
+        pager.scroll_pages(-event.arg / 2)
+
+    @handle("g")
+    @handle("<")
+    @handle("home")
+    def _home(event):
+        pager.home()
+
+    @handle("G")
+    @handle(">")
+    @handle("end")
+    def _end(event):
+        pager.end()
+
+    @handle("right")
+    @handle("l")
+    def _right(event):
+        pager.scroll_horizontally(event.arg * max(pager.width // 2, 1))
+
+    @handle("left")
+    @handle("h")
+    def _left(event):
+        pager.scroll_horizontally(-event.arg * max(pager.width // 2, 1))
+
+    @handle("/")
+    @handle("?")
+    def _start_search(event):
+        pager.search_backward = event.data == "?"
+        pager.query = ""
+
+    @handle("n")
+    def _next(event):
+        pager.next_match()
+
+    @handle("N")
+    def _previous(event):
+        pager.next_match(reverse=True)
+
+    @handle(Keys.Any, filter=searching)
+    def _type(event):
+        if event.data.isprintable():
+            pager.query += event.data
+
+    @handle("backspace", filter=searching)
+    def _erase(event):
+        if pager.query:
+            pager.query = pager.query[:-1]
+        else:
+            pager.query = None
+
+    @handle("enter", filter=searching)
+    def _search(event):
+        query, pager.query = pager.query, None
+        pager.search(query, backward=pager.search_backward)
+
+    @handle("escape", filter=searching, eager=True)
+    @handle("c-c", filter=searching)
+    def _cancel(event):
+        pager.query = None
+
+    return kb
+
+
+def create_application(pager, **kwargs):
+    layout = Layout(
+        HSplit(
+            [
+                Window(_PagerControl(pager), wrap_lines=False),
+                Window(FormattedTextControl(pager.status), height=1),
+            ]
+        )
+    )
+    return Application(
+        layout=layout,
+        key_bindings=_key_bindings(pager),
+        style=pager_style,
+        full_screen=True,
+        **kwargs
+    )
+
+
+def page(lines):
+    """
+    Prints `lines` (an iterable of lines or a string), through the pager if
+    they do not fit on the screen. The pager in $PAGER is used if set, the
+    built-in one otherwise.
+    """
+    if isinstance(lines, str):
+        lines = lines.splitlines()
+    # what was printed before goes above the pager
+    output.flush()
+    if not sys.stdout.isatty():
+        for line in lines:
+            print(str(line).rstrip("\r\n"))
+        return
+    source = LineSource(lines)
+    height = shutil.get_terminal_size().lines
+    first = source.window(0, height)
+    if source.exhausted and len(first) < height:
+        print("\n".join(first))
+        return
+    external = os.environ.get("PAGER")
+    if external:
+        source.load_all()
+        pydoc.pipepager("\n".join(source.window(0, len(source))) + "\n", external)
+        return
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        in_thread = False
+    else:
+        # commands running on an event loop cannot start another one
+        in_thread = True
+    create_application(Pager(source)).run(in_thread=in_thread)
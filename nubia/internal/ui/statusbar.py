@@ -7,14 +7,91 @@
 # LICENSE file in the root directory of this source tree.
 #
 
+import logging
+import threading
 
 from nubia.internal.io import eventbus
 
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+# guards the lazy creation of the state of status bars, subclasses are not
+# required to call StatusBar.__init__
+_state_lock = threading.Lock()
+
+
+class _Provider:
+    """Calls `fetch` every `interval` seconds on its own thread"""
+
+    def __init__(self, status_bar, name, fetch, interval):
+        self._status_bar = status_bar
+        self._name = name
+        self._fetch = fetch
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="nubia-status-" + self._name, daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread = None
+
+    def _run(self):
+        stopped = self._stopped
+        while not stopped.is_set():
+            try:
+                value = self._fetch()
+            except Exception:
+                logger.exception("Status bar provider %s failed", self._name)
+            else:
+                if not stopped.is_set():
+                    self._status_bar.set_value(self._name, value)
+            stopped.wait(self._interval)
+
+
+class _State:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # bumped by every invalidation, renders started before are not cached
+        self.generation = 0
+        self.tokens = None
+        self.rprompt_tokens = None
+        self.values = {}
+        self.providers = {}
+        self.running = False
+        self.on_invalidate = None
+
 
 class StatusBar(eventbus.Listener):
+    """
+    The bottom toolbar and the right prompt of the interactive shell.
+
+    The tokens returned by `get_tokens` and `get_rprompt_tokens` are cached
+    and only computed again after `invalidate()` is called, which redraws
+    the shell. The shell invalidates the status bar after every command and
+    fan-out progress update. Data that changes on its own should come from
+    providers (see `add_provider`) that fetch it in the background, so that
+    rendering never waits on them and idle shells do no work.
+    """
+
     def __init__(self, context):
         pass
 
+    def _status_state(self):
+        state = self.__dict__.get("_status_bar_state")
+        if state is None:
+            with _state_lock:
+                state = self.__dict__.setdefault("_status_bar_state", _State())
+        return state
+
     def on_connected(self, *args, **kwargs):
         """
         Do nothing by default.
@@ -27,11 +104,97 @@ class StatusBar(eventbus.Listener):
     def set_last_command_status(self, status):
         pass
 
+    def set_progress(self, cmd, completed, total):
+        """
+        Called with the progress of fan-out commands, override this to show
+        it in the status bar
+        """
+        pass
+
     def get_tokens(self):
         return []
 
+    def invalidate(self):
+        """
+        Drops the cached tokens and redraws the shell, can be called from
+        any thread
+        """
+        state = self._status_state()
+        with state.lock:
+            state.generation += 1
+            state.tokens = state.rprompt_tokens = None
+            on_invalidate = state.on_invalidate
+        if on_invalidate is not None:
+            on_invalidate()
+
+    def set_invalidate_callback(self, callback):
+        """Called by the shell with the function redrawing the screen"""
+        self._status_state().on_invalidate = callback
+
+    def _render(self, attr, get_tokens):
+        state = self._status_state()
+        with state.lock:
+            tokens = getattr(state, attr)
+            generation = state.generation
+        if tokens is not None:
+            return tokens
+        tokens = list(get_tokens())
+        with state.lock:
+            if state.generation == generation:
+                setattr(state, attr, tokens)
+        return tokens
+
+    def render_tokens(self):
+        """The tokens of `get_tokens`, cached until the next invalidation"""
+        return self._render("tokens", self.get_tokens)
+
+    def render_rprompt_tokens(self):
+        """The tokens of `get_rprompt_tokens`, cached like `render_tokens`"""
+        return self._render("rprompt_tokens", self.get_rprompt_tokens)
+
+    def add_provider(self, name, fetch, interval):
+        """
+        Calls `fetch` every `interval` seconds on a background thread while
+        the status bar is started. Its result is available through
+        `get_value(name)` and the status bar is invalidated when it changes.
+        """
+        state = self._status_state()
+        provider = _Provider(self, name, fetch, interval)
+        with state.lock:
+            previous = state.providers.get(name)
+            state.providers[name] = provider
+            running = state.running
+        if previous is not None:
+            previous.stop()
+        if running:
+            provider.start()
+
+    def get_value(self, name, default=None):
+        """The last value fetched by the provider `name`"""
+        return self._status_state().values.get(name, default)
+
+    def set_value(self, name, value):
+        """Sets a value read with `get_value`, invalidating on changes"""
+        state = self._status_state()
+        with state.lock:
+            changed = state.values.get(name, _MISSING) != value
+            state.values[name] = value
+        if changed:
+            self.invalidate()
+
     def start(self):
-        pass
+        """Starts the providers, subclasses overriding it must call it"""
+        state = self._status_state()
+        with state.lock:
+            state.running = True
+            providers = list(state.providers.values())
+        for provider in providers:
+            provider.start()
 
     def stop(self):
-        pass
+        state = self._status_state()
+        with state.lock:
+            state.running = False
+            providers = list(state.providers.values())
+        for provider in providers:
+            provider.stop()
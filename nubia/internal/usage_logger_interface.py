@@ -30,6 +30,21 @@ class UsageLoggerInterface:
         """
         pass
 
+    def pre_exec_command(self, cmd, params, is_cli):
+        """
+        Called before every command execution with the command name and its
+        parameters (the raw argument string in interactive mode or the parsed
+        arguments in CLI mode). Calls `pre_exec` by default.
+        """
+        self.pre_exec()
+
+    def record_queue_wait(self, cmd, resources, wait_time):
+        """
+        Called before `post_exec` for commands that declare resources, with
+        the seconds spent waiting for the resources to become available.
+        """
+        pass
+
     def post_exec(self, cmd, params, result, is_cli):
         """
         Called after every command execution.
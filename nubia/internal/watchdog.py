@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+"""
+A watchdog that captures stack samples of slow commands.
+
+While a command runs, a background thread samples the stacks of the command
+thread (and of any thread started while the command runs, e.g. fan-out
+workers, but not nubia's own background threads) through
+`sys._current_frames`. If the command finishes under the
+threshold the samples are discarded, otherwise they are written in the
+collapsed-stack format understood by flamegraph.pl, speedscope and friends,
+next to a JSON file that describes the command.
+"""
+
+import json
+import logging
+import os
+import itertools
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_INTERVAL = 0.01
+# nubia names its background threads (output flusher, event delivery, log
+# writer...) with this prefix, they are idle or unrelated to the command
+INFRASTRUCTURE_THREAD_PREFIX = "nubia-"
+# the nubia threads running the command itself
+COMMAND_THREAD_PREFIXES = ("nubia-fanout-",)
+
+_unsafe_chars = re.compile(r"[^a-zA-Z0-9_\-]+")
+
+
+def _is_infrastructure(name):
+    return name.startswith(INFRASTRUCTURE_THREAD_PREFIX) and not name.startswith(
+        COMMAND_THREAD_PREFIXES
+    )
+
+
+def collapse_stack(frame):
+    """Returns the collapsed (root first, `;` separated) stack of a frame"""
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(
+            "{} ({}:{})".format(code.co_name, code.co_filename, frame.f_lineno)
+        )
+        frame = frame.f_back
+    return ";".join(reversed(frames))
+
+
+class StackSampler:
+    """
+    Samples the stacks of the thread that started it, and of the threads
+    created after it started (except nubia's background threads), every
+    `interval` seconds
+    """
+
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL):
+        self._interval = interval
+        self._samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self._ignored_threads = set()
+
+    def start(self):
+        self._target = threading.get_ident()
+        self._ignored_threads = {
+            ident for ident in sys._current_frames() if ident != self._target
+        }
+        self._thread = threading.Thread(
+            target=self._run, name="nubia-stack-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self._interval):
+            frames = sys._current_frames()
+            for thread in threading.enumerate():
+                ident = thread.ident
+                if (
+                    ident == own
+                    or ident in self._ignored_threads
+                    or ident not in frames
+                    or (ident != self._target and _is_infrastructure(thread.name))
+                ):
+                    continue
+                self._samples[collapse_stack(frames[ident])] += 1
+
+    def stop(self):
+        """Stops sampling and returns a Counter of collapsed stacks"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        return self._samples
+
+
+class _Watch:
+    def __init__(self, watchdog, cmd, kwargs, raw):
+        self._watchdog = watchdog
+        self._cmd = cmd
+        self._kwargs = kwargs
+        self._raw = raw
+
+    def __enter__(self):
+        self._sampler = StackSampler(self._watchdog.interval)
+        self._sampler.start()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        samples = self._sampler.stop()
+        duration = time.perf_counter() - self._start
+        if duration >= self._watchdog.threshold:
+            try:
+                self._watchdog.write_profile(
+                    self._cmd, self._kwargs, self._raw, duration, samples
+                )
+            except Exception as e:
+                logger.warning("Failed to write slow command profile: %s", e)
+
+
+class _NoWatch:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NO_WATCH = _NoWatch()
+
+
+class SlowCommandWatchdog:
+    """
+    Samples every command while it runs and keeps the samples of the commands
+    that take longer than `threshold` seconds
+    """
+
+    def __init__(self, threshold, output_dir=None, interval=None):
+        self.threshold = threshold
+        self.output_dir = output_dir or tempfile.gettempdir()
+        self.interval = interval or DEFAULT_SAMPLE_INTERVAL
+        self._sequence = itertools.count()
+
+    def watch(self, cmd, kwargs, raw=None):
+        """
+        A context manager that samples the enclosed command execution
+
+        @param cmd     The command name
+        @param kwargs  The arguments the command function is called with
+        @param raw     The command line, if known
+        """
+        return _Watch(self, cmd, kwargs, raw)
+
+    def write_profile(self, cmd, kwargs, raw, duration, samples):
+        basename = os.path.join(
+            self.output_dir,
+            "nubia-slow-{}-{}-{}-{}".format(
+                _unsafe_chars.sub("_", cmd),
+                time.strftime("%Y%m%d-%H%M%S"),
+                os.getpid(),
+                next(self._sequence),
+            ),
+        )
+        with open(basename + ".collapsed", "w") as f:
+            for stack, count in samples.most_common():
+                f.write("{} {}\n".format(stack, count))
+        with open(basename + ".json", "w") as f:
+            json.dump(
+                {
+                    "command": cmd,
+                    "command_line": raw,
+                    "arguments": {k: repr(v) for k, v in kwargs.items()},
+                    "duration": duration,
+                    "threshold": self.threshold,
+                    "sample_interval": self.interval,
+                    "samples": sum(samples.values()),
+                },
+                f,
+                indent=2,
+            )
+        logger.warning(
+            "Command %s took %.3fs, stack samples written to %s.collapsed",
+            cmd,
+            duration,
+            basename,
+        )
+        return basename
@@ -14,6 +14,9 @@ import json
 import string
 import shlex
 
+from nubia_complete.dynamic_values import DynamicValues, default_cache_path
+from nubia_complete.indexed_model import IndexedModel, is_indexed_model
+
 logger = logging.getLogger(__name__)
 
 option_regex = re.compile("(?P<key>\-\-?[\w\-]+\=)")
@@ -62,57 +65,123 @@ def run_complete(args):
         tokens = tokens[:-1]
     logger.debug("Input Tokens: %s", tokens)
     logger.debug("Current token: %s", current_token)
-    # loading the model
-    with open(model_file, "r") as f:
-        model = json.load(f)
-
-    completions = get_completions(model, tokens, current_token, comp_shell)
+    model = load_model(model_file)
+    dynamic_values = None
+    if model.get("values_hook"):
+        ttl = os.getenv("NUBIA_COMPLETER_CACHE_TTL")
+        dynamic_values = DynamicValues(
+            model.get("values_hook"),
+            default_cache_path(model_file),
+            int(ttl) if ttl else None,
+        )
+    completions = get_completions(
+        model, tokens, current_token, comp_shell, dynamic_values
+    )
     for completion in completions:
         logger.debug("Completion: @%s@", completion)
         print(completion)
 
 
-def _drop_from_options(options, token, skip_value=False):
-    # does this token in the format "-[-]x=" ?
-    tokens = token.split("=")
-    if skip_value:
-        tokens = tokens[:1]
-    for i, option in enumerate(options):
-        logger.debug("Tokens: %s", tokens)
-        if tokens[0] == option.get("name") or tokens[0] in option.get(
-            "extra_names"
-        ):
-            logger.debug("Dropping option %s", option)
-            if option.get("expects_argument"):
-                if len(tokens) > 1:
-                    # we have the argument already
-                    options.pop(i)
-                    return None
-                return options.pop(i)
-            else:
-                return None
-        else:
-            logger.debug("mismatch: %s and %s", option.get("name"), tokens[0])
+class JsonModel:
+    """Wraps a command model (or the subcommands of a command) loaded as JSON"""
+
+    def __init__(self, model):
+        self._model = model
+        self._commands = {}
+        for command in model.get("commands", []):
+            self._commands.setdefault(command["name"], command)
+
+    @property
+    def options(self):
+        return self._model.get("options", [])
+
+    def get(self, key, default=None):
+        return self._model.get(key, default)
+
+    def find_command(self, name):
+        return self._commands.get(name)
+
+    def command_names(self, prefix=""):
+        return [name for name in self._commands if name.startswith(prefix)]
+
 
+def load_model(model_file):
+    """
+    Loads the command model, memory-mapping it if it's in the indexed format
+    and falling back to parsing the whole JSON model otherwise
+    """
+    logger.debug("Loading the command model from %s", model_file)
+    if is_indexed_model(model_file):
+        return IndexedModel(model_file)
+    with open(model_file, "r") as f:
+        return JsonModel(json.load(f))
+
+
+class _ExpectedOptions:
+    """The options that can still be used, indexed by all their names"""
+
+    def __init__(self, options=()):
+        # ordered, maps id(option) to the option
+        self._remaining = {}
+        self._by_name = {}
+        self.extend(options)
+
+    def extend(self, options):
+        for option in options:
+            self._remaining[id(option)] = option
+            for name in [option.get("name")] + option.get("extra_names", []):
+                self._by_name.setdefault(name, []).append(option)
+
+    def __iter__(self):
+        return iter(list(self._remaining.values()))
 
-def _get_values_for_option(option, prefix=""):
+    def find(self, name):
+        for option in self._by_name.get(name, []):
+            if id(option) in self._remaining:
+                return option
+        return None
+
+    def drop(self, token, skip_value=False):
+        # does this token in the format "-[-]x=" ?
+        tokens = token.split("=")
+        if skip_value:
+            tokens = tokens[:1]
+        option = self.find(tokens[0])
+        if option is None:
+            logger.debug("No expected option matches %s", tokens[0])
+            return None
+        logger.debug("Dropping option %s", option)
+        if not option.get("expects_argument"):
+            return None
+        del self._remaining[id(option)]
+        if len(tokens) > 1:
+            # we have the argument already
+            return None
+        return option
+
+
+def _get_values_for_option(option, prefix="", dynamic_values=None):
     logger.debug("Should auto-complete for option %s", option.get("name"))
     output = option.get("values", [])
+    if option.get("dynamic") and dynamic_values:
+        output = dynamic_values.get(option["dynamic"], fallback=output)
     if output:
         output = [prefix + _space_suffix(k) for k in output]
     logger.debug("Values: %s", output)
     return output
 
 
-def get_completions(model, tokens, current, shell):
+def get_completions(model, tokens, current, shell, dynamic_values=None):
+    if isinstance(model, dict):
+        model = JsonModel(model)
     output = []
-    options_we_expect = model["options"]
-    current_command_list = model.get("commands", [])
+    options_we_expect = _ExpectedOptions(model.options)
+    current_commands = model
     last_option_found = None
     for token in tokens:
         if token.startswith("-"):
             # it's an option, drop it from expected
-            current_option = _drop_from_options(options_we_expect, token)
+            current_option = options_we_expect.drop(token)
             if current_option and current_option.get("expects_argument"):
                 last_option_found = current_option
         else:
@@ -130,13 +199,12 @@ def get_completions(model, tokens, current, shell):
                 last_option_found = None
                 continue
             last_option_found = None
-            for command in current_command_list:
-                if token == command.get("name"):
-                    logger.debug("We matched command %s", command.get("name"))
-                    options_we_expect.extend(command.get("options", []))
-                    # for sub-commands
-                    current_command_list = command.get("commands", [])
-                    break
+            command = current_commands.find_command(token)
+            if command:
+                logger.debug("We matched command %s", command.get("name"))
+                options_we_expect.extend(command.get("options", []))
+                # for sub-commands
+                current_commands = JsonModel(command)
             else:
                 logger.debug(
                     "We didn't find any matching command, ignoring the"
@@ -146,7 +214,7 @@ def get_completions(model, tokens, current, shell):
                 # Now that we know where we are, let's complete the current token:
     if last_option_found:
         # we are expecting a value for this
-        output = _get_values_for_option(last_option_found)
+        output = _get_values_for_option(last_option_found, "", dynamic_values)
     else:
         # If the current token is '--something=' then we should try to
         # autocomplete a value for this
@@ -156,9 +224,7 @@ def get_completions(model, tokens, current, shell):
                 key = match.groupdict()["key"]
                 logger.debug("We are in a value-completion inside %s", key)
                 # it's true
-                option = _drop_from_options(
-                    options_we_expect, current, skip_value=True
-                )
+                option = options_we_expect.drop(current, skip_value=True)
                 if option:
                     # YES, we have it, let's get the values
                     prefix = ""
@@ -166,10 +232,11 @@ def get_completions(model, tokens, current, shell):
                         # in zsh, we need to prepend the completions with the
                         # key
                         prefix = key
-                    return _get_values_for_option(option, prefix)
+                    return _get_values_for_option(option, prefix, dynamic_values)
 
         output.extend(_completions_for_options(options_we_expect))
-        output.extend(_completions_for_commands(current_command_list))
+        command_names = current_commands.command_names(current or "")
+        output.extend(_space_suffix(name) for name in command_names)
     return output
 
 
@@ -193,7 +260,3 @@ def _completions_for_options(options):
             expects_argument = True
         output.append(__suffix(option.get("name"), expects_argument))
     return output
-
-
-def _completions_for_commands(commands):
-    return [_space_suffix(x["name"]) for x in commands]
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+"""
+Values of dynamic options for the external completer.
+
+The values are fetched by calling the plugin hook named in the command model
+("package.module:function") and kept in a per-user cache file. Completion
+never waits for the hook: fresh values are served from the cache, stale
+values are served while a detached process fetches them again, and missing
+values fall back to the snapshot stored in the model (if any) while they are
+fetched in the background. Processes refreshing values at the same time
+update the cache file one after the other (with `fcntl` locks, where
+available).
+"""
+
+import contextlib
+import hashlib
+import importlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 300
+# a lock older than this belongs to a refresh that died
+STALE_LOCK_SECONDS = 60
+
+
+def default_cache_path(model_file):
+    cache_home = os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    digest = hashlib.sha1(os.path.abspath(model_file).encode("utf-8")).hexdigest()
+    return os.path.join(cache_home, "nubia_complete", digest[:16] + ".json")
+
+
+def load_hook(hook):
+    module_name, _, function_name = hook.partition(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+class DynamicValues:
+    def __init__(self, hook, cache_path, ttl=None):
+        self._hook = hook
+        self._cache_path = cache_path
+        self._ttl = DEFAULT_TTL if ttl is None else ttl
+
+    def _read_cache(self):
+        try:
+            with open(self._cache_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, key, fallback=None):
+        entry = self._read_cache().get(key)
+        if entry is None:
+            logger.debug("No cached values for %s", key)
+            self.refresh_in_background(key)
+            return fallback or []
+        if time.time() - entry.get("fetched_at", 0) >= self._ttl:
+            logger.debug("Cached values for %s are stale", key)
+            self.refresh_in_background(key)
+        return entry.get("values", [])
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Held while reading, merging and writing the cache file"""
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(self._cache_path + ".flock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            # closing the file releases the lock
+            os.close(fd)
+
+    def refresh(self, key):
+        values = list(load_hook(self._hook)(key))
+        directory = os.path.dirname(self._cache_path)
+        os.makedirs(directory, exist_ok=True)
+        with self._locked():
+            # other keys may have been refreshed since we started
+            cache = self._read_cache()
+            cache[key] = {"values": values, "fetched_at": time.time()}
+            with tempfile.NamedTemporaryFile(
+                mode="w", dir=directory, delete=False
+            ) as f:
+                json.dump(cache, f)
+            os.replace(f.name, self._cache_path)
+        return values
+
+    def _try_lock(self, key):
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        lock = "{}.{}.lock".format(self._cache_path, digest)
+        try:
+            if time.time() - os.path.getmtime(lock) > STALE_LOCK_SECONDS:
+                os.unlink(lock)
+        except OSError:
+            pass
+        try:
+            os.makedirs(os.path.dirname(lock), exist_ok=True)
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return lock
+        except OSError:
+            return None
+
+    def refresh_in_background(self, key):
+        """Fetches the values of `key` in a detached process"""
+        if not hasattr(os, "fork"):
+            return False
+        lock = self._try_lock(key)
+        if not lock:
+            logger.debug("Values of %s are already being refreshed", key)
+            return False
+        pid = os.fork()
+        if pid:
+            # reap the intermediate child, the refresh runs in its child
+            os.waitpid(pid, 0)
+            return True
+        try:
+            os.setsid()
+            if os.fork() == 0:
+                # the shell waits until the completer's output is closed
+                devnull = os.open(os.devnull, os.O_RDWR)
+                for fd in (0, 1, 2):
+                    os.dup2(devnull, fd)
+                try:
+                    self.refresh(key)
+                except Exception:
+                    logger.exception("Failed to refresh the values of %s", key)
+                finally:
+                    os.unlink(lock)
+        finally:
+            os._exit(0)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+"""
+A compact, indexed encoding of the command model.
+
+The JSON model has to be parsed in its entirety on every completion request,
+this format lets the completer memory-map the file and decode only the
+commands it needs. The layout (all integers are little-endian) is:
+
+    header        magic, version, number of commands, globals span
+    offset table  one fixed-size entry per top-level command, sorted by name:
+                  (name offset, name length, shard offset, shard length)
+    name table    the utf-8 encoded command names
+    shards        the JSON encoding of every command, followed by the JSON
+                  object holding the rest of the model (global options, ...)
+
+All the offsets are absolute. Since the entries are sorted by name, the table
+can be bisected to find a command or all the commands sharing a prefix.
+"""
+
+import json
+import mmap
+import struct
+
+MAGIC = b"NBCM"
+VERSION = 2
+
+# magic, version, reserved, commands count, globals offset and length
+_HEADER = struct.Struct("<4sHHIII")
+# name offset, name length, shard offset, shard length
+_ENTRY = struct.Struct("<IIII")
+
+
+def _encode_json(obj):
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+def dumps(model):
+    """Encodes a command model (as built by `export_registry`) to bytes"""
+    commands = sorted(
+        model.get("commands", []), key=lambda cmd: cmd["name"].encode("utf-8")
+    )
+    names = [cmd["name"].encode("utf-8") for cmd in commands]
+    shards = [_encode_json(cmd) for cmd in commands]
+    globals_shard = _encode_json(
+        {key: value for key, value in model.items() if key != "commands"}
+    )
+
+    names_start = _HEADER.size + _ENTRY.size * len(commands)
+    shards_start = names_start + sum(map(len, names))
+    globals_start = shards_start + sum(map(len, shards))
+
+    output = [
+        _HEADER.pack(
+            MAGIC, VERSION, 0, len(commands), globals_start, len(globals_shard)
+        )
+    ]
+    name_offset, shard_offset = names_start, shards_start
+    for name, shard in zip(names, shards):
+        output.append(_ENTRY.pack(name_offset, len(name), shard_offset, len(shard)))
+        name_offset += len(name)
+        shard_offset += len(shard)
+    output.extend(names)
+    output.extend(shards)
+    output.append(globals_shard)
+    return b"".join(output)
+
+
+def is_indexed_model(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class IndexedModel:
+    """
+    Read-only access to an indexed model file. Only the header is decoded
+    when opening the file, names and shards are decoded on access.
+    """
+
+    def __init__(self, path):
+        self._globals_cache = None
+        with open(path, "rb") as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (
+            magic,
+            version,
+            _,
+            self._count,
+            self._globals_offset,
+            self._globals_length,
+        ) = _HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC:
+            raise ValueError("{} is not an indexed command model".format(path))
+        if version != VERSION:
+            raise ValueError(
+                "Unsupported command model version {} in {}".format(version, path)
+            )
+
+    def close(self):
+        self._buffer.close()
+
+    def __len__(self):
+        return self._count
+
+    def _entry(self, index):
+        return _ENTRY.unpack_from(self._buffer, _HEADER.size + index * _ENTRY.size)
+
+    def _name(self, index):
+        name_offset, name_length, _, _ = self._entry(index)
+        return self._buffer[name_offset : name_offset + name_length]
+
+    def _shard(self, index):
+        _, _, shard_offset, shard_length = self._entry(index)
+        return json.loads(
+            self._buffer[shard_offset : shard_offset + shard_length].decode("utf-8")
+        )
+
+    def _bisect(self, name):
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._name(middle) < name:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _globals(self):
+        if self._globals_cache is None:
+            start = self._globals_offset
+            self._globals_cache = json.loads(
+                self._buffer[start : start + self._globals_length].decode("utf-8")
+            )
+        return self._globals_cache
+
+    @property
+    def options(self):
+        return self._globals().get("options", [])
+
+    def get(self, key, default=None):
+        """Returns a top-level entry of the model other than the commands"""
+        return self._globals().get(key, default)
+
+    def find_command(self, name):
+        """Returns the model of the command `name`, or None"""
+        encoded = name.encode("utf-8")
+        index = self._bisect(encoded)
+        if index < self._count and self._name(index) == encoded:
+            return self._shard(index)
+        return None
+
+    def command_names(self, prefix=""):
+        """Returns the sorted names of the commands starting with `prefix`"""
+        encoded = prefix.encode("utf-8")
+        output = []
+        for index in range(self._bisect(encoded), self._count):
+            name = self._name(index)
+            if not name.startswith(encoded):
+                break
+            output.append(name.decode("utf-8"))
+        return output
@@ -51,6 +51,12 @@ def run(args):
         required=True,
         help="The location on which to find the command model",
     )
+    generate_parser.add_argument(
+        "--static",
+        action="store_true",
+        help="Compile the command model into shell functions, the Python "
+        "completer is then only started for options with dynamic values",
+    )
     complete_parser.add_argument(
         "--command-model-path",
         type=str,
@@ -62,7 +68,9 @@ def run(args):
     log_level = logging.getLevelName(args.loglevel)
     logging.basicConfig(level=log_level)
     if args.mode == "generate-shell-setup":
-        return generate_shell_setup(args.target_binary_name, args.command_model_path)
+        return generate_shell_setup(
+            args.target_binary_name, args.command_model_path, args.static
+        )
     elif args.mode == "complete":
         return run_complete(args)
     else:
@@ -10,11 +10,14 @@
 import sys
 import string
 import re
+import shlex
+
+from nubia_complete.completer import JsonModel, load_model
 
 regex = re.compile("[{}]".format(re.escape(string.punctuation)))
 
 
-def generate_shell_setup(command_name, command_model):
+def generate_shell_setup(command_name, command_model, static=False):
     clean_command_name = regex.sub("_", command_name)
     func_name = "_nubia_completer_{}".format(clean_command_name)
 
@@ -74,3 +77,218 @@ fi
             model=command_model,
         )
     )
+    if static:
+        # the functions above are kept to complete the dynamic options
+        print(generate_static_setup(command_name, func_name, command_model))
+
+
+# Completes a command line (cut at the cursor) using only the tables compiled
+# from the model. Tables are keyed by the path of the command being completed
+# ("/", "/cmd/", "/cmd/subcmd/"), options are keyed by path and name
+# ("/cmd/--opt"). Returns 2 when the values of a dynamic option are needed,
+# in which case the caller defers to the Python completer.
+STATIC_COMPLETER_TEMPLATE = """
+  {func_name}_static() {{
+    local IFS=$' \\t\\n'
+    local line="$1" shell="$2" path="/" expect="" used=" " cur="" skip=1
+    local word entry option kind prefix
+    local -a words
+    local suffix=${{NUBIA_SUFFIX_ENABLED:-1}}
+    case "$line" in
+      *[[:space:]]|"") ;;
+      *) cur="${{line##*[[:space:]]}}"; line="${{line%"$cur"}}" ;;
+    esac
+    # split without pathname expansion, a typed * must not match files
+    {split_line}
+    for word in "${{words[@]}}"; do
+      if [[ $skip == 1 ]]; then
+        # the executable name
+        skip=0
+        continue
+      fi
+      if [[ -n $expect ]]; then
+        expect=""
+        continue
+      fi
+      case "$word" in
+        -*)
+          entry="${{{func_name}_lookup[$path${{word%%=*}}]-}}"
+          if [[ ${{entry#* }} == arg ]]; then
+            used="$used${{entry% *}} "
+            if [[ $word != *=* ]]; then
+              expect="${{entry% *}}"
+            fi
+          fi
+          ;;
+        *)
+          if [[ -n ${{{func_name}_paths[$path$word/]-}} ]]; then
+            path="$path$word/"
+          fi
+          ;;
+      esac
+    done
+    option="$expect"
+    if [[ -z $option && $cur == -*=* ]]; then
+      entry="${{{func_name}_lookup[$path${{cur%%=*}}]-}}"
+      if [[ ${{entry#* }} == arg ]]; then
+        option="${{entry% *}}"
+        if [[ $shell == zsh ]]; then
+          prefix="${{cur%%=*}}="
+        fi
+      fi
+    fi
+    if [[ -n $option ]]; then
+      if [[ -n ${{{func_name}_dynamic[$path$option]-}} ]]; then
+        return 2
+      fi
+      while IFS= read -r word; do
+        [[ -n $word ]] && printf '%s\\n' "$prefix$word "
+      done <<< "${{{func_name}_values[$path$option]-}}"
+      return 0
+    fi
+    while IFS=' ' read -r option kind; do
+      [[ -z $option || $used == *" $option "* ]] && continue
+      if [[ $kind == arg && $suffix == 1 ]]; then
+        printf '%s\\n' "$option="
+      else
+        printf '%s\\n' "$option "
+      fi
+    done <<< "${{{func_name}_options[$path]-}}"
+    while IFS= read -r word; do
+      [[ -n $word ]] && printf '%s\\n' "$word "
+    done <<< "${{{func_name}_children[$path]-}}"
+    return 0
+  }}
+"""
+
+STATIC_TEMPLATE = """
+if [[ -n ${{ZSH_VERSION-}} ]]; then
+  # zsh static setup
+{zsh_tables}
+{zsh_completer}
+  _zsh_static_{func_name}() {{
+    local IFS=$'\\n' candidates
+    read -l;
+    local cl="$REPLY";
+    read -ln;
+    local cp="$REPLY";
+    candidates="$({func_name}_static "${{cl:0:$((cp - 1))}}" zsh)"
+    if [[ $? == 2 ]]; then
+      _zsh_{func_name} "$@"
+      return
+    fi
+    reply=(${{(f)candidates}})
+  }}
+
+  compctl -Q -S '' -K _zsh_static_{func_name} "{command}"
+
+elif [[ ${{BASH_VERSINFO[0]}} -gt 4 ||
+        ( ${{BASH_VERSINFO[0]}} -eq 4 && ${{BASH_VERSINFO[1]}} -ge 2 ) ]]; then
+  # bash static setup, the tables (declare -gA) need bash 4.2 or later, older
+  # versions keep the dynamic completer
+{bash_tables}
+{bash_completer}
+  _bash_static_{func_name}() {{
+    local IFS=$'\\n' candidates
+    COMPREPLY=()
+    candidates="$({func_name}_static "${{COMP_LINE:0:COMP_POINT}}" bash)"
+    if [[ $? == 2 ]]; then
+      _bash_{func_name} "$@"
+      return
+    fi
+    COMPREPLY=( $(compgen -W "$candidates" -- "$2") )
+    return 0
+  }}
+
+  complete -o nospace -F _bash_static_{func_name} "{command}"
+fi
+"""
+
+
+def _compile_tables(model):
+    """
+    Flattens the command model into the tables used by the static completer,
+    every table maps a string key to a string value
+    """
+    tables = {
+        "paths": {},
+        "children": {},
+        "options": {},
+        "lookup": {},
+        "values": {},
+        "dynamic": {},
+    }
+
+    def visit(path, commands, options):
+        tables["paths"][path] = "1"
+        names = commands.command_names()
+        tables["children"][path] = "\n".join(names)
+        lines = []
+        for option in options:
+            name = option.get("name")
+            if not name:
+                continue
+            kind = "arg" if option.get("expects_argument") else "flag"
+            lines.append("{} {}".format(name, kind))
+            for alias in [name] + option.get("extra_names", []):
+                tables["lookup"].setdefault(path + alias, "{} {}".format(name, kind))
+            if option.get("values"):
+                tables["values"][path + name] = "\n".join(
+                    str(value) for value in option["values"]
+                )
+            if option.get("dynamic"):
+                tables["dynamic"][path + name] = "1"
+        tables["options"][path] = "\n".join(lines)
+        for name in names:
+            command = commands.find_command(name)
+            visit(
+                "{}{}/".format(path, name),
+                JsonModel(command),
+                options + command.get("options", []),
+            )
+
+    visit("/", model, list(model.options))
+    return tables
+
+
+def _bash_tables(func_name, tables):
+    output = []
+    for table, entries in sorted(tables.items()):
+        output.append("  declare -gA {}_{}=(".format(func_name, table))
+        for key, value in sorted(entries.items()):
+            output.append(
+                "    [{}]={}".format(shlex.quote(key), shlex.quote(value))
+            )
+        output.append("  )")
+    return "\n".join(output)
+
+
+def _zsh_tables(func_name, tables):
+    output = []
+    for table, entries in sorted(tables.items()):
+        output.append("  typeset -gA {}_{}".format(func_name, table))
+        output.append("  {}_{}=(".format(func_name, table))
+        for key, value in sorted(entries.items()):
+            output.append("    {} {}".format(shlex.quote(key), shlex.quote(value)))
+        output.append("  )")
+    return "\n".join(output)
+
+
+def generate_static_setup(command_name, func_name, command_model):
+    """
+    Compiles the command model into shell functions that complete commands,
+    sub-commands, options and static values without starting Python
+    """
+    tables = _compile_tables(load_model(command_model))
+    return STATIC_TEMPLATE.format(
+        func_name=func_name,
+        command=command_name,
+        bash_tables=_bash_tables(func_name, tables),
+        zsh_tables=_zsh_tables(func_name, tables),
+        bash_completer=STATIC_COMPLETER_TEMPLATE.format(
+            func_name=func_name, split_line='read -ra words <<< "$line"'
+        ),
+        zsh_completer=STATIC_COMPLETER_TEMPLATE.format(
+            func_name=func_name, split_line='read -rA words <<< "$line"'
+        ),
+    )
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+import asyncio
+import threading
+import time
+import unittest
+
+from nubia import command
+from nubia.internal.interactive import ShellCompleter
+from prompt_toolkit.completion import CompleteEvent, Completion
+from prompt_toolkit.document import Document
+from tests.util import TestShell
+
+
+class SlowCompleter(ShellCompleter):
+    """Produces a completion every `delay` seconds"""
+
+    def __init__(self, words, delay, superseded=None):
+        super(SlowCompleter, self).__init__(None, debounce=0.01, deadline=0.05)
+        self._words = words
+        self._delay = delay
+        self._superseded = superseded or threading.Event()
+        self.produced = []
+        # whether the completer was loading when each word was produced
+        self.loading_states = []
+
+    def get_completions(self, document, complete_event):
+        for word in self._words:
+            time.sleep(self._delay)
+            self.produced.append(word)
+            self.loading_states.append(self.loading)
+            yield Completion(word, start_position=-len(document.text))
+
+    def _is_superseded(self, document):
+        return self._superseded.is_set()
+
+
+def complete(completer, text, event=None):
+    async def collect():
+        output = []
+        async for completion in completer.get_completions_async(
+            Document(text), event or CompleteEvent(text_inserted=True)
+        ):
+            output.append(completion.display_text)
+        return output
+
+    # not asyncio.run, which leaves the thread without an event loop
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(collect())
+    finally:
+        loop.close()
+
+
+class AsyncCompleterTest(unittest.TestCase):
+    def test_same_completions_as_sync(self):
+        @command
+        def test_command(hostname: str, port: int = 0) -> int:
+            """
+            Sample Docstring
+            """
+            return 0
+
+        shell = TestShell(commands=[test_command])
+        completer = ShellCompleter(shell.registry, debounce=0.01, deadline=1)
+        for text in ("test", "test-command ", "test-command ho"):
+            expected = [
+                c.display_text
+                for c in completer.get_completions(Document(text), CompleteEvent())
+            ]
+            self.assertTrue(expected)
+            self.assertEqual(expected, complete(completer, text))
+
+    def test_loading_after_deadline(self):
+        completer = SlowCompleter(["alpha", "beta"], delay=0.1)
+        # the menu only holds the completions, the hint is in the toolbar
+        self.assertEqual(["alpha", "beta"], complete(completer, "a"))
+        self.assertTrue(completer.loading_states[-1])
+        self.assertFalse(completer.loading)
+
+        fast = SlowCompleter(["alpha"], delay=0)
+        self.assertEqual(["alpha"], complete(fast, "a"))
+        self.assertEqual([False], fast.loading_states)
+
+    def test_superseded_request_is_abandoned(self):
+        superseded = threading.Event()
+        completer = SlowCompleter(["alpha", "beta", "gamma"], 0.1, superseded)
+        threading.Timer(0.15, superseded.set).start()
+        self.assertEqual(["alpha"], complete(completer, "a"))
+        self.assertFalse(completer.loading)
+        # the worker stops producing once the request is abandoned
+        time.sleep(0.3)
+        self.assertEqual(["alpha", "beta"], completer.produced)
+
+    def test_debounced_request_is_dropped(self):
+        superseded = threading.Event()
+        superseded.set()
+        completer = SlowCompleter(["alpha"], 0, superseded)
+        self.assertEqual([], complete(completer, "a"))
+        self.assertEqual([], completer.produced)
+        # an explicit completion request is not debounced
+        self.assertEqual(
+            ["alpha"],
+            complete(completer, "a", CompleteEvent(completion_requested=True)),
+        )
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+import contextlib
+import io
+import random
+import unittest
+
+from nubia import argument, command
+from nubia.internal.bktree import BKTree, distance, suggest
+from tests.util import TestShell
+
+
+class BKTreeTest(unittest.TestCase):
+    def _run(self, shell, line):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            ret = shell.run_interactive_line(line)
+        return ret, out.getvalue()
+
+    def test_distance(self):
+        self.assertEqual(0, distance("help", "help"))
+        self.assertEqual(4, distance("", "help"))
+        self.assertEqual(1, distance("hepl", "help"))
+        self.assertEqual(1, distance("hel", "help"))
+        self.assertEqual(1, distance("halp", "help"))
+        self.assertEqual(3, distance("kitten", "sitting"))
+        # not 3 like the optimal string alignment distance: ca -> ac -> abc
+        self.assertEqual(2, distance("ca", "abc"))
+
+    def test_search_matches_brute_force_on_random_words(self):
+        rng = random.Random(0)
+
+        def word():
+            return "".join(rng.choice("abc") for _ in range(rng.randint(0, 5)))
+
+        words = {word() for _ in range(300)}
+        tree = BKTree((w, None) for w in words)
+        for _ in range(500):
+            query = word()
+            expected = sorted(
+                (distance(query, w), w) for w in words if distance(query, w) <= 2
+            )
+            self.assertEqual(expected, tree.search(query, 2), query)
+
+    def test_search_matches_linear_scan(self):
+        words = ["{}{}".format(a, b) for a in "abcdefgh" for b in "xyzw"]
+        words += ["connect", "connection", "conect", "disconnect", "status"]
+        tree = BKTree((word, None) for word in words)
+        self.assertEqual(len(words), len(tree))
+        for query in ("ax", "cnnect", "stats", "zz", "b"):
+            expected = sorted(
+                (distance(query, word), word)
+                for word in words
+                if distance(query, word) <= 2
+            )
+            self.assertEqual(expected, tree.search(query, 2))
+
+    def test_suggest_ranks_by_distance_then_usage(self):
+        tree = BKTree((word, None) for word in ["stat", "start", "state", "stop"])
+        usage = {"start": 5}.get
+        self.assertEqual(
+            ["stat", "start", "state"],
+            suggest([tree], "sta", usage=lambda name: usage(name, 0), limit=3),
+        )
+        self.assertEqual(["stat", "start"], suggest([tree], "stat", limit=2))
+
+    def test_unknown_command(self):
+        @command
+        def deploy() -> int:
+            """
+            Sample Docstring
+            """
+            return 0
+
+        @command
+        def delay() -> int:
+            """
+            Sample Docstring
+            """
+            return 0
+
+        shell = TestShell(commands=[deploy, delay])
+        _, out = self._run(shell, "deplyo")
+        self.assertIn("Did you mean deploy?", out)
+        _, out = self._run(shell, "delya")
+        self.assertIn("Did you mean delay?", out)
+        _, out = self._run(shell, "deloy")
+        self.assertIn("Did you mean delay or deploy?", out)
+        # the most used command comes first at the same distance
+        self._run(shell, "deploy")
+        _, out = self._run(shell, "deloy")
+        self.assertIn("Did you mean deploy or delay?", out)
+
+    def test_unknown_argument(self):
+        @command
+        @argument("hostname", aliases=["n"])
+        def test_command(hostname: str, port: int = 0) -> int:
+            """
+            Sample Docstring
+            """
+            return 0
+
+        shell = TestShell(commands=[test_command])
+        ret, out = self._run(shell, "test-command hostnme=a")
+        self.assertEqual(2, ret)
+        self.assertIn("Did you mean hostname?", out)
+        _, out = self._run(shell, "test-command hostname=a prot=1")
+        self.assertIn("Did you mean port?", out)
+        # aliases suggest the name they stand for
+        _, out = self._run(shell, "test-command n=a")
+        self.assertIn("Did you mean hostname?", out)
+
+    def test_unknown_sub_command(self):
+        @command
+        class SuperCommand:
+            "SuperHelp"
+
+            @command
+            def sub_command(self, arg: int):
+                "SubHelp"
+                return arg
+
+        shell = TestShell(commands=[SuperCommand])
+        ret, out = self._run(shell, "super-command sub-comand arg=1")
+        self.assertEqual(2, ret)
+        self.assertIn("Did you mean sub-command?", out)
+        _, out = self._run(shell, "super-command sub-command ar=1")
+        self.assertIn("Did you mean arg?", out)
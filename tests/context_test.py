@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+import argparse
+import threading
+import typing
+import unittest
+
+from nubia import command, context
+from tests.util import TestShell
+
+# (name of the shell, verbosity) seen by the commands, per target
+seen = {}
+
+
+@command
+def who_am_i() -> int:
+    """
+    Records the shell running the command
+    """
+    ctx = context.get_context()
+    seen["who-am-i"] = (ctx.binary_name, ctx.args.verbose)
+    return 0
+
+
+@command(fanout="targets")
+def verbose_fanout(targets: typing.List[str]) -> int:
+    """
+    Records the verbosity seen by every target
+    """
+    seen[targets[0]] = context.get_context().args.verbose
+    return 0
+
+
+class ContextTest(unittest.TestCase):
+    def setUp(self):
+        seen.clear()
+        self.ctx = context.Context()
+
+    def test_snapshots_are_immutable(self):
+        hosts = ["a", "b"]
+        self.ctx.set_args(argparse.Namespace(verbose=0, hosts=hosts))
+        args = self.ctx.args
+        with self.assertRaises(AttributeError):
+            args.verbose = 2
+        self.ctx.set_verbose("true")
+        # the former snapshot did not change, the values are not copied
+        self.assertEqual(0, args.verbose)
+        self.assertEqual(1, self.ctx.args.verbose)
+        self.assertIs(hosts, self.ctx.args.hosts)
+
+    def test_verbosity_override_is_per_thread(self):
+        self.ctx.set_args(argparse.Namespace(verbose=0))
+        results = {}
+        barrier = threading.Barrier(3)
+
+        def run(level):
+            with context.override_verbose(level):
+                barrier.wait()
+                results[level] = self.ctx.args.verbose
+
+        threads = [threading.Thread(target=run, args=(level,)) for level in (1, 2)]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        for thread in threads:
+            thread.join()
+        self.assertEqual({1: 1, 2: 2}, results)
+        self.assertEqual(0, self.ctx.args.verbose)
+        with context.override_verbose(None):
+            self.assertEqual(0, self.ctx.args.verbose)
+
+    def test_commands_override_the_verbosity(self):
+        shell = TestShell(commands=[who_am_i, verbose_fanout])
+        shell.run_interactive_line("who-am-i verbose=3")
+        self.assertEqual(3, seen["who-am-i"][1])
+        shell.run_interactive_line("who-am-i")
+        self.assertEqual(0, seen["who-am-i"][1])
+        shell.run_interactive_line("verbose-fanout targets=[a, b, c] verbose=2")
+        self.assertEqual(2, seen["a"])
+        self.assertEqual({"a", "b", "c", "who-am-i"}, set(seen))
+        self.assertTrue(all(seen[target] == 2 for target in "abc"))
+
+    def test_one_context_per_shell(self):
+        first = TestShell(commands=[who_am_i], name="first")
+        second = TestShell(commands=[who_am_i], name="second")
+        first.run_interactive_line("who-am-i")
+        self.assertEqual("first", seen["who-am-i"][0])
+        second.run_cli_line("second who-am-i")
+        self.assertEqual("second", seen["who-am-i"][0])
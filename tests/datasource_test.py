@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+import time
+import unittest
+
+from nubia import CachedCompletionDataSource, argument, command
+from prompt_toolkit.completion import CompleteEvent
+from prompt_toolkit.document import Document
+from tests.util import TestShell
+
+
+class CountingSource(CachedCompletionDataSource):
+    def __init__(self, values, ttl=300):
+        super(CountingSource, self).__init__(ttl=ttl)
+        self.values = values
+        self.fetches = 0
+
+    def fetch(self):
+        self.fetches += 1
+        return list(self.values)
+
+
+class CachedCompletionDataSourceTest(unittest.TestCase):
+    def test_prefix_lookup_and_membership(self):
+        source = CountingSource(["web2", "Web1", "db1", "webby"])
+        self.assertEqual(["Web1", "web2", "webby"], source.get_completions("WEB"))
+        self.assertEqual(["db1"], source.get_completions("d"))
+        self.assertEqual([], source.get_completions("x"))
+        self.assertIn("db1", source)
+        self.assertNotIn("web1", source)
+        self.assertNotIn(["unhashable"], source)
+        self.assertEqual(1, source.fetches)
+
+    def test_stale_values_are_refreshed_in_background(self):
+        source = CountingSource(["a"], ttl=0.01)
+        self.assertEqual(["a"], source.get_all())
+        source.values = ["b"]
+        time.sleep(0.02)
+        # the stale values are served while fetching the new ones
+        self.assertEqual(["a"], source.get_all())
+        source._refresh_thread.join()
+        self.assertEqual(["b"], source.get_all())
+        self.assertEqual(2, source.fetches)
+
+    def test_prefetch(self):
+        source = CountingSource(["a"])
+        source.prefetch()
+        source._refresh_thread.join()
+        self.assertEqual(1, source.fetches)
+        self.assertIn("a", source)
+        self.assertEqual(1, source.fetches)
+
+    def test_command_choices_and_completer(self):
+        hosts = CountingSource(["host1", "host2", "other"])
+        clusters = CountingSource(["east", "west"])
+
+        @command
+        @argument("host", choices=hosts)
+        @argument("cluster", completer=clusters)
+        def connect_host(host: str, cluster: str = "") -> int:
+            """
+            Sample Docstring
+            """
+            return 0
+
+        shell = TestShell(commands=[connect_host])
+        self.assertEqual(0, shell.run_interactive_line("connect-host host=host1"))
+        self.assertEqual(4, shell.run_interactive_line("connect-host host=nope"))
+        self.assertEqual(
+            0, shell.run_cli_line("test_shell connect-host --host=host2")
+        )
+        self.assertEqual(4, shell.run_cli_line("test_shell connect-host --host=x"))
+        # completer values are only suggested, not enforced
+        self.assertEqual(
+            0, shell.run_interactive_line("connect-host host=host1 cluster=north")
+        )
+
+        cmd = shell.registry.find_command("connect-host")
+        for line, expected in [
+            ("connect-host host=h", ["host1", "host2"]),
+            ("connect-host cluster=w", ["west"]),
+        ]:
+            document = Document(line[len("connect-host ") :])
+            completions = cmd.get_completions(
+                "connect-host", document, CompleteEvent()
+            )
+            self.assertEqual(expected, [c.text for c in completions])
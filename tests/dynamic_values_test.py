@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from nubia import CachedCompletionDataSource, argument, command
+from nubia.internal import registry_tools
+from nubia_complete.completer import get_completions
+from nubia_complete.dynamic_values import DynamicValues
+from tests.util import TestShell
+
+HOOK = "tests.dynamic_values_test:values_hook"
+
+
+def values_hook(key):
+    return ["{}-{}".format(key.split()[-1].lstrip("-"), i) for i in range(2)]
+
+
+class DynamicValuesTest(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self._dir.name, "cache", "values.json")
+
+    def tearDown(self):
+        # let the background refreshes finish before removing their files
+        directory = os.path.dirname(self.cache_path)
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and os.path.isdir(directory):
+            if not any(name.endswith(".lock") for name in os.listdir(directory)):
+                break
+            time.sleep(0.01)
+        self._dir.cleanup()
+
+    def wait_for_cache(self, key):
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            try:
+                with open(self.cache_path) as f:
+                    if key in json.load(f):
+                        return
+            except (OSError, ValueError):
+                pass
+            time.sleep(0.01)
+        self.fail("The values of {} were never cached".format(key))
+
+    def test_fresh_values_are_served_from_the_cache(self):
+        values = DynamicValues(HOOK, self.cache_path)
+        self.assertEqual(["host-0", "host-1"], values.refresh("cmd --host"))
+        self.assertEqual(["host-0", "host-1"], values.get("cmd --host"))
+
+    def test_concurrent_refreshes_keep_every_key(self):
+        values = DynamicValues(HOOK, self.cache_path)
+        keys = ["--host{}".format(i) for i in range(8)]
+        threads = [threading.Thread(target=values.refresh, args=(k,)) for k in keys]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with open(self.cache_path) as f:
+            self.assertEqual(sorted(keys), sorted(json.load(f)))
+
+    def test_missing_values_are_fetched_in_background(self):
+        values = DynamicValues(HOOK, self.cache_path)
+        self.assertEqual(["snapshot"], values.get("--host", fallback=["snapshot"]))
+        self.wait_for_cache("--host")
+        self.assertEqual(["host-0", "host-1"], values.get("--host"))
+
+    def test_stale_values_are_served_while_refreshing(self):
+        values = DynamicValues(HOOK, self.cache_path, ttl=60)
+        os.makedirs(os.path.dirname(self.cache_path))
+        with open(self.cache_path, "w") as f:
+            json.dump({"--host": {"values": ["old"], "fetched_at": 0}}, f)
+        self.assertEqual(["old"], values.get("--host"))
+        deadline = time.monotonic() + 5
+        while values.get("--host") == ["old"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(["host-0", "host-1"], values.get("--host"))
+
+    def test_exported_model_uses_the_hook(self):
+        @command
+        @argument("host", choices=CachedCompletionDataSource(lambda: ["h1"]))
+        def ssh(host: str) -> int:
+            """
+            Sample Docstring
+            """
+            return 0
+
+        shell = TestShell(commands=[ssh])
+        shell._plugin.get_completion_values_hook = lambda: HOOK
+        model = registry_tools.build_model(
+            shell._plugin, shell._opts_parser, shell.registry
+        )
+        self.assertEqual(HOOK, model["values_hook"])
+        option = model["commands"][0]["options"][0]
+        self.assertEqual("ssh --host", option["dynamic"])
+        self.assertIsNone(option["values"])
+
+        values = DynamicValues(HOOK, self.cache_path)
+        values.refresh("ssh --host")
+        self.assertEqual(
+            ["host-0 ", "host-1 "],
+            get_completions(model, ["ssh", "--host"], None, "bash", values),
+        )
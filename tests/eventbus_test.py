@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+import contextlib
+import io
+import threading
+import time
+import unittest
+
+from nubia import command, eventbus
+from tests.util import TestShell
+
+
+@command
+def succeed() -> int:
+    """
+    Does nothing
+    """
+    return 0
+
+
+@command
+def interrupted() -> int:
+    """
+    Interrupted by the user
+    """
+    raise KeyboardInterrupt()
+
+
+class EventBusTest(unittest.TestCase):
+    def test_subscribers_filter_events(self):
+        bus = eventbus.EventBus()
+        finished, parse_errors = [], []
+        bus.subscribe(finished.append, eventbus.CommandFinished)
+        bus.subscribe(
+            parse_errors.append,
+            (eventbus.ParseError,),
+            predicate=lambda event: event.command == "a",
+        )
+        self.assertTrue(bus.wants(eventbus.ParseError))
+        self.assertFalse(bus.wants(eventbus.CompletionRequested))
+        bus.publish(eventbus.CommandFinished("a", "a", 1, True, 0, 0.1))
+        bus.publish(eventbus.ParseError("a", "a x", "bad"))
+        bus.publish(eventbus.ParseError("b", "b x", "bad"))
+        bus.publish(eventbus.CompletionRequested("a"))
+        self.assertTrue(bus.flush(1))
+        self.assertEqual([1], [event.job_id for event in finished])
+        self.assertEqual(["a x"], [event.raw for event in parse_errors])
+
+    def test_slow_subscribers_do_not_block_publishers(self):
+        bus = eventbus.EventBus(max_size=2)
+        started, release = threading.Event(), threading.Event()
+        received = []
+
+        def slow(event):
+            started.set()
+            release.wait()
+            received.append(event)
+
+        bus.subscribe(slow)
+        bus.publish(eventbus.CompletionRequested("first"))
+        self.assertTrue(started.wait(1))
+        start = time.perf_counter()
+        results = [bus.publish(eventbus.CompletionRequested(str(i))) for i in range(4)]
+        self.assertLess(time.perf_counter() - start, 0.5)
+        # the first event is being delivered, two are queued, two dropped
+        self.assertEqual([True, True, False, False], results)
+        self.assertEqual(2, bus.dropped)
+        release.set()
+        self.assertTrue(bus.flush(1))
+        self.assertEqual(3, len(received))
+
+    def test_blocking_policy(self):
+        bus = eventbus.EventBus(max_size=1, policy=eventbus.POLICY_BLOCK)
+        received = []
+
+        def slow(event):
+            time.sleep(0.01)
+            received.append(event)
+
+        bus.subscribe(slow)
+        for i in range(10):
+            self.assertTrue(bus.publish(eventbus.CompletionRequested(str(i))))
+        self.assertTrue(bus.flush(1))
+        self.assertEqual(10, len(received))
+        self.assertEqual(0, bus.dropped)
+        with self.assertRaises(ValueError):
+            eventbus.EventBus(policy="wait")
+
+    def test_failing_subscriber(self):
+        bus = eventbus.EventBus()
+        received = []
+        bus.subscribe(lambda event: 1 / 0)
+        subscription = bus.subscribe(received.append)
+        bus.publish(eventbus.CompletionRequested("x"))
+        self.assertTrue(bus.flush(1))
+        self.assertEqual(1, len(received))
+        bus.unsubscribe(subscription)
+        bus.publish(eventbus.CompletionRequested("y"))
+        self.assertTrue(bus.flush(1))
+        self.assertEqual(1, len(received))
+
+    def test_command_lifecycle_events(self):
+        shell = TestShell(commands=[succeed])
+        events = []
+        shell.registry.event_bus.subscribe(events.append)
+        with contextlib.redirect_stdout(io.StringIO()):
+            shell.run_interactive_line("succeed")
+            shell.run_interactive_line("succeed [")
+        self.assertTrue(shell.registry.event_bus.flush(1))
+        types = [type(event) for event in events]
+        # the arguments are set on the context before every command
+        self.assertEqual(eventbus.ContextChanged, types[0])
+        self.assertEqual(("args",), events[0].fields)
+        started, finished = events[1], events[2]
+        self.assertIsInstance(started, eventbus.CommandStarted)
+        self.assertIsInstance(finished, eventbus.CommandFinished)
+        self.assertEqual(started.job_id, finished.job_id)
+        self.assertEqual(("succeed", 0), (finished.command, finished.return_code))
+        self.assertGreaterEqual(finished.duration, 0)
+        self.assertIn(eventbus.ParseError, types)
+
+    def test_finished_is_published_when_commands_raise(self):
+        shell = TestShell(commands=[succeed, interrupted])
+        finished = []
+        shell.registry.event_bus.subscribe(finished.append, eventbus.CommandFinished)
+        self.assertEqual(0, shell.run_cli_line("test_shell succeed"))
+        with self.assertRaises(KeyboardInterrupt):
+            shell.run_cli_line("test_shell interrupted")
+        with self.assertRaises(KeyboardInterrupt):
+            shell.run_interactive_line("interrupted")
+        self.assertTrue(shell.registry.event_bus.flush(1))
+        self.assertEqual(
+            [
+                ("test_shell succeed", 0, False),
+                ("test_shell interrupted", 1, False),
+                ("interrupted", 1, True),
+            ],
+            [(e.raw, e.return_code, e.interactive) for e in finished],
+        )
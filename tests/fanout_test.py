@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+import asyncio
+import subprocess
+import sys
+import threading
+import time
+import unittest
+from typing import List
+
+from nubia import ResourceLimit, argument, command
+from nubia.internal.fanout import run_fanout
+from tests.util import TestShell
+
+
+class FanoutTest(unittest.TestCase):
+    def test_fanout_runs_once_per_target(self):
+        seen = []
+        lock = threading.Lock()
+
+        @command(fanout="hosts")
+        @argument("hosts", description="hosts")
+        def test_command(hosts: List[str], port: int = 22) -> int:
+            """
+            Sample Docstring
+            """
+            with lock:
+                seen.append((hosts, port))
+            return 0
+
+        shell = TestShell(commands=[test_command])
+        self.assertEqual(
+            0, shell.run_cli_line("test_shell test-command --hosts a b c --port 1")
+        )
+        self.assertEqual(
+            sorted(seen), [(["a"], 1), (["b"], 1), (["c"], 1)], "one call per target"
+        )
+        del seen[:]
+        self.assertEqual(0, shell.run_interactive_line("test-command hosts=[a, b]"))
+        self.assertEqual(sorted(seen), [(["a"], 22), (["b"], 22)])
+
+    def test_fanout_failures(self):
+        @command(fanout="hosts")
+        def test_command(hosts: List[str]) -> int:
+            """
+            Sample Docstring
+            """
+            if hosts == ["bad"]:
+                raise RuntimeError("boom")
+            return 0
+
+        shell = TestShell(commands=[test_command])
+        self.assertEqual(1, shell.run_interactive_line("test-command hosts=[a, bad]"))
+
+    def test_fanout_async_respects_atonce(self):
+        state = {"running": 0, "peak": 0}
+
+        @command(fanout="hosts")
+        async def test_command(hosts: List[str]) -> int:
+            """
+            Sample Docstring
+            """
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+            await asyncio.sleep(0.01)
+            state["running"] -= 1
+            return 0
+
+        shell = TestShell(commands=[test_command])
+        self.assertEqual(
+            0,
+            shell.run_cli_line(
+                "test_shell --atonce 2 test-command --hosts a b c d e"
+            ),
+        )
+        self.assertEqual(2, state["peak"])
+
+    def test_fanout_acquires_resources_per_target(self):
+        state = {"running": 0, "peak": 0}
+        lock = threading.Lock()
+
+        @command(fanout="hosts", resources={"db": 1})
+        def test_command(hosts: List[str]) -> int:
+            """
+            Sample Docstring
+            """
+            with lock:
+                state["running"] += 1
+                state["peak"] = max(state["peak"], state["running"])
+            time.sleep(0.01)
+            with lock:
+                state["running"] -= 1
+            return 0
+
+        @command(fanout="hosts", resources={"db": 1})
+        async def async_command(hosts: List[str]) -> int:
+            """
+            Sample Docstring
+            """
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+            await asyncio.sleep(0.01)
+            state["running"] -= 1
+            return 0
+
+        shell = TestShell(commands=[test_command, async_command])
+        shell.registry.resources.register("db", ResourceLimit(capacity=2))
+        for name in ("test-command", "async-command"):
+            state["peak"] = 0
+            self.assertEqual(
+                0,
+                shell.run_cli_line(
+                    "test_shell --atonce 4 {} --hosts a b c d e".format(name)
+                ),
+            )
+            # the quota holds 2 targets, not the command as a whole
+            self.assertEqual(2, state["peak"])
+
+    def test_fanout_deadline(self):
+        def slow(hosts):
+            if hosts == ["slow"]:
+                time.sleep(0.5)
+            return 0
+
+        result = run_fanout(
+            slow, {"hosts": ["fast", "slow"]}, "hosts", atonce=2, deadline=0.1
+        )
+        self.assertEqual(["slow"], result.timed_out)
+        self.assertEqual(1, result.succeeded)
+        self.assertEqual(1, result.failed)
+        self.assertEqual(1, result.return_code)
+
+    def test_timed_out_targets_do_not_delay_the_exit(self):
+        script = (
+            "import time\n"
+            "from nubia.internal.fanout import run_fanout\n"
+            "result = run_fanout(lambda hosts: time.sleep(30), {'hosts': ['a']},"
+            " 'hosts', atonce=1, deadline=0.1)\n"
+            "print(result.timed_out)\n"
+        )
+        start = time.monotonic()
+        output = subprocess.check_output(
+            [sys.executable, "-c", script], universal_newlines=True, timeout=20
+        )
+        self.assertEqual("['a']", output.strip())
+        self.assertLess(time.monotonic() - start, 10)
+
+    def test_fanout_requires_list_argument(self):
+        @command(fanout="host")
+        def test_command(host: str) -> int:
+            """
+            Sample Docstring
+            """
+            return 0
+
+        with self.assertRaises(ValueError):
+            TestShell(commands=[test_command])
+
+        with self.assertRaises(NameError):
+
+            @command(fanout="nope")
+            def other_command(host: str) -> int:
+                """
+                Sample Docstring
+                """
+                return 0
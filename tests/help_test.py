@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+import contextlib
+import io
+import unittest
+
+from nubia import argument, command
+from nubia.internal.cmdbase import AutoCommand
+from nubia.internal.help_index import HelpIndex
+from tests.util import TestShell
+
+
+@command
+@argument("hosts", description="The hosts to look up")
+def lookup(hosts: str) -> int:
+    """
+    Resolves hostnames to addresses
+
+    Uses the system resolver.
+    """
+    return 0
+
+
+@command
+@argument("target", description="Where to roll the release out")
+def deploy(target: str) -> int:
+    """
+    Deploys a release
+    """
+    return 0
+
+
+@command
+def deploy_status() -> int:
+    """
+    Shows the progress of the current deployment
+    """
+    return 0
+
+
+class HelpTest(unittest.TestCase):
+    def setUp(self):
+        self.shell = TestShell(commands=[lookup, deploy, deploy_status])
+        self.index = self.shell.registry.help_index
+
+    def _run(self, line):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            ret = self.shell.run_interactive_line(line)
+        return ret, out.getvalue()
+
+    def test_index_is_built_at_registration(self):
+        entry = self.index.get("lookup")
+        self.assertEqual("Resolves hostnames to addresses", entry.summary)
+        self.assertIn("system resolver", entry.help)
+        self.assertEqual((("hosts", "The hosts to look up"),), entry.arguments)
+        self.assertFalse(entry.built_in)
+        self.assertTrue(self.index.get("help").built_in)
+        self.assertEqual(
+            ["deploy", "deploy-status"],
+            [entry.name for entry in self.index.entries("dep")],
+        )
+
+    def test_search_ranking(self):
+        names = [entry.name for entry, _ in self.index.search("deploy")]
+        # the name counts more than the help message
+        self.assertEqual(["deploy", "deploy-status"], names[:2])
+        names = [entry.name for entry, _ in self.index.search("deploy progress")]
+        self.assertEqual("deploy-status", names[0])
+        # words are matched by prefix, argument descriptions are searched too
+        names = [entry.name for entry, _ in self.index.search("roll")]
+        self.assertEqual(["deploy"], names)
+        self.assertEqual([], self.index.search("nothing-matches"))
+
+    def test_overridden_command_is_reindexed(self):
+        @command("lookup")
+        def other_lookup() -> int:
+            """
+            Something else entirely
+            """
+            return 0
+
+        index = HelpIndex()
+        index.add("lookup", AutoCommand(lookup))
+        index.add("lookup", AutoCommand(other_lookup))
+        self.assertEqual(1, len(index))
+        self.assertEqual([], index.search("resolver"))
+        self.assertEqual(
+            ["lookup"], [entry.name for entry, _ in index.search("entirely")]
+        )
+
+    def test_help_command(self):
+        ret, out = self._run("help")
+        self.assertEqual(0, ret)
+        self.assertIn("Resolves hostnames to addresses", out)
+        self.assertNotIn("system resolver", out)
+        self.assertIn("Built-in Commands", out)
+        self.assertLess(out.index("lookup"), out.index("Built-in Commands"))
+
+        ret, out = self._run("help deploy*")
+        self.assertEqual(0, ret)
+        self.assertIn("deploy-status", out)
+        self.assertNotIn("lookup", out)
+
+        ret, out = self._run("help --search progress")
+        self.assertEqual(0, ret)
+        self.assertIn("deploy-status", out)
+        self.assertNotIn("Deploys a release", out)
+
+        ret, out = self._run("help lookup")
+        self.assertEqual(0, ret)
+        self.assertIn("system resolver", out)
+
+    def test_help_errors(self):
+        ret, out = self._run("help --search zzz")
+        self.assertEqual(1, ret)
+        ret, out = self._run("help dploy*")
+        self.assertEqual(1, ret)
+        self.assertIn("Did you mean deploy?", out)
+        ret, out = self._run("help lokup")
+        self.assertEqual(1, ret)
+        self.assertIn("Did you mean lookup?", out)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+
+from nubia.internal import history
+from prompt_toolkit.buffer import Buffer
+from prompt_toolkit.document import Document
+from prompt_toolkit.history import FileHistory, InMemoryHistory
+
+
+class SQLiteHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, ".test_history")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def _history(self, **kwargs):
+        h = history.create_history("sqlite", self.path, **kwargs)
+        self.addCleanup(h.close)
+        return h
+
+    def _load(self, h):
+        async def load():
+            return [string async for string in h.load()]
+
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(load())
+        finally:
+            loop.close()
+
+    def test_entries_are_unique_and_capped(self):
+        h = self._history(max_entries=3)
+        for command in ["a", "b", "a", "c", "d"]:
+            h.append_string(command)
+        # a new shell sees the most recent entries, running a command again
+        # moved it to the top
+        self.assertEqual(["d", "c", "a"], self._load(self._history()))
+
+    def test_loads_in_pages(self):
+        h = self._history()
+        for i in range(history.PAGE_SIZE * 2 + 10):
+            h.store_string("command {}".format(i))
+        other = self._history()
+        other.append_string("added before loading")
+        strings = self._load(other)
+        self.assertEqual(history.PAGE_SIZE * 2 + 11, len(strings))
+        self.assertEqual("added before loading", strings[0])
+        self.assertEqual("command 0", strings[-1])
+        self.assertEqual(strings, self._load(other))
+
+    def test_concurrent_writers(self):
+        def write(name):
+            h = self._history()
+            for i in range(50):
+                h.store_string("{} {}".format(name, i))
+
+        threads = [threading.Thread(target=write, args=(name,)) for name in "abcd"]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(200, len(self._load(self._history())))
+
+    def test_find_prefix(self):
+        h = self._history()
+        for command in ["lookup a", "connect", "lookup b", "lookupx", "look"]:
+            h.store_string(command)
+        self.assertEqual(["lookupx", "lookup b"], h.find_prefix("lookup", limit=2))
+        self.assertEqual([], h.find_prefix("x"))
+
+        buffer = Buffer(history=h)
+        suggest = history.AutoSuggestFromIndex()
+        suggestion = suggest.get_suggestion(buffer, Document("lookup "))
+        self.assertEqual("b", suggestion.text)
+        self.assertIsNone(suggest.get_suggestion(buffer, Document("zz")))
+
+    def test_imports_the_file_history(self):
+        file_history = FileHistory(self.path)
+        for command in ["first", "second", "first"]:
+            file_history.store_string(command)
+        self.assertEqual(["first", "second"], self._load(self._history()))
+
+
+class CreateHistoryTest(unittest.TestCase):
+    def test_backends(self):
+        self.assertIsInstance(history.create_history("memory", "x"), InMemoryHistory)
+        self.assertIsInstance(history.create_history("file", "x"), FileHistory)
+        with self.assertRaises(ValueError):
+            history.create_history("redis", "x")
+
+    def test_suggestions_without_index(self):
+        h = InMemoryHistory()
+        h.append_string("lookup a")
+        buffer = Buffer(history=h)
+        suggestion = history.AutoSuggestFromIndex().get_suggestion(
+            buffer, Document("look")
+        )
+        self.assertEqual("up a", suggestion.text)
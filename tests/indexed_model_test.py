@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+import json
+import os
+import tempfile
+import unittest
+
+from nubia_complete import indexed_model
+from nubia_complete.completer import get_completions, load_model, JsonModel
+
+MODEL = {
+    "commands": [
+        {
+            "name": "lookup",
+            "options": [
+                {
+                    "name": "--hosts",
+                    "extra_names": ["-h"],
+                    "expects_argument": True,
+                    "values": ["web1", "web2"],
+                }
+            ],
+            "positionals": [],
+        },
+        {
+            "name": "list",
+            "options": [],
+            "positionals": [],
+            "commands": [{"name": "users", "options": [], "positionals": []}],
+        },
+        {"name": "ping", "options": [], "positionals": []},
+    ],
+    "options": [
+        {"name": "--verbose", "extra_names": ["-v"], "expects_argument": False}
+    ],
+}
+
+
+class IndexedModelTest(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.json_path = os.path.join(self._dir.name, "model.json")
+        self.indexed_path = os.path.join(self._dir.name, "model.idx")
+        with open(self.json_path, "w") as f:
+            json.dump(MODEL, f)
+        with open(self.indexed_path, "wb") as f:
+            f.write(indexed_model.dumps(MODEL))
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def test_lookup(self):
+        model = indexed_model.IndexedModel(self.indexed_path)
+        try:
+            self.assertEqual(3, len(model))
+            self.assertEqual(MODEL["options"], model.options)
+            self.assertEqual(MODEL["commands"][0], model.find_command("lookup"))
+            self.assertIsNone(model.find_command("look"))
+            self.assertEqual(["list", "lookup"], model.command_names("l"))
+            self.assertEqual(["list", "lookup", "ping"], model.command_names())
+            self.assertEqual([], model.command_names("z"))
+        finally:
+            model.close()
+
+    def test_load_model_detects_format(self):
+        self.assertIsInstance(load_model(self.json_path), JsonModel)
+        self.assertIsInstance(
+            load_model(self.indexed_path), indexed_model.IndexedModel
+        )
+
+    def test_completions_match_json(self):
+        cases = [
+            ([], None),
+            ([], "l"),
+            (["lookup"], None),
+            (["lookup", "--hosts"], None),
+            (["lookup"], "--hosts="),
+            (["-v", "list"], None),
+            (["list", "users"], None),
+        ]
+        indexed = load_model(self.indexed_path)
+        for tokens, current in cases:
+            self.assertEqual(
+                sorted(get_completions(MODEL, tokens, current, "bash")),
+                sorted(get_completions(indexed, tokens, current, "bash")),
+                (tokens, current),
+            )
+        self.assertEqual(
+            ["web1 ", "web2 "],
+            get_completions(indexed, ["lookup", "-h"], None, "bash"),
+        )
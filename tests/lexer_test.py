@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+import unittest
+
+from nubia import command
+from nubia.internal.cmdbase import AutoCommand
+from nubia.internal.ui.lexer import NubiaLexer, NubiaPromptLexer
+from prompt_toolkit.document import Document
+from prompt_toolkit.lexers import PygmentsLexer
+from tests.util import TestShell
+
+
+@command
+def lookup(hosts: str) -> int:
+    """
+    Sample Docstring
+    """
+    return 0
+
+
+@command
+def deploy(target: str) -> int:
+    """
+    Sample Docstring
+    """
+    return 0
+
+
+def fragments(lexer, text):
+    document = Document(text)
+    get_line = lexer.lex_document(document)
+    return [get_line(i) for i in range(len(document.lines))]
+
+
+class LexerTest(unittest.TestCase):
+    def setUp(self):
+        self.shell = TestShell(commands=[lookup])
+
+    def test_same_highlighting_as_pygments_lexer(self):
+        lexer = NubiaPromptLexer()
+        reference = PygmentsLexer(NubiaLexer)
+        for text in (
+            "lookup hosts=a,b count=3 verbose=True",
+            "lookup 'quoted' \"double\" [1, 2]",
+            "unknown-cmd x=1",
+            "help",
+            "select id, name from users where id = 3 and tag = 'x'",
+        ):
+            self.assertEqual(fragments(reference, text), fragments(lexer, text))
+
+    def test_sql_keywords(self):
+        lexer = NubiaPromptLexer()
+        (line,) = fragments(lexer, "SELECT count(x) FROM t WHERE y varchar")
+        styles = {value: style for style, value in line}
+        self.assertEqual("class:pygments.keyword", styles["count"])
+        self.assertEqual("class:pygments.keyword", styles["FROM"])
+        self.assertEqual("class:pygments.name", styles["t"])
+        self.assertEqual("class:pygments.name.builtin", styles["varchar"])
+
+    def test_lines_are_cached(self):
+        lexer = NubiaPromptLexer()
+        fragments(lexer, "lookup hosts=a\nlookup hosts=b")
+        self.assertEqual(2, len(lexer._cache))
+        # editing the second line only lexes the second line again
+        fragments(lexer, "lookup hosts=a\nlookup hosts=c")
+        self.assertEqual(3, len(lexer._cache))
+        # only the first line is matched as a command
+        first, second = fragments(lexer, "lookup x\nlookup y")
+        self.assertEqual("class:pygments.name.command", first[0][0])
+        self.assertEqual("class:pygments.name.symbol", second[0][0])
+
+    def test_registry_changes_invalidate_the_cache(self):
+        lexer = NubiaPromptLexer()
+        old_hash = lexer.invalidation_hash()
+        (line,) = fragments(lexer, "deploy target=a")
+        self.assertEqual("class:pygments.name.invalidcommand", line[0][0])
+        self.shell.registry.register_command(AutoCommand(deploy))
+        self.assertNotEqual(old_hash, lexer.invalidation_hash())
+        (line,) = fragments(lexer, "deploy target=a")
+        self.assertEqual("class:pygments.name.command", line[0][0])
+
+    def test_states_are_compiled_lazily(self):
+        class TestLexer(NubiaLexer):
+            pass
+
+        lexer = NubiaPromptLexer(TestLexer)
+        fragments(lexer, "lookup hosts=a")
+        self.assertNotIn("query", TestLexer._tokens)
+        fragments(lexer, "select a from b")
+        self.assertIn("query", TestLexer._tokens)
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+import contextlib
+import io
+import threading
+import time
+import unittest
+
+from nubia.internal.io import connect
+from nubia.internal.io.eventbus import Listener, Message
+from tests.util import TestShell
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+
+    def add(self, event):
+        with self.lock:
+            self.events.append(event)
+
+
+def make_listener(name, recorder, delay=0, **attributes):
+    def on_connected(self, *args, **kwargs):
+        recorder.add(("start", name))
+        time.sleep(delay)
+        recorder.add(("end", name))
+
+    attributes["on_connected"] = on_connected
+    return type(name, (Listener,), attributes)()
+
+
+class ListenersTest(unittest.TestCase):
+    def test_dependencies_run_first(self):
+        recorder = Recorder()
+        listeners = [
+            make_listener("Cache", recorder, depends_on=("Auth",)),
+            make_listener("Auth", recorder),
+            make_listener("Metrics", recorder),
+        ]
+        ordered = connect.connect_listeners(listeners)
+        names = [listener.listener_name for listener in ordered]
+        self.assertEqual(["Auth", "Cache", "Metrics"], names)
+        self.assertEqual(
+            ["Auth", "Auth", "Cache", "Cache", "Metrics", "Metrics"],
+            [name for _, name in recorder.events],
+        )
+        for listener in listeners:
+            state = connect.connection(listener)
+            self.assertEqual(connect.CONNECTED, state.status)
+            self.assertIsNotNone(state.duration)
+
+    def test_cycles_are_rejected(self):
+        recorder = Recorder()
+        listeners = [
+            make_listener("A", recorder, depends_on=("B",)),
+            make_listener("B", recorder, depends_on=("A",)),
+        ]
+        with self.assertRaises(ValueError):
+            connect.connect_listeners(listeners)
+        self.assertEqual([], recorder.events)
+
+    def test_independent_listeners_run_concurrently(self):
+        recorder = Recorder()
+        listeners = [
+            make_listener(name, recorder, delay=0.2) for name in ("A", "B", "C")
+        ]
+        listeners.append(make_listener("D", recorder, depends_on=("A", "B")))
+        start = time.monotonic()
+        connect.connect_listeners(listeners, workers=4)
+        # sequentially, A, B and C alone would take 0.6s
+        self.assertLess(time.monotonic() - start, 0.5)
+        events = recorder.events
+        self.assertGreater(events.index(("start", "D")), events.index(("end", "A")))
+        self.assertGreater(events.index(("start", "D")), events.index(("end", "B")))
+
+    def test_slow_dependency_times_out(self):
+        recorder = Recorder()
+        release = threading.Event()
+
+        class Slow(Listener):
+            connect_timeout = 0.1
+
+            def on_connected(self, *args, **kwargs):
+                release.wait(5)
+
+        slow = Slow()
+        dependent = make_listener("Dependent", recorder, depends_on=(Slow,))
+        for workers in (1, 2):
+            recorder.events.clear()
+            start = time.monotonic()
+            connect.connect_listeners([slow, dependent], workers=workers)
+            self.assertLess(time.monotonic() - start, 2)
+            self.assertEqual(connect.TIMED_OUT, connect.connection(slow).status)
+            self.assertIn(("end", "Dependent"), recorder.events)
+        release.set()
+
+    def test_deferred_listener_connects_on_first_use(self):
+        recorder = Recorder()
+        listener = make_listener("Lazy", recorder, deferred=True)
+        connect.connect_listeners([listener])
+        self.assertEqual([], recorder.events)
+        self.assertEqual(connect.DEFERRED, connect.connection(listener).status)
+        listener.ensure_connected()
+        listener.ensure_connected()
+        self.assertEqual([("start", "Lazy"), ("end", "Lazy")], recorder.events)
+        self.assertEqual(connect.CONNECTED, connect.connection(listener).status)
+
+    def test_deferred_chain_connects_in_order(self):
+        recorder = Recorder()
+        listeners = [
+            make_listener("A", recorder, deferred=True, depends_on=("B",)),
+            make_listener("B", recorder, deferred=True, depends_on=("C",)),
+            make_listener("C", recorder, deferred=True),
+        ]
+        connect.connect_listeners(listeners)
+        listeners[0].ensure_connected()
+        self.assertEqual(
+            ["C", "B", "A"], [name for kind, name in recorder.events if kind == "end"]
+        )
+        for listener in listeners:
+            self.assertEqual(connect.CONNECTED, connect.connection(listener).status)
+
+    def test_failed_listener(self):
+        class Broken(Listener):
+            def on_connected(self, *args, **kwargs):
+                raise RuntimeError("unreachable")
+
+        broken = Broken()
+        with contextlib.redirect_stderr(io.StringIO()):
+            connect.connect_listeners([broken])
+        self.assertEqual(connect.FAILED, connect.connection(broken).status)
+
+    def test_deferred_dependencies_connect_first(self):
+        recorder = Recorder()
+        lazy = make_listener("Lazy", recorder, deferred=True)
+        service = make_listener("Service", recorder, depends_on=("Lazy",))
+        with self.assertNoLogs(connect.logger, "WARNING"):
+            ordered = connect.connect_listeners([service, lazy])
+        self.assertEqual(
+            ["Lazy", "Service"], [listener.listener_name for listener in ordered]
+        )
+        self.assertEqual(connect.CONNECTED, connect.connection(lazy).status)
+        lazy.ensure_connected()
+        self.assertEqual(4, len(recorder.events))
+
+    def test_priority_listeners_connect_before_the_others(self):
+        recorder = Recorder()
+        shell = TestShell(commands=[])
+        shell.registry.set_listener_init_workers(4)
+        for name in ("A", "B", "C"):
+            shell.registry.register_listener(make_listener(name, recorder))
+        shell.registry.register_priority_listener(
+            make_listener("First", recorder, delay=0.1)
+        )
+        shell.registry.dispatch_message(Message.CONNECTED)
+        self.assertEqual([("start", "First"), ("end", "First")], recorder.events[:2])
+        self.assertEqual(8, len(recorder.events))
+
+    def test_perf_startup(self):
+        shell = TestShell(commands=[])
+        shell.registry.dispatch_message(Message.CONNECTED)
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            ret = shell.run_interactive_line(":perf startup")
+            shell.run_interactive_line(":perf nothing")
+        self.assertEqual(0, ret)
+        self.assertIn("Context", out.getvalue())
+        self.assertIn(connect.CONNECTED, out.getvalue())
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+import contextlib
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from nubia import Options, command
+from nubia.internal.io import logger
+from tests.util import TestShell
+
+
+@command
+def fail() -> int:
+    """
+    Logs and fails
+    """
+    log = logging.getLogger("nubia.tests.logger_test")
+    log.debug("failure details")
+    log.warning("about to fail")
+    return 3
+
+
+@command
+def succeed() -> int:
+    """
+    Logs and succeeds
+    """
+    logging.getLogger("nubia.tests.logger_test").warning("all good")
+    return 0
+
+
+class TTY(io.StringIO):
+    def isatty(self):
+        return True
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.threads = []
+
+    def emit(self, record):
+        self.threads.append(threading.current_thread().name)
+
+
+class LoggerTest(unittest.TestCase):
+    def setUp(self):
+        self._level = logging.root.level
+        self.log = logging.getLogger("nubia.tests.logger_test")
+
+    def tearDown(self):
+        logger.stop_logger()
+        logging.root.setLevel(self._level)
+
+    def test_text_to_file_is_plain(self):
+        stream = io.StringIO()
+        logger.setup_logger(logging.DEBUG, stream)
+
+        def work():
+            self.log.debug("from %s", "worker")
+
+        thread = threading.Thread(target=work, name="worker")
+        thread.start()
+        thread.join()
+        self.log.warning("careful")
+        logger.stop_logger()
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(2, len(lines))
+        self.assertNotIn("\x1b", stream.getvalue())
+        self.assertIn("[  debug] [logger_test] thread worker: from worker", lines[0])
+        self.assertIn("[warning] [logger_test] careful", lines[1])
+
+    def test_text_to_tty_is_colored(self):
+        stream = TTY()
+        with mock.patch.object(
+            logger, "colored", lambda text, color: "<{}>{}".format(color, text)
+        ):
+            logger.setup_logger(logging.INFO, stream)
+            self.log.error("broken")
+            self.log.info("fine")
+            logger.stop_logger()
+        lines = stream.getvalue().splitlines()
+        self.assertIn("<red>  error", lines[0])
+        self.assertIn("[   info]", lines[1])
+
+    def test_json_lines_carry_the_job(self):
+        stream = io.StringIO()
+        logger.setup_logger(logging.INFO, stream, log_format=logger.FORMAT_JSON)
+        with logger.log_job("deploy", 7):
+            try:
+                raise RuntimeError("boom")
+            except RuntimeError:
+                self.log.exception("failed %d times", 2)
+        self.log.info("idle")
+        logger.stop_logger()
+        failed, idle = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual("failed 2 times", failed["message"])
+        self.assertEqual("error", failed["level"])
+        self.assertEqual(("deploy", 7), (failed["command"], failed["job_id"]))
+        self.assertIn("RuntimeError: boom", failed["exception"])
+        self.assertNotIn("command", idle)
+
+    def test_records_are_written_in_the_background(self):
+        handler = RecordingHandler()
+        logger.setup_logger(logging.INFO, handlers=[handler])
+        self.log.info("hello")
+        logger.stop_logger()
+        self.assertEqual(1, len(handler.threads))
+        self.assertNotEqual(threading.current_thread().name, handler.threads[0])
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            logger.setup_logger(logging.INFO, io.StringIO(), log_format="xml")
+
+    def test_ring_buffer_keeps_the_last_records(self):
+        with tempfile.TemporaryDirectory() as log_dir:
+            old = os.path.join(log_dir, "prog.log.3")
+            open(old, "w").close()
+            os.utime(old, (time.time() - 10 * 24 * 3600,) * 2)
+            log_buffer = logger.RingBufferHandler(
+                2,
+                lambda: logger.create_file_handler(log_dir, "prog", retention_days=7),
+            )
+            logger.setup_logger(logging.INFO, handlers=[log_buffer])
+            for i in range(3):
+                self.log.info("record %d", i)
+            # nothing is written until the records are dumped
+            self.assertEqual(["prog.log.3"], os.listdir(log_dir))
+            path = log_buffer.dump()
+            self.assertEqual(os.path.join(log_dir, "prog.log"), path)
+            self.assertIsNone(log_buffer.dump())
+            logger.stop_logger()
+            log_buffer.close()
+            with open(path) as f:
+                lines = f.read().splitlines()
+            self.assertEqual(2, len(lines))
+            self.assertTrue(lines[0].endswith("record 1"))
+            self.assertFalse(os.path.exists(old))
+
+    def test_failed_commands_dump_the_buffer(self):
+        with tempfile.TemporaryDirectory() as log_dir:
+            shell = TestShell(
+                commands=[fail, succeed],
+                options=Options(log_mode=logger.LOG_MODE_BUFFER, log_dir=log_dir),
+            )
+            path = os.path.join(log_dir, "test_shell.log")
+            err = io.StringIO()
+            with contextlib.redirect_stderr(err):
+                self.assertEqual(0, shell.run(["test_shell", "succeed"]))
+                self.assertFalse(os.path.exists(path))
+                self.assertEqual(3, shell.run(["test_shell", "fail"]))
+            self.assertIn("Logs written to {}".format(path), err.getvalue())
+            with open(path) as f:
+                content = f.read()
+            self.assertIn("about to fail", content)
+            # debug records are kept without -vv
+            self.assertIn("failure details", content)
+            # the records of the previous commands are written too
+            self.assertIn("all good", content)
+
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                shell.run_interactive_line(":dump-log")
+            self.assertIn("No logs to write", out.getvalue())
+
+            # failures in the interactive shell dump the buffer too
+            err = io.StringIO()
+            with contextlib.redirect_stderr(err), contextlib.redirect_stdout(out):
+                self.assertEqual(3, shell.run_interactive_line("fail"))
+            self.assertIn("Logs written to {}".format(path), err.getvalue())
+            shell.registry.log_buffer.close()
+
+    def test_concurrent_flushes(self):
+        handler = RecordingHandler()
+        logger.setup_logger(logging.INFO, handlers=[handler])
+        errors = []
+
+        def flush():
+            try:
+                for i in range(50):
+                    self.log.info("record %d", i)
+                    logger.flush_logger()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=flush) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+        self.assertEqual(200, len(handler.threads))
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+import json
+import os
+import tempfile
+import unittest
+
+from nubia import Options, command
+from nubia.internal.metrics import LatencyHistogram, MetricsCollector
+from tests.util import TestShell
+
+
+class MetricsTest(unittest.TestCase):
+    def test_histogram_percentiles(self):
+        histogram = LatencyHistogram()
+        for ms in range(1, 1001):
+            histogram.record(ms / 1000.0)
+        self.assertEqual(1000, histogram.count)
+        # the log-linear buckets keep the relative error within ~3%
+        self.assertAlmostEqual(0.5, histogram.percentile(50), delta=0.5 * 0.04)
+        self.assertAlmostEqual(0.99, histogram.percentile(99), delta=0.99 * 0.04)
+        self.assertEqual(1.0, histogram.to_dict()["max"])
+
+    def test_disabled_collector_records_nothing(self):
+        metrics = MetricsCollector()
+        with metrics.timer("cmd", "execute"):
+            pass
+        metrics.record_result("cmd", 1, 0.1)
+        self.assertEqual({}, metrics.to_dict())
+
+    def test_command_phases_are_recorded(self):
+        @command
+        def test_command(arg: int) -> int:
+            """
+            Sample Docstring
+            """
+            return arg
+
+        shell = TestShell(commands=[test_command], options=Options(metrics=True))
+        self.assertEqual(0, shell.run_interactive_line("test-command arg=0"))
+        self.assertEqual(3, shell.run_interactive_line("test-command arg=3"))
+        self.assertEqual(0, shell.run_cli_line("test_shell test-command --arg 0"))
+
+        data = shell.registry.metrics.to_dict()["test-command"]
+        self.assertEqual(1, data["errors"])
+        self.assertEqual({"0": 2, "3": 1}, data["return_codes"])
+        for phase in ["parse", "bind", "convert", "execute", "total"]:
+            self.assertIn(phase, data["phases"])
+        self.assertEqual(3, data["phases"]["total"]["count"])
+        self.assertEqual(0, shell.run_interactive_line(":stats"))
+
+    def test_raising_commands_are_recorded(self):
+        @command
+        def interrupted() -> int:
+            """
+            Interrupted by the user
+            """
+            raise KeyboardInterrupt()
+
+        shell = TestShell(commands=[interrupted], options=Options(metrics=True))
+        with self.assertRaises(KeyboardInterrupt):
+            shell.run_interactive_line("interrupted")
+        with self.assertRaises(KeyboardInterrupt):
+            shell.run_cli_line("test_shell interrupted")
+
+        data = shell.registry.metrics.to_dict()["interrupted"]
+        self.assertEqual(2, data["errors"])
+        self.assertEqual({"1": 2}, data["return_codes"])
+        self.assertEqual(2, data["phases"]["total"]["count"])
+
+    def test_dump(self):
+        metrics = MetricsCollector(enabled=True)
+        metrics.record_result("cmd", 0, 0.25)
+        with tempfile.TemporaryDirectory() as tmp:
+            json_path = os.path.join(tmp, "metrics.json")
+            metrics.dump(json_path)
+            with open(json_path) as f:
+                self.assertEqual(1, json.load(f)["cmd"]["phases"]["total"]["count"])
+            prom_path = os.path.join(tmp, "metrics.prom")
+            metrics.dump(prom_path)
+            with open(prom_path) as f:
+                self.assertIn(
+                    'nubia_command_latency_seconds_count{command="cmd",'
+                    'phase="total"} 1',
+                    f.read(),
+                )
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+import json
+import os
+import sys
+import tempfile
+import types
+import time
+import unittest
+
+from nubia import Options, command
+from nubia.internal.model_cache import (
+    REFRESH_FLAG,
+    CompletionModelCache,
+    program_command,
+)
+from nubia_complete.completer import load_model
+from tests.util import TestShell
+
+
+@command
+def first_command(value: int) -> int:
+    """
+    Sample Docstring
+    """
+    return 0
+
+
+@command
+def second_command(value: str) -> int:
+    """
+    Sample Docstring
+    """
+    return 0
+
+
+class CompletionModelCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._dir.name, "model")
+        self.shell = TestShell(commands=[first_command, second_command])
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def refresh(self, cache):
+        return cache.refresh(
+            self.shell._plugin, self.shell._opts_parser, self.shell.registry
+        )
+
+    def fingerprints(self, cache):
+        return cache.fingerprints(
+            self.shell._plugin, self.shell._opts_parser, self.shell.registry
+        )
+
+    def test_only_changed_commands_are_rebuilt(self):
+        cache = CompletionModelCache(self.path)
+        self.assertTrue(cache.is_stale(self.fingerprints(cache)))
+        self.assertEqual(["first-command", "second-command"], self.refresh(cache))
+        self.assertFalse(cache.is_stale(self.fingerprints(cache)))
+        self.assertEqual([], self.refresh(cache))
+
+        # pretend that the source of one command changed
+        with open(self.path + ".fingerprints") as f:
+            fingerprints = json.load(f)
+        fingerprints["commands"]["second-command"] = "outdated"
+        with open(self.path + ".fingerprints", "w") as f:
+            json.dump(fingerprints, f)
+        self.assertTrue(cache.is_stale(self.fingerprints(cache)))
+        self.assertEqual(["second-command"], self.refresh(cache))
+
+        model = load_model(self.path)
+        self.assertEqual(
+            ["first-command", "second-command"], sorted(model.command_names())
+        )
+        self.assertEqual(
+            "--value", model.find_command("first-command")["options"][0]["name"]
+        )
+
+    def test_format_change_rebuilds_everything(self):
+        self.refresh(CompletionModelCache(self.path))
+        cache = CompletionModelCache(self.path, "indexed")
+        self.assertTrue(cache.is_stale(self.fingerprints(cache)))
+        self.assertEqual(2, len(self.refresh(cache)))
+        self.assertEqual(
+            ["first-command", "second-command"], load_model(self.path).command_names()
+        )
+
+    def test_refresh_runs_in_a_detached_process(self):
+        cache = CompletionModelCache(self.path)
+        marker = os.path.join(self._dir.name, "refreshed")
+        argv = [sys.executable, "-c", "open({!r}, 'w').close()".format(marker)]
+        args = (self.shell._plugin, self.shell._opts_parser, self.shell.registry)
+        self.assertTrue(cache.refresh_in_background(*args, argv))
+        # the lock is held until the refresh releases it
+        self.assertFalse(cache.refresh_in_background(*args, argv))
+        deadline = time.monotonic() + 5
+        while not os.path.exists(marker) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(os.path.exists(marker))
+
+    def test_program_command(self):
+        script = types.ModuleType("__main__")
+        self.assertEqual(
+            [sys.executable, os.path.abspath(__file__)],
+            program_command([__file__], script),
+        )
+        self.assertIsNone(program_command(["-c"], script))
+        # python -m
+        package = types.ModuleType("__main__")
+        package.__spec__ = types.SimpleNamespace(name="tool.__main__")
+        self.assertEqual(
+            [sys.executable, "-m", "tool"], program_command(["tool"], package)
+        )
+
+    def test_refresh_flag(self):
+        shell = TestShell(
+            commands=[first_command], options=Options(completion_model_path=self.path)
+        )
+        cache = CompletionModelCache(self.path)
+        # taken by the process that started this one
+        self.assertTrue(cache._try_lock())
+        self.assertEqual(0, shell.run(["test_shell", REFRESH_FLAG, "connect"]))
+        self.assertEqual(["first-command"], load_model(self.path).command_names())
+        self.assertFalse(os.path.exists(self.path + ".lock"))
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+import contextlib
+import io
+import os
+import time
+import unittest
+from unittest import mock
+
+from nubia import command, context
+from nubia.internal.io.output import Output
+from tests.util import TestShell
+
+
+class CountingStream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        return super().write(text)
+
+
+@command
+def print_lines(count: int = 1000) -> int:
+    """
+    Prints many lines
+    """
+    out = context.get_context().out
+    for i in range(count):
+        out.print("line", i)
+    return 0
+
+
+class OutputTest(unittest.TestCase):
+    def setUp(self):
+        self.stream = CountingStream()
+
+    def test_writes_are_batched(self):
+        out = Output(self.stream, buffer_size=100, flush_interval=None)
+        for i in range(30):
+            out.print("line", i)
+        # 30 lines of 7 or 8 bytes, written each time 100 bytes are buffered
+        self.assertEqual(2, self.stream.writes)
+        out.flush()
+        self.assertEqual(3, self.stream.writes)
+        self.assertEqual(30, len(self.stream.getvalue().splitlines()))
+
+    def test_periodic_flush(self):
+        out = Output(self.stream, flush_interval=0.01)
+        out.print("pending")
+        self.assertEqual("", self.stream.getvalue())
+        deadline = time.monotonic() + 1
+        while not self.stream.getvalue() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual("pending\n", self.stream.getvalue())
+
+    def test_errors_are_written_right_away(self):
+        out = Output(self.stream, flush_interval=None)
+        out.print("output")
+        out.error("failed")
+        self.assertEqual(["output", "failed"], self.stream.getvalue().splitlines())
+
+    def test_colors(self):
+        out = Output(self.stream, flush_interval=None)
+        with mock.patch("nubia.internal.io.output.colored") as colored:
+            colored.side_effect = lambda text, color, *_: "<{}>{}".format(color, text)
+            with mock.patch.dict(os.environ, {"ANSI_COLORS_DISABLED": "1"}):
+                out.cprint("plain", "red", attrs=["bold"])
+            colored.assert_not_called()
+            with mock.patch.dict(os.environ, clear=True):
+                out.cprint("colored", "red")
+        out.flush()
+        self.assertEqual("plain\n<red>colored\n", self.stream.getvalue())
+
+    def test_follows_stdout(self):
+        out = Output(flush_interval=None)
+        first, second = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout(first):
+            out.print("first")
+        with contextlib.redirect_stdout(second):
+            out.print("second")
+            out.flush()
+        self.assertEqual("first\n", first.getvalue())
+        self.assertEqual("second\n", second.getvalue())
+
+    def test_command_output_is_flushed(self):
+        shell = TestShell(commands=[print_lines])
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            self.assertEqual(0, shell.run_interactive_line("print-lines"))
+        self.assertEqual(1000, len(out.getvalue().splitlines()))
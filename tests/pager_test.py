@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+import contextlib
+import io
+import unittest
+
+from nubia import pager
+from prompt_toolkit.input import create_pipe_input
+from prompt_toolkit.output import DummyOutput
+
+
+class PagerTest(unittest.TestCase):
+    def setUp(self):
+        self.pulled = 0
+
+    def _lines(self, count=1000000):
+        for i in range(count):
+            self.pulled += 1
+            yield "line {} \x1b[31mred\x1b[0m {}".format(i, "x" * 100)
+
+    def _text(self, fragments):
+        return "".join(text for _, text in fragments)
+
+    def test_only_pulls_what_is_shown(self):
+        view = pager.Pager(self._lines())
+        view.resize(40, 10)
+        self.assertEqual(0, self.pulled)
+        lines = view.visible_fragments()
+        self.assertEqual(10, len(lines))
+        self.assertEqual("line 0 red " + "x" * 29, self._text(lines[0]))
+        # the colors of the output are kept
+        self.assertIn("ansired", lines[0][7][0])
+        view.scroll_pages(2)
+        self.assertEqual("line 20 red", self._text(view.visible_fragments()[0])[:11])
+        self.assertLessEqual(self.pulled, 30)
+        self.assertIn("lines 21-30 of 30+", self._text(view.status()))
+
+    def test_scrolling_stops_at_the_end(self):
+        view = pager.Pager(self._lines(25))
+        view.resize(40, 10)
+        view.scroll(100)
+        self.assertEqual(15, view.top)
+        self.assertTrue(view.at_end())
+        view.home()
+        self.assertEqual(0, view.top)
+        view.end()
+        self.assertEqual(15, view.top)
+        view.scroll_horizontally(1000)
+        # the lines have 112 columns
+        self.assertEqual(72, view.left)
+        view.scroll_horizontally(-1000)
+        self.assertEqual(0, view.left)
+
+    def test_search(self):
+        view = pager.Pager(self._lines())
+        view.resize(40, 10)
+        view.search("line 500")
+        self.assertEqual(500, view.top)
+        self.assertLessEqual(self.pulled, 510)
+        view.search("LINE 50")
+        # queries with capitals are case sensitive
+        self.assertEqual("Pattern not found", self._text(view.status()))
+        view.search("line 50")
+        self.assertEqual(501, view.top)
+        view.next_match(reverse=True)
+        self.assertEqual(500, view.top)
+        # matches are highlighted
+        styles = [style for style, _ in view.visible_fragments()[0]]
+        self.assertIn("class:pager.match", styles[0])
+        self.assertNotIn("class:pager.match", styles[8])
+        view.search("nothing matches", backward=True)
+        self.assertEqual("Pattern not found", self._text(view.status()))
+
+    def test_key_bindings(self):
+        view = pager.Pager(self._lines())
+        with create_pipe_input() as pipe:
+            app = pager.create_application(view, input=pipe, output=DummyOutput())
+            pipe.send_text("jjj/line 300\rll q")
+            app.run(in_thread=True)
+        self.assertEqual(300 + view.height, view.top)
+        # scrolled until the end of the lines, 113 columns wide
+        self.assertEqual(113 - view.width, view.left)
+
+    def test_page_without_terminal(self):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            pager.page(self._lines(3))
+        self.assertEqual(3, len(out.getvalue().splitlines()))
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+import unittest
+
+from nubia import command
+from nubia.internal.prefix_index import PrefixCompleter, PrefixIndex
+from prompt_toolkit.completion import CompleteEvent
+from prompt_toolkit.document import Document
+from tests.util import TestShell
+
+
+def complete(completer, text):
+    return [
+        c.text for c in completer.get_completions(Document(text), CompleteEvent())
+    ]
+
+
+class PrefixIndexTest(unittest.TestCase):
+    def test_prefix_lookup_is_case_insensitive(self):
+        index = PrefixIndex([("show-hosts", None), ("Show-Users", None)])
+        index.add("delete", "help")
+        index.add("delete", "new help")
+        self.assertEqual(3, len(index))
+        self.assertEqual(["show-hosts", "Show-Users"], index.with_prefix("SHOW"))
+        self.assertEqual(
+            ["delete", "show-hosts", "Show-Users"], index.with_prefix("")
+        )
+        self.assertEqual([], index.with_prefix("x"))
+        self.assertEqual("new help", index.meta("delete"))
+        self.assertIn("delete", index)
+
+    def test_fuzzy_ranking(self):
+        index = PrefixIndex(
+            (word, None) for word in ["show-users", "set-user", "status", "sync"]
+        )
+        self.assertEqual(["status", "set-user", "show-users"], index.fuzzy("su"))
+        self.assertEqual(["set-user"], index.fuzzy("seu"))
+        self.assertEqual([], index.fuzzy("zz"))
+
+    def test_completer_falls_back_to_fuzzy(self):
+        completer = PrefixCompleter(
+            PrefixIndex([("show-hosts", "Shows hosts"), ("list", None)])
+        )
+        self.assertEqual(["show-hosts"], complete(completer, "sh"))
+        self.assertEqual(["show-hosts"], complete(completer, "hosts"))
+        self.assertEqual(["list", "show-hosts"], complete(completer, ""))
+
+    def test_registry_bulk_registration(self):
+        commands = []
+        for i in range(200):
+
+            def fn() -> int:
+                """
+                Sample Docstring
+                """
+                return 0
+
+            commands.append(command("generated-{:04d}".format(i))(fn))
+
+        shell = TestShell(commands=commands)
+        completer = shell.registry.get_completer()
+        self.assertEqual(
+            ["generated-0010", "generated-0011"],
+            complete(completer, "GENERATED-001")[:2],
+        )
+        self.assertEqual(10, len(complete(completer, "generated-001")))
+
+    def test_argument_names(self):
+        @command
+        def test_command(hostname: str, host_port: int = 0, user: str = "") -> int:
+            """
+            Sample Docstring
+            """
+            return 0
+
+        shell = TestShell(commands=[test_command])
+        cmd = shell.registry.find_command("test-command")
+        self.assertEqual(
+            ["host-port", "hostname"],
+            [arg.name for arg in cmd.arguments_with_prefix("host")],
+        )
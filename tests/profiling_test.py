@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+import asyncio
+import contextlib
+import io
+import os
+import pstats
+import tempfile
+import unittest
+
+from nubia import command
+from nubia.internal.io.eventbus import CommandFinished
+from tests.util import TestShell
+
+
+class ProfilingCommandsTest(unittest.TestCase):
+    def _run(self, shell, line):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            ret = shell.run_interactive_line(line)
+        return ret, out.getvalue()
+
+    def test_profile(self):
+        @command
+        def test_command(arg: int) -> int:
+            """
+            Sample Docstring
+            """
+            return arg
+
+        shell = TestShell(commands=[test_command])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "out.pstats")
+            ret, out = self._run(
+                shell, ":profile --top=5 --save={} test-command arg=7".format(path)
+            )
+            self.assertEqual(7, ret)
+            self.assertIn("cumulative", out)
+            self.assertTrue(pstats.Stats(path).total_calls > 0)
+
+    def test_wrapped_command_is_dispatched(self):
+        @command
+        def test_command() -> int:
+            """
+            Sample Docstring
+            """
+            return 0
+
+        shell = TestShell(commands=[test_command])
+        finished = []
+        shell.registry.event_bus.subscribe(finished.append, CommandFinished)
+        ret, _ = self._run(shell, ":time test-command")
+        self.assertEqual(0, ret)
+        self.assertTrue(shell.registry.event_bus.flush(1))
+        self.assertEqual([":time", "test-command"], sorted(e.command for e in finished))
+
+    def test_time_coroutine(self):
+        @command
+        async def test_command(arg: int) -> int:
+            """
+            Sample Docstring
+            """
+            await asyncio.sleep(0.01)
+            return arg
+
+        shell = TestShell(commands=[test_command])
+        ret, out = self._run(shell, ":time test-command arg=3")
+        self.assertEqual(3, ret)
+        self.assertIn("wall time", out)
+        self.assertIn("peak traced memory", out)
+
+    def test_time_super_command(self):
+        @command
+        class SuperCommand:
+            "SuperHelp"
+
+            @command
+            def sub_command(self, arg: int):
+                "SubHelp"
+                return arg
+
+        shell = TestShell(commands=[SuperCommand])
+        ret, _ = self._run(shell, ":time super-command sub-command arg=4")
+        self.assertEqual(4, ret)
+
+    def test_invalid_usage(self):
+        @command
+        def blocked() -> int:
+            """
+            Sample Docstring
+            """
+            return 0
+
+        shell = TestShell(commands=[blocked])
+        self.assertEqual(2, self._run(shell, ":time")[0])
+        self.assertEqual(2, self._run(shell, ":time unknown-command")[0])
+        self.assertEqual(2, self._run(shell, ":profile --bad=1 help")[0])
+        ret, out = self._run(shell, ":profile --sort=nope blocked")
+        self.assertEqual(2, ret)
+        self.assertIn("Unknown sort key", out)
+        # blacklisted commands cannot be wrapped either
+        self.assertTrue(self._run(shell, ":time blocked")[0])
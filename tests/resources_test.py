@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from nubia import ResourceLimit, command
+from nubia.internal.resources import (
+    Quota,
+    ResourceManager,
+    SharedQuota,
+    SharedTokenBucket,
+    TokenBucket,
+)
+from nubia.internal.usage_logger_interface import UsageLoggerInterface
+from tests.util import TestShell
+
+
+class RecordingUsageLogger(UsageLoggerInterface):
+    def __init__(self, context):
+        self.waits = []
+
+    def record_queue_wait(self, cmd, resources, wait_time):
+        self.waits.append((cmd, resources, wait_time))
+
+
+class ResourcesTest(unittest.TestCase):
+    def test_token_bucket_limits_rate(self):
+        bucket = TokenBucket(rate=100, burst=1)
+        start = time.monotonic()
+        for _ in range(4):
+            bucket.acquire()
+        # the first token is free, the other three need ~10ms each
+        self.assertGreaterEqual(time.monotonic() - start, 0.025)
+        with self.assertRaises(ValueError):
+            bucket.acquire(2)
+
+    def test_quota_limits_concurrency(self):
+        quota = Quota(2)
+        state = {"running": 0, "peak": 0}
+        lock = threading.Lock()
+
+        def worker():
+            quota.acquire()
+            with lock:
+                state["running"] += 1
+                state["peak"] = max(state["peak"], state["running"])
+            time.sleep(0.01)
+            with lock:
+                state["running"] -= 1
+            quota.release()
+
+        threads = [threading.Thread(target=worker) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(2, state["peak"])
+
+    def test_shared_limits(self):
+        # every instance opens its own lock files, like another process would
+        with tempfile.TemporaryDirectory() as lock_dir:
+            path = os.path.join(lock_dir, "db")
+            first, second = SharedQuota(path, 2), SharedQuota(path, 2)
+            held = first.acquire(2)
+            self.assertIsNone(second._try_acquire(1))
+            first.release(held)
+            second.release(second.acquire(2))
+
+            buckets = [SharedTokenBucket(path, rate=100, burst=1) for _ in range(2)]
+            start = time.monotonic()
+            for bucket in buckets * 2:
+                bucket.acquire()
+            # one token is in the bucket, the three others need ~10ms each
+            self.assertGreaterEqual(time.monotonic() - start, 0.025)
+
+            manager = ResourceManager(lock_dir)
+            manager.register("metadata/db", ResourceLimit(capacity=1))
+            with manager.acquire({"metadata/db": 1}):
+                other = SharedQuota(os.path.join(lock_dir, "metadata_db"), 1)
+                self.assertIsNone(other._try_acquire(1))
+
+    def test_manager_ignores_unknown_resources(self):
+        manager = ResourceManager()
+        manager.register("db", ResourceLimit(capacity=1))
+        with manager.acquire({"db": 1, "unknown": 5}) as grant:
+            self.assertEqual({"db": 1, "unknown": 5}, grant.resources)
+
+    def test_command_resources_are_acquired(self):
+        @command(resources={"metadata_db": 1})
+        def test_command() -> int:
+            """
+            Sample Docstring
+            """
+            return 0
+
+        shell = TestShell(commands=[test_command])
+        shell.registry.resources.register("metadata_db", ResourceLimit(capacity=1))
+        shell._usagelogger = RecordingUsageLogger(None)
+        self.assertEqual(0, shell.run_cli_line("test_shell test-command"))
+        self.assertEqual(0, shell.run_interactive_line("test-command"))
+        self.assertEqual(
+            ["test-command", "test-command"],
+            [cmd for cmd, _, _ in shell._usagelogger.waits],
+        )
+
+    def test_subcommand_resources_are_acquired(self):
+        @command(resources={"metadata_db": 1})
+        class TableCommands:
+            """
+            Sample Docstring
+            """
+
+            @command(resources={"storage": 2})
+            def copy(self, name: str) -> int:
+                """
+                Sample Docstring
+                """
+                return 0
+
+            @command
+            def describe(self, name: str) -> int:
+                """
+                Sample Docstring
+                """
+                return 0
+
+        shell = TestShell(commands=[TableCommands])
+        shell._usagelogger = RecordingUsageLogger(None)
+        shell.run_cli_line("test_shell table-commands copy --name=a")
+        shell.run_interactive_line("table-commands copy name=a")
+        shell.run_interactive_line("table-commands describe name=a")
+        self.assertEqual(
+            [
+                {"metadata_db": 1, "storage": 2},
+                {"metadata_db": 1, "storage": 2},
+                {"metadata_db": 1},
+            ],
+            [resources for _, resources, _ in shell._usagelogger.waits],
+        )
+
+    def test_invalid_resources(self):
+        with self.assertRaises(ValueError):
+
+            @command(resources={"db": 0})
+            def test_command() -> int:
+                """
+                Sample Docstring
+                """
+                return 0
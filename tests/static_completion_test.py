@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from nubia_complete.shell import generate_static_setup
+from tests.indexed_model_test import MODEL
+
+FUNC_NAME = "_nubia_completer_test"
+
+
+@unittest.skipUnless(shutil.which("bash"), "bash is not available")
+class StaticCompletionTest(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        model = json.loads(json.dumps(MODEL))
+        model["options"].append(
+            {
+                "name": "--config",
+                "extra_names": [],
+                "expects_argument": True,
+                "values": ["/tmp/c1"],
+                "dynamic": True,
+            }
+        )
+        model_path = os.path.join(self._dir.name, "model.json")
+        with open(model_path, "w") as f:
+            json.dump(model, f)
+        self.setup_path = os.path.join(self._dir.name, "setup.sh")
+        with open(self.setup_path, "w") as f:
+            f.write(generate_static_setup("test", FUNC_NAME, model_path))
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def complete(self, line, cwd=None):
+        script = 'source "$1"; {}_static "$2" bash; echo "rc=$?"'.format(FUNC_NAME)
+        output = subprocess.check_output(
+            ["bash", "-c", script, "bash", self.setup_path, line],
+            universal_newlines=True,
+            cwd=cwd,
+        )
+        lines = output.splitlines()
+        return lines[:-1], int(lines[-1][len("rc=") :])
+
+    def test_static_completer_is_registered(self):
+        script = 'source "$1"; complete -p test'
+        output = subprocess.check_output(
+            ["bash", "-c", script, "bash", self.setup_path], universal_newlines=True
+        )
+        self.assertIn("_bash_static_{}".format(FUNC_NAME), output)
+
+    def test_commands_and_options(self):
+        self.assertEqual(
+            (["--verbose ", "--config=", "lookup ", "list ", "ping "], 0),
+            self.complete("test "),
+        )
+        self.assertEqual(
+            (["--verbose ", "--config=", "users "], 0), self.complete("test -v list ")
+        )
+
+    def test_values(self):
+        expected = (["web1 ", "web2 "], 0)
+        self.assertEqual(expected, self.complete("test lookup --hosts="))
+        self.assertEqual(expected, self.complete("test lookup -h "))
+        # options that were given a value are not suggested again
+        self.assertEqual(
+            (["--verbose ", "--config="], 0), self.complete("test lookup -h web1 ")
+        )
+
+    def test_words_are_not_globbed(self):
+        cwd = os.path.join(self._dir.name, "cwd")
+        os.mkdir(cwd)
+        open(os.path.join(cwd, "lookup"), "w").close()
+        # looku? is not a command, even if it matches the file
+        self.assertEqual(
+            (["--verbose ", "--config=", "lookup ", "list ", "ping "], 0),
+            self.complete("test looku? ", cwd=cwd),
+        )
+
+    def test_dynamic_values_defer_to_python(self):
+        self.assertEqual(([], 2), self.complete("test --config "))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+import threading
+import time
+import unittest
+
+from nubia import statusbar
+from pygments.token import Token
+
+
+class CountingStatusBar(statusbar.StatusBar):
+    # like most plugins, does not call StatusBar.__init__
+    def __init__(self, context):
+        self.renders = 0
+
+    def get_tokens(self):
+        self.renders += 1
+        return [(Token.Toolbar, "value {}".format(self.get_value("value")))]
+
+
+class StatusBarTest(unittest.TestCase):
+    def test_tokens_are_cached_until_invalidated(self):
+        bar = CountingStatusBar(None)
+        redraws = []
+        bar.set_invalidate_callback(lambda: redraws.append(1))
+        self.assertEqual([(Token.Toolbar, "value None")], bar.render_tokens())
+        bar.render_tokens()
+        self.assertEqual(1, bar.renders)
+        bar.invalidate()
+        self.assertEqual(1, len(redraws))
+        bar.render_tokens()
+        self.assertEqual(2, bar.renders)
+        self.assertEqual([], bar.render_rprompt_tokens())
+
+    def test_providers_push_updates(self):
+        bar = CountingStatusBar(None)
+        values = iter(range(1000))
+        updated = threading.Event()
+        bar.set_invalidate_callback(updated.set)
+        bar.add_provider("value", lambda: next(values) // 2, interval=0.01)
+        # providers only run while the status bar is started
+        time.sleep(0.05)
+        self.assertIsNone(bar.get_value("value"))
+        bar.start()
+        try:
+            self.assertTrue(updated.wait(1))
+            self.assertEqual([(Token.Toolbar, "value 0")], bar.render_tokens())
+            time.sleep(0.1)
+        finally:
+            bar.stop()
+        # values that did not change do not invalidate the status bar
+        self.assertGreater(bar.get_value("value"), 0)
+        renders = bar.renders
+        bar.render_tokens()
+        self.assertLessEqual(bar.renders, renders + 1)
+
+    def test_failing_provider_keeps_last_value(self):
+        bar = CountingStatusBar(None)
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            if len(calls) > 1:
+                raise RuntimeError("unavailable")
+            return "ok"
+
+        bar.add_provider("value", fetch, interval=0.01)
+        bar.start()
+        try:
+            time.sleep(0.1)
+        finally:
+            bar.stop()
+        self.assertGreater(len(calls), 1)
+        self.assertEqual("ok", bar.get_value("value"))
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+import contextlib
+import io
+import time
+import unittest
+
+from nubia import Options, command
+from nubia.internal.interactive import ShellCompleter
+from nubia.internal.ui import latency
+from nubia.internal.ui.lexer import NubiaPromptLexer
+from prompt_toolkit.document import Document
+from tests.async_completer_test import complete
+from tests.util import TestShell
+
+
+@command
+def lookup_host(hostname: str) -> int:
+    """
+    Sample Docstring
+    """
+    return 0
+
+
+class UILatencyTest(unittest.TestCase):
+    def test_calls_over_budget_are_logged(self):
+        monitor = latency.UILatencyMonitor(budget=0.01)
+        slow = monitor.wrap(latency.HOOK_TOOLBAR, lambda: time.sleep(0.02))
+        fast = monitor.wrap(latency.HOOK_TOOLBAR, lambda: None, lambda: "cmd")
+        with self.assertLogs(latency.logger, "WARNING") as logs:
+            slow()
+        fast()
+        self.assertEqual(1, len(logs.output))
+        self.assertIn("toolbar", logs.output[0])
+
+        data = monitor.to_dict()[latency.HOOK_TOOLBAR]
+        self.assertEqual(["", "cmd"], list(data))
+        self.assertEqual(1, data[""]["over_budget"])
+        self.assertGreaterEqual(data[""]["max"], 0.02)
+        self.assertEqual(0, data["cmd"]["over_budget"])
+
+    def test_rolling_windows(self):
+        monitor = latency.UILatencyMonitor(window=0.05)
+        monitor.record(latency.HOOK_LEXER, "", 0.001)
+        time.sleep(0.06)
+        monitor.record(latency.HOOK_LEXER, "", 0.001)
+        # the previous window is still reported
+        self.assertEqual(2, monitor.to_dict()[latency.HOOK_LEXER][""]["count"])
+        time.sleep(0.06)
+        self.assertEqual(1, monitor.to_dict()[latency.HOOK_LEXER][""]["count"])
+        time.sleep(0.11)
+        self.assertEqual({}, monitor.to_dict())
+
+    def test_lexer_and_completer_are_timed(self):
+        shell = TestShell(commands=[lookup_host])
+        monitor = latency.UILatencyMonitor()
+        lexer = latency.TimedLexer(NubiaPromptLexer(), monitor, shell.registry)
+        document = Document("lookup-host hostname=a")
+        self.assertTrue(lexer.lex_document(document)(0))
+        # partially typed names share a row
+        for text in ("l", "lo", "look"):
+            self.assertTrue(lexer.lex_document(Document(text))(0))
+
+        completer = ShellCompleter(shell.registry, monitor=monitor)
+        self.assertEqual(["hostname="], complete(completer, "lookup-host ho"))
+        data = monitor.to_dict()
+        self.assertEqual(1, data[latency.HOOK_LEXER]["lookup-host"]["count"])
+        self.assertEqual(3, data[latency.HOOK_LEXER]["-"]["count"])
+        self.assertEqual(1, data[latency.HOOK_COMPLETION]["lookup-host"]["count"])
+
+    def test_perf_command(self):
+        shell = TestShell(commands=[lookup_host])
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            self.assertEqual(1, shell.run_interactive_line(":perf ui"))
+
+        shell = TestShell(
+            commands=[lookup_host], options=Options(ui_latency_metrics=True)
+        )
+        shell.registry.ui_monitor.record(latency.HOOK_RPROMPT, "", 0.002)
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            self.assertEqual(0, shell.run_interactive_line(":perf ui"))
+            self.assertEqual(1, shell.run_interactive_line(":perf"))
+            self.assertEqual(0, shell.run_interactive_line(":perf ui reset"))
+        self.assertIn("rprompt", out.getvalue())
+        self.assertEqual({}, shell.registry.ui_monitor.to_dict())
@@ -29,14 +29,16 @@ class TestPlugin(PluginInterface):
 
 
 class TestShell(Nubia):
-    def __init__(self, commands, name="test_shell"):
-        super(TestShell, self).__init__(name, plugin=TestPlugin(commands), testing=True)
+    def __init__(self, commands, name="test_shell", options=None):
+        super(TestShell, self).__init__(
+            name, plugin=TestPlugin(commands), testing=True, options=options
+        )
         self.registry = self._registry
 
     def run_cli_line(self, raw_line):
         cli_args_list = raw_line.split()
         args = self._pre_run(cli_args_list)
-        return self.run_cli(args)
+        return self.run_cli(args, cli_args_list)
 
     def run_interactive_line(self, raw_line, cli_args=None):
         cli_args = cli_args or "test_shell connect"
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from nubia import Options, command
+from nubia.internal.watchdog import SlowCommandWatchdog, StackSampler
+from tests.util import TestShell
+
+
+def slow_function():
+    time.sleep(0.1)
+
+
+class WatchdogTest(unittest.TestCase):
+    def test_sampler_sees_calling_thread(self):
+        sampler = StackSampler(interval=0.005)
+        sampler.start()
+        slow_function()
+        samples = sampler.stop()
+        self.assertTrue(any("slow_function" in stack for stack in samples))
+        self.assertFalse(any("nubia-stack-sampler" in s for s in samples))
+
+    def test_sampler_skips_nubia_threads(self):
+        def idle_loop():
+            stop.wait(5)
+
+        def worker():
+            slow_function()
+
+        stop = threading.Event()
+        sampler = StackSampler(interval=0.005)
+        sampler.start()
+        # started during the command, like the output flusher or event worker
+        idle = threading.Thread(target=idle_loop, name="nubia-events")
+        fanout = threading.Thread(target=worker, name="nubia-fanout-0")
+        idle.start()
+        fanout.start()
+        fanout.join()
+        samples = sampler.stop()
+        stop.set()
+        idle.join()
+        self.assertFalse(any("idle_loop" in stack for stack in samples))
+        self.assertTrue(any("worker" in stack for stack in samples))
+
+    def test_fast_commands_leave_nothing(self):
+        with tempfile.TemporaryDirectory() as directory:
+            watchdog = SlowCommandWatchdog(10, directory)
+            with watchdog.watch("fast", {}):
+                pass
+            self.assertEqual([], os.listdir(directory))
+
+    def test_slow_command_is_captured(self):
+        @command
+        def slow(delay: float) -> int:
+            """
+            Sample Docstring
+            """
+            slow_function()
+            return 0
+
+        with tempfile.TemporaryDirectory() as directory:
+            options = Options(
+                slow_command_threshold=0.05,
+                slow_command_profile_dir=directory,
+                slow_command_sample_interval=0.005,
+            )
+            shell = TestShell(commands=[slow], options=options)
+            self.assertEqual(0, shell.run_interactive_line("slow delay=1"))
+            self.assertEqual(0, shell.run_cli_line("test_shell slow --delay=1"))
+
+            profiles = sorted(glob.glob(os.path.join(directory, "*.collapsed")))
+            self.assertEqual(2, len(profiles))
+            with open(profiles[0]) as f:
+                lines = f.read().splitlines()
+            self.assertTrue(any("slow_function" in line for line in lines))
+            stack, count = lines[0].rsplit(" ", 1)
+            self.assertGreater(int(count), 0)
+
+            with open(profiles[0][: -len(".collapsed")] + ".json") as f:
+                metadata = json.load(f)
+            self.assertEqual("slow", metadata["command"])
+            self.assertEqual({"delay": "1.0"}, metadata["arguments"])
+            self.assertGreaterEqual(metadata["duration"], 0.05)